@@ -0,0 +1 @@
+"""Benchmarks of the command line client against local stand-ins for the archive and FINALES servers."""
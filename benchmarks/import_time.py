@@ -0,0 +1,80 @@
+"""
+Import-time budget of the command line
+
+Usage (from the root of the repository):
+    python -m benchmarks.import_time --budget 60
+
+Runs 'python -X importtime' for 'import cli' and for 'bma --help' in fresh interpreters. Exits with status 1 if the
+median time spent importing modules exceeds the budget (in milliseconds), or if a heavy module (requests,
+pydantic, yaml, httpx...) is imported before a command runs.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ['requests', 'urllib3', 'pydantic', 'yaml', 'httpx', 'orjson', 'ijson', 'sqlite3',
+                 'big_map_archive_api_client.client.api_client', 'finales_api_client.client.api_client']
+
+SNIPPETS = {
+    'import cli': 'import cli',
+    'bma --help': 'import cli; cli.cmd_root(["--help"], prog_name="bma", standalone_mode=False)'
+}
+
+
+def get_import_times(snippet):
+    """
+    Runs a snippet with 'python -X importtime' in a new interpreter
+    Returns a dictionary that maps the imported module names to their cumulative import times in microseconds, and
+    the total time of the imports done by the snippet itself (i.e., of the top-level imports)
+    """
+    root_dir_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', snippet],
+                               cwd=root_dir_path, capture_output=True, text=True, check=True)
+    import_times = {}
+    total = 0
+
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+        import_times[name.strip()] = int(cumulative)
+
+        # Nested imports are indented by two spaces per level; the interpreter's own imports end with 'site'
+        if name.strip() == 'site':
+            total = 0
+        elif not name.startswith('   '):
+            total += int(cumulative)
+
+    return import_times, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Checks the import time of the command line against a budget.')
+    parser.add_argument('--budget', type=float, default=60, help='Milliseconds allowed for the imports of each snippet.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of interpreters started per snippet.')
+    args = parser.parse_args(argv)
+
+    failed = False
+
+    for label, snippet in SNIPPETS.items():
+        runs = [get_import_times(snippet) for _ in range(args.repeat)]
+        milliseconds = statistics.median(total for _, total in runs) / 1000
+        heavy_modules = [name for name in HEAVY_MODULES if name in runs[0][0]]
+        print(f'{label:12} {milliseconds:8.1f} ms (budget: {args.budget} ms)')
+
+        if milliseconds > args.budget:
+            print('  Over budget')
+            failed = True
+
+        if heavy_modules:
+            print(f'  Imported before a command runs: {", ".join(heavy_modules)}')
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""
+Benchmarks of the bma commands against the in-process stand-ins of benchmarks/standins.py
+
+Usage (from the root of the repository):
+    python -m benchmarks.run --quick --output results.json
+    python -m benchmarks.run --quick --baseline benchmarks/baseline.json
+
+Each scenario runs a command end to end (configuration parsing, client creation, hashing, requests) through click, with
+fresh stand-in servers and a fresh cache folder for every run. The median duration of the runs is compared with the
+baseline, if any: a scenario that became slower by more than the threshold is flagged as a regression.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+import yaml
+from click.testing import CliRunner
+
+import cli
+from benchmarks.standins import (ArchiveStandIn, Faults, FinalesStandIn,
+                                 create_self_signed_certificate)
+
+KIB = 1024
+MIB = 1024 ** 2
+
+METADATA_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  'data', 'input', 'example', 'create_record', 'metadata.yaml')
+
+QUICK_MATRIX = {
+    'create': [(10, MIB, 1), (10, MIB, 4)],
+    'update': [(10, MIB, 1), (10, MIB, 4)],
+    'get-all': [(1000, 100)],
+    'back-up': [(1000, 10 * MIB, 1)]
+}
+
+FULL_MATRIX = {
+    'create': [(files, size, jobs)
+               for files in (1, 10, 100)
+               for size in (64 * KIB, MIB, 16 * MIB)
+               for jobs in (1, 4, 8)
+               if files * size <= 256 * MIB],
+    'update': [(files, size, jobs)
+               for files in (10, 100)
+               for size in (64 * KIB, MIB)
+               for jobs in (1, 8)],
+    'get-all': [(records, page_size) for records in (1000, 10000) for page_size in (25, 100)],
+    'back-up': [(requests, database_size, 1) for requests in (1000, 10000) for database_size in (10 * MIB, 100 * MIB)]
+}
+
+
+class Workspace:
+    """
+    Temporary working directory for one run: configuration files, metadata file, data files and caches
+    """
+
+    def __init__(self, tls_dir_path):
+        """
+        Initializes internal fields and creates the directory
+        """
+        self.tls_dir_path = tls_dir_path
+        self.dir_path = tempfile.mkdtemp(prefix='bma-benchmark-')
+        shutil.copy(METADATA_FILE_PATH, os.path.join(self.dir_path, 'metadata.yaml'))
+        self.upload_dir_path = os.path.join(self.dir_path, 'upload')
+        os.makedirs(self.upload_dir_path)
+
+    def write_bma_config(self, archive):
+        with open(os.path.join(self.dir_path, 'bma_config.yaml'), 'w') as f:
+            yaml.safe_dump({'domain_name': '127.0.0.1', 'port': archive.port, 'token': 'benchmark'}, f)
+
+    def write_finales_config(self, finales):
+        with open(os.path.join(self.dir_path, 'finales_config.yaml'), 'w') as f:
+            yaml.safe_dump({'ip_address': '127.0.0.1', 'port': finales.port, 'username': 'benchmark',
+                            'password': 'benchmark', 'database_endpoint_access_key': finales.access_key}, f)
+
+    def write_data_files(self, count, size, start=0):
+        """
+        Writes 'count' files of 'size' random bytes, from file number 'start'
+        """
+        for i in range(start, start + count):
+            with open(os.path.join(self.upload_dir_path, f'file_{i:05d}.bin'), 'wb') as f:
+                f.write(os.urandom(size))
+
+    def remove(self):
+        shutil.rmtree(self.dir_path, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def working_directory(workspace):
+    # Commands resolve their paths from the current directory and keep their caches in $XDG_CACHE_HOME
+    previous_dir_path = os.getcwd()
+    previous_cache_home = os.environ.get('XDG_CACHE_HOME')
+    os.chdir(workspace.dir_path)
+    os.environ['XDG_CACHE_HOME'] = os.path.join(workspace.dir_path, 'cache')
+
+    try:
+        yield
+    finally:
+        os.chdir(previous_dir_path)
+
+        if previous_cache_home is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = previous_cache_home
+
+
+def invoke(args):
+    """
+    Runs a bma command in the current process
+    Returns its duration in seconds; raises a RuntimeError exception if the command reported an error
+    """
+    start = time.perf_counter()
+    result = CliRunner().invoke(cli.cmd_root, args, catch_exceptions=True)
+    seconds = time.perf_counter() - start
+
+    if result.exception is not None and not isinstance(result.exception, SystemExit):
+        raise RuntimeError(f'bma {" ".join(args)} raised {result.exception!r}')
+
+    if result.exit_code not in (0, None) or 'error' in result.output.lower():
+        raise RuntimeError(f'bma {" ".join(args)} failed: {result.output.strip()}')
+
+    return seconds
+
+
+def run_create(tls, faults, files, size, jobs):
+    workspace = Workspace(tls)
+    workspace.write_data_files(files, size)
+
+    try:
+        with ArchiveStandIn(*tls_files(tls), faults()) as archive, working_directory(workspace):
+            workspace.write_bma_config(archive)
+            seconds = invoke(['record', 'create', '--config-file', 'bma_config.yaml', '--metadata-file', 'metadata.yaml',
+                              '--data-files', 'upload', '--slug', 'benchmark', '--publish', '--jobs', str(jobs)])
+
+            return seconds, files * size, archive.request_count
+    finally:
+        workspace.remove()
+
+
+def run_update(tls, faults, files, size, jobs):
+    workspace = Workspace(tls)
+    workspace.write_data_files(files, size)
+
+    try:
+        with ArchiveStandIn(*tls_files(tls), faults()) as archive, working_directory(workspace):
+            workspace.write_bma_config(archive)
+            invoke(['record', 'create', '--config-file', 'bma_config.yaml', '--metadata-file', 'metadata.yaml',
+                    '--data-files', 'upload', '--slug', 'benchmark', '--publish', '--jobs', str(jobs)])
+            record_id = next(iter(archive.published))
+            request_count = archive.request_count
+
+            # Half of the files change; the other half is linked from the previous version
+            workspace.write_data_files(files // 2, size)
+            seconds = invoke(['record', 'update', '--config-file', 'bma_config.yaml', '--record-id', record_id,
+                              '--metadata-file', 'metadata.yaml', '--data-files', 'upload',
+                              '--link-all-files-from-previous', '--publish', '--jobs', str(jobs)])
+
+            return seconds, (files // 2) * size, archive.request_count - request_count
+    finally:
+        workspace.remove()
+
+
+def run_get_all(tls, faults, records, page_size):
+    workspace = Workspace(tls)
+
+    try:
+        with ArchiveStandIn(*tls_files(tls), faults()) as archive, working_directory(workspace):
+            workspace.write_bma_config(archive)
+            archive.add_published_records(records)
+            seconds = invoke(['record', 'get-all', '--config-file', 'bma_config.yaml', '--output-file', 'records.json',
+                              '--page-size', str(page_size)])
+            size = os.path.getsize('records.json')
+
+            return seconds, size, archive.request_count
+    finally:
+        workspace.remove()
+
+
+# Back-up mode -> options of bma finales-db back-up
+BACK_UP_MODES = {
+    'finales-db-back-up': [],
+    'finales-db-back-up-stream': ['--stream-database'],
+    'finales-db-back-up-derive': ['--derive-exports']
+}
+
+
+def run_back_up(tls, faults, requests, database_size, jobs, mode='finales-db-back-up'):
+    workspace = Workspace(tls)
+
+    try:
+        with ArchiveStandIn(*tls_files(tls), faults()) as archive, \
+                FinalesStandIn(*tls_files(tls), faults(), requests, database_size) as finales, \
+                working_directory(workspace):
+            workspace.write_bma_config(archive)
+            workspace.write_finales_config(finales)
+            seconds = invoke(['finales-db', 'back-up', '--bma-config-file', 'bma_config.yaml',
+                              '--finales-config-file', 'finales_config.yaml', '--metadata-file', 'metadata.yaml',
+                              '--slug', 'benchmark', '--jobs', str(jobs)] + BACK_UP_MODES[mode])
+
+            return seconds, database_size, archive.request_count + finales.request_count
+    finally:
+        workspace.remove()
+
+
+def tls_files(tls_dir_path):
+    return os.path.join(tls_dir_path, 'cert.pem'), os.path.join(tls_dir_path, 'key.pem')
+
+
+def get_scenarios(matrix):
+    """
+    Returns (name, function, arguments) tuples for all scenarios of a matrix
+    """
+    scenarios = []
+
+    for files, size, jobs in matrix['create']:
+        scenarios.append((f'record-create/files={files}/size={size}/jobs={jobs}', run_create, (files, size, jobs)))
+
+    for files, size, jobs in matrix['update']:
+        scenarios.append((f'record-update/files={files}/size={size}/jobs={jobs}', run_update, (files, size, jobs)))
+
+    for records, page_size in matrix['get-all']:
+        scenarios.append((f'record-get-all/records={records}/page-size={page_size}', run_get_all, (records, page_size)))
+
+    for requests, database_size, jobs in matrix['back-up']:
+        for mode in BACK_UP_MODES:
+            scenarios.append((f'{mode}/requests={requests}/database-size={database_size}/jobs={jobs}',
+                              run_back_up, (requests, database_size, jobs, mode)))
+
+    return scenarios
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the median durations with a baseline
+    Returns the names of the scenarios that became slower by more than 'threshold' (e.g., 0.2 for 20%)
+    """
+    regressions = []
+
+    for name, result in results.items():
+        reference = baseline.get('results', {}).get(name)
+
+        if reference is None:
+            continue
+
+        ratio = result['seconds'] / reference['seconds']
+        result['baseline_seconds'] = reference['seconds']
+        result['ratio'] = round(ratio, 3)
+
+        if ratio > 1 + threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the bma commands against local stand-in servers.')
+    parser.add_argument('--quick', action='store_true', help='Run a small matrix of scenarios.')
+    parser.add_argument('--filter', default='', help='Only run the scenarios whose name contains this string.')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per scenario.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added by the servers to every request.')
+    parser.add_argument('--bandwidth', type=float, default=None, help='Bytes per second for each request/response body.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 429.')
+    parser.add_argument('--output', help='Path to the JSON file where the results are saved (e.g., a new baseline).')
+    parser.add_argument('--baseline', help='Path to a JSON file with results to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown flagged as a regression.')
+    args = parser.parse_args(argv)
+
+    # The archive stand-in is reached without certificate verification, as for any archive on 127.0.0.1
+    warnings.filterwarnings('ignore', message='Unverified HTTPS request')
+
+    tls_dir_path = tempfile.mkdtemp(prefix='bma-benchmark-tls-')
+    create_self_signed_certificate(tls_dir_path)
+    # The FINALES client verifies certificates
+    os.environ['REQUESTS_CA_BUNDLE'] = tls_files(tls_dir_path)[0]
+
+    def faults():
+        return Faults(args.latency, args.bandwidth, args.error_rate)
+
+    scenarios = [s for s in get_scenarios(QUICK_MATRIX if args.quick else FULL_MATRIX) if args.filter in s[0]]
+    results = {}
+
+    try:
+        for name, function, arguments in scenarios:
+            runs = [function(tls_dir_path, faults, *arguments) for _ in range(args.repeat)]
+            seconds = statistics.median(run[0] for run in runs)
+            byte_count = runs[0][1]
+            results[name] = {
+                'seconds': round(seconds, 4),
+                'min_seconds': round(min(run[0] for run in runs), 4),
+                'bytes_per_second': round(byte_count / seconds, 1),
+                'requests': runs[0][2]
+            }
+            print(f'{name:70} {seconds:8.3f} s {byte_count / seconds / MIB:9.2f} MiB/s {runs[0][2]:6} requests')
+    finally:
+        shutil.rmtree(tls_dir_path, ignore_errors=True)
+
+    regressions = []
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+        for name in regressions:
+            print(f'REGRESSION {name}: {results[name]["seconds"]} s instead of {results[name]["baseline_seconds"]} s')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'environment': {
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpu_count': os.cpu_count()
+                },
+                'faults': {'latency': args.latency, 'bandwidth': args.bandwidth, 'error_rate': args.error_rate},
+                'repeat': args.repeat,
+                'results': results
+            }, f, indent=2, sort_keys=True)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
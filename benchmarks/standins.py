@@ -0,0 +1,601 @@
+"""
+In-process stand-ins for the InvenioRDM endpoints used by ArchiveAPIClient and for the FINALES endpoints used by
+FinalesAPIClient
+
+Both servers speak HTTPS with a self-signed certificate, keep connections alive, and can inject latency, limit bandwidth
+and answer a fraction of the requests with an error status, so that the client is exercised as against a real server.
+State is held in memory; file contents are hashed on arrival and never stored.
+"""
+import base64
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import ssl
+import subprocess
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def create_self_signed_certificate(dir_path):
+    """
+    Creates a certificate and a private key for 127.0.0.1 with the openssl command
+    Returns the paths to the certificate file and to the key file
+    """
+    cert_file_path = os.path.join(dir_path, 'cert.pem')
+    key_file_path = os.path.join(dir_path, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-keyout', key_file_path, '-out', cert_file_path,
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1'],
+                   check=True, capture_output=True)
+
+    return cert_file_path, key_file_path
+
+
+class Faults:
+    """
+    Conditions injected by a stand-in server
+    """
+
+    def __init__(self, latency=0.0, bandwidth=None, error_rate=0.0, error_status=429, seed=0):
+        """
+        Initializes internal fields
+        @param latency: number of seconds added to every request
+        @param bandwidth: maximum number of bytes per second for each request and response body (None for no limit)
+        @param error_rate: fraction of the requests answered with 'error_status' (with 'Retry-After: 0')
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_fail(self):
+        """
+        Returns True if the current request should be answered with an error
+        """
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def throttle(self, byte_count):
+        """
+        Waits for the time that sending or receiving 'byte_count' bytes takes at the configured bandwidth
+        """
+        if self.bandwidth:
+            time.sleep(byte_count / self.bandwidth)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Request handler that dispatches requests to the routes of its server
+    """
+    protocol_version = 'HTTP/1.1'
+    chunk_size = 64 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        """
+        Reads the request body in chunks, at the configured bandwidth
+        Returns the body (empty for file contents, which are not kept), its md5 hash and its size
+        """
+        remaining = int(self.headers.get('Content-Length') or 0)
+        content_hash = hashlib.md5()
+        chunks = []
+        size = remaining
+        keep = self.headers.get('Content-Type') != 'application/octet-stream'
+
+        while remaining > 0:
+            chunk = self.rfile.read(min(self.chunk_size, remaining))
+
+            if not chunk:
+                break
+
+            remaining -= len(chunk)
+            content_hash.update(chunk)
+            self.server.faults.throttle(len(chunk))
+
+            if keep:
+                chunks.append(chunk)
+
+        return b''.join(chunks), content_hash.hexdigest(), size
+
+    def send_body(self, status, body, content_type='application/json', headers=None):
+        """
+        Sends a response whose body is bytes or a JSON-serializable object
+        """
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.end_headers()
+
+        for start in range(0, len(body), self.chunk_size):
+            chunk = body[start:start + self.chunk_size]
+            self.wfile.write(chunk)
+            self.server.faults.throttle(len(chunk))
+
+    def handle_request(self, method):
+        body, checksum, size = self.read_body()
+        self.server.request_count += 1
+        faults = self.server.faults
+
+        if faults.latency:
+            time.sleep(faults.latency)
+
+        if faults.should_fail():
+            self.send_body(faults.error_status, {'message': 'Injected error'}, headers={'Retry-After': '0'})
+            return
+
+        url = urlsplit(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if not self.server.is_authorized(url.path, self.headers.get('Authorization')):
+            self.send_body(401, {'detail': 'Could not validate credentials'})
+            return
+
+        for route_method, pattern, handler in self.server.routes:
+            match = pattern.fullmatch(url.path)
+
+            if route_method == method and match:
+                try:
+                    result = handler(self.server, query, body, checksum, size, *match.groups())
+                except KeyError:
+                    result = (404, {'message': 'Not found'})
+
+                self.send_body(*result)
+
+                return
+
+        self.send_body(404, {'message': f'No route for {method} {url.path}'})
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    HTTPS server that runs in a background thread of the current process
+    Subclasses define 'routes': a list of (method, path regular expression, handler) tuples
+    """
+    daemon_threads = True
+    routes = []
+
+    def __init__(self, cert_file_path, key_file_path, faults=None):
+        """
+        Initializes internal fields and listens on a free port of 127.0.0.1
+        """
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file_path, key_file_path)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.faults = faults or Faults()
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    @property
+    def base_url(self):
+        return f'https://127.0.0.1:{self.port}'
+
+    def is_authorized(self, path, authorization):
+        """
+        Returns False if a request should be rejected with 401; all requests are accepted by default
+        """
+        return True
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+
+
+def _route(method, pattern):
+    # Decorator that registers a method of a StandInServer subclass as a route
+    def decorator(handler):
+        handler.route = (method, re.compile(pattern))
+        return handler
+
+    return decorator
+
+
+def _collect_routes(cls):
+    cls.routes = [(*handler.route, handler) for handler in vars(cls).values() if hasattr(handler, 'route')]
+    return cls
+
+
+@_collect_routes
+class ArchiveStandIn(StandInServer):
+    """
+    Stand-in for the InvenioRDM endpoints used by ArchiveAPIClient: records, drafts, files (single-request and multipart
+    transfers), commits, reviews, communities, versions and file imports
+    """
+
+    def __init__(self, cert_file_path, key_file_path, faults=None):
+        """
+        Initializes internal fields
+        """
+        super().__init__(cert_file_path, key_file_path, faults)
+        self.drafts = {}  # Record id -> draft
+        self.published = {}  # Record id -> published record
+        self.parents = {}  # Parent id -> ids of the versions, oldest first
+
+    def _new_id(self):
+        value = uuid.uuid4().hex
+        return f'{value[:5]}-{value[5:10]}'
+
+    def _record_json(self, record, is_published):
+        result = {key: value for key, value in record.items() if key != 'files'}
+        result['is_published'] = is_published
+        result['files'] = {'enabled': True}
+        result['links'] = {'self': f'{self.base_url}/api/records/{record["id"]}'}
+        return result
+
+    def _file_json(self, record_id, entry):
+        result = {key: value for key, value in entry.items() if key != 'parts_received'}
+
+        if entry.get('parts'):
+            result['links'] = {'parts': [
+                {'part': part, 'url': f'{self.base_url}/api/records/{record_id}/draft/files/{entry["key"]}/content/{part}'}
+                for part in range(1, entry['parts'] + 1)]}
+
+        return result
+
+    def add_published_records(self, count, title='Benchmark record'):
+        """
+        Adds published records without files, e.g., for listing benchmarks
+        """
+        with self.lock:
+            for i in range(count):
+                record_id = self._new_id()
+                self.published[record_id] = {
+                    'id': record_id,
+                    'parent': {'id': record_id},
+                    'metadata': {'title': f'{title} {i}', 'description': 'x' * 200,
+                                 'creators': [{'person_or_org': {'name': 'Doe, John'}}] * 3},
+                    'files': {}
+                }
+                self.parents[record_id] = [record_id]
+
+    @_route('GET', r'/api/communities')
+    def get_communities(self, query, body, checksum, size):
+        return 200, {'hits': {'hits': [{'id': 'community-uuid', 'slug': 'benchmark'}], 'total': 1}}
+
+    @_route('POST', r'/api/records')
+    def post_records(self, query, body, checksum, size):
+        metadata = json.loads(body)
+        record_id = self._new_id()
+
+        with self.lock:
+            self.drafts[record_id] = {'id': record_id, 'parent': {'id': record_id},
+                                      'metadata': metadata.get('metadata', {}), 'files': {}}
+            self.parents[record_id] = [record_id]
+
+            return 201, self._record_json(self.drafts[record_id], False)
+
+    @_route('GET', r'/api/records/([^/]+)/draft')
+    def get_draft(self, query, body, checksum, size, record_id):
+        with self.lock:
+            return 200, self._record_json(self.drafts[record_id], False)
+
+    @_route('PUT', r'/api/records/([^/]+)/draft')
+    def put_draft(self, query, body, checksum, size, record_id):
+        with self.lock:
+            self.drafts[record_id]['metadata'] = json.loads(body).get('metadata', {})
+            return 200, self._record_json(self.drafts[record_id], False)
+
+    @_route('DELETE', r'/api/records/([^/]+)/draft')
+    def delete_draft(self, query, body, checksum, size, record_id):
+        with self.lock:
+            del self.drafts[record_id]
+            return 204, b''
+
+    @_route('POST', r'/api/records/([^/]+)/draft')
+    def post_draft(self, query, body, checksum, size, record_id):
+        with self.lock:
+            if record_id not in self.drafts:
+                self.drafts[record_id] = copy.deepcopy(self.published[record_id])
+
+            return 201, self._record_json(self.drafts[record_id], False)
+
+    @_route('PUT', r'/api/records/([^/]+)/draft/review')
+    def put_review(self, query, body, checksum, size, record_id):
+        with self.lock:
+            self.drafts[record_id]
+            return 200, {'receiver': json.loads(body).get('receiver'), 'type': 'community-submission'}
+
+    def _publish(self, record_id):
+        with self.lock:
+            draft = self.drafts.pop(record_id)
+            self.published[record_id] = draft
+            return 202, self._record_json(draft, True)
+
+    @_route('POST', r'/api/records/([^/]+)/draft/actions/submit-review')
+    def post_review(self, query, body, checksum, size, record_id):
+        return self._publish(record_id)
+
+    @_route('POST', r'/api/records/([^/]+)/draft/actions/publish')
+    def post_publish(self, query, body, checksum, size, record_id):
+        return self._publish(record_id)
+
+    @_route('POST', r'/api/records/([^/]+)/versions')
+    def post_versions(self, query, body, checksum, size, record_id):
+        with self.lock:
+            record = self.published[record_id]
+            new_id = self._new_id()
+            parent_id = record['parent']['id']
+            self.drafts[new_id] = {'id': new_id, 'parent': {'id': parent_id},
+                                   'metadata': copy.deepcopy(record['metadata']), 'files': {}}
+            self.parents[parent_id].append(new_id)
+            return 201, self._record_json(self.drafts[new_id], False)
+
+    @_route('POST', r'/api/records/([^/]+)/draft/actions/files-import')
+    def post_file_import(self, query, body, checksum, size, record_id):
+        with self.lock:
+            draft = self.drafts[record_id]
+            versions = [v for v in self.parents[draft['parent']['id']] if v in self.published]
+            draft['files'] = copy.deepcopy(self.published[versions[-1]]['files']) if versions else {}
+            return 201, {'entries': [self._file_json(record_id, e) for e in draft['files'].values()]}
+
+    @_route('POST', r'/api/records/([^/]+)/draft/files')
+    def post_files(self, query, body, checksum, size, record_id):
+        with self.lock:
+            draft = self.drafts[record_id]
+
+            items = json.loads(body)
+
+            # Like InvenioRDM, a link is never replaced: it has to be deleted first
+            for item in items:
+                if item['key'] in draft['files']:
+                    return 400, {'status': 400, 'message': f'File with key {item["key"]} already exists.'}
+
+            for item in items:
+                entry = {'key': item['key'], 'status': 'pending', 'checksum': None, 'size': item.get('size')}
+                transfer = item.get('transfer') or {}
+
+                if transfer.get('type') == 'M':
+                    entry['parts'] = transfer['parts']
+                    entry['parts_received'] = {}
+
+                draft['files'][item['key']] = entry
+
+            return 201, {'entries': [self._file_json(record_id, e) for e in draft['files'].values()]}
+
+    @_route('GET', r'/api/records/([^/]+)/draft/files')
+    def get_files(self, query, body, checksum, size, record_id):
+        with self.lock:
+            draft = self.drafts[record_id]
+            return 200, {'entries': [self._file_json(record_id, e) for e in draft['files'].values()]}
+
+    @_route('GET', r'/api/records/([^/]+)/draft/files/([^/]+)')
+    def get_file(self, query, body, checksum, size, record_id, key):
+        with self.lock:
+            return 200, self._file_json(record_id, self.drafts[record_id]['files'][key])
+
+    @_route('DELETE', r'/api/records/([^/]+)/draft/files/([^/]+)')
+    def delete_file(self, query, body, checksum, size, record_id, key):
+        with self.lock:
+            del self.drafts[record_id]['files'][key]
+            return 204, b''
+
+    @_route('PUT', r'/api/records/([^/]+)/draft/files/([^/]+)/content')
+    def put_content(self, query, body, checksum, size, record_id, key):
+        with self.lock:
+            entry = self.drafts[record_id]['files'][key]
+            entry.update({'checksum': f'md5:{checksum}', 'size': size})
+            return 200, self._file_json(record_id, entry)
+
+    @_route('PUT', r'/api/records/([^/]+)/draft/files/([^/]+)/content/(\d+)')
+    def put_content_part(self, query, body, checksum, size, record_id, key, part):
+        with self.lock:
+            self.drafts[record_id]['files'][key]['parts_received'][int(part)] = size
+            return 200, {}
+
+    @_route('POST', r'/api/records/([^/]+)/draft/files/([^/]+)/commit')
+    def post_commit(self, query, body, checksum, size, record_id, key):
+        with self.lock:
+            entry = self.drafts[record_id]['files'][key]
+
+            if entry.get('parts'):
+                # The checksum of a file uploaded in parts is not computed, as the parts are not stored
+                if len(entry['parts_received']) != entry['parts']:
+                    return 400, {'message': 'Missing parts'}
+
+                entry['size'] = sum(entry['parts_received'].values())
+
+            entry['status'] = 'completed'
+            return 200, self._file_json(record_id, entry)
+
+    @_route('GET', r'/api/records/([^/]+)')
+    def get_record(self, query, body, checksum, size, record_id):
+        with self.lock:
+            return 200, self._record_json(self.published[record_id], True)
+
+    def _search(self, path, query, records):
+        # Returns a page of search results with a link to the next page, like InvenioRDM
+        page_size = int(query.get('size', 10))
+        page = int(query.get('page', 1))
+        hits = records[(page - 1) * page_size:page * page_size]
+        result = {'hits': {'hits': hits, 'total': len(records)}, 'links': {}}
+
+        if page * page_size < len(records):
+            next_query = '&'.join(f'{k}={v}' for k, v in {**query, 'page': page + 1}.items())
+            result['links']['next'] = f'{self.base_url}{path}?{next_query}'
+
+        return 200, result
+
+    def _select_versions(self, query, records):
+        if query.get('allversions') in ('True', 'true', '1'):
+            return records
+
+        latest = {}
+
+        for record in records:
+            latest[record['parent']['id']] = record
+
+        return list(latest.values())
+
+    @_route('GET', r'/api/records')
+    def get_records(self, query, body, checksum, size):
+        with self.lock:
+            records = [self._record_json(r, True) for r in self.published.values()]
+
+        return self._search('/api/records', query, self._select_versions(query, records))
+
+    @_route('GET', r'/api/user/records')
+    def get_user_records(self, query, body, checksum, size):
+        with self.lock:
+            records = ([self._record_json(r, True) for r in self.published.values()] +
+                       [self._record_json(r, False) for r in self.drafts.values() if r['id'] not in self.published])
+
+        # Only the id filter is applied; the client filters the other criteria itself
+        match = re.search(r'id:"([^"]+)"', query.get('q', ''))
+
+        if match:
+            records = [r for r in records if r['id'] == match.group(1)]
+
+        return self._search('/api/user/records', query, self._select_versions(query, records))
+
+
+@_collect_routes
+class FinalesStandIn(StandInServer):
+    """
+    Stand-in for the FINALES endpoints used by FinalesAPIClient: authentication, capabilities, requests, results and
+    the database dump
+    """
+
+    def __init__(self, cert_file_path, key_file_path, faults=None, request_count=1000, database_size=10 * 1024 ** 2,
+                 access_key='benchmark', token_lifetime=900):
+        """
+        Initializes internal fields and creates a SQLite database of about 'database_size' bytes
+        Access tokens are JWT-like and expire after 'token_lifetime' seconds
+        """
+        super().__init__(cert_file_path, key_file_path, faults)
+        self.access_key = access_key
+        self.token_lifetime = token_lifetime
+        self.tokens = {}  # Token -> expiry time
+        self.authentication_count = 0
+        tenant_uuid = str(uuid.UUID(int=2 ** 64))
+        self.capabilities = [{'quantity': f'quantity_{i}', 'method': f'method_{i}', 'json_schema_specifications': {},
+                              'json_schema_result_output': {}}
+                             for i in range(20)]
+        self.requests = [{'uuid': str(uuid.UUID(int=i)), 'ctime': f'2024-01-01T00:00:{i % 60:02d}.000000',
+                          'status': 'resolved',
+                          'request': {'quantity': f'quantity_{i % 20}', 'methods': [f'method_{i % 20}'],
+                                      'parameters': {'x': i, 'y': [i] * 10}, 'tenant_uuid': tenant_uuid}}
+                         for i in range(request_count)]
+        self.results = [{'uuid': str(uuid.UUID(int=request_count + i)), 'ctime': r['ctime'], 'status': 'original',
+                         'result': {'data': {'value': i * 0.5, 'trace': [i] * 20}, 'quantity': r['request']['quantity'],
+                                    'method': r['request']['methods'][0], 'parameters': r['request']['parameters'],
+                                    'tenant_uuid': tenant_uuid, 'request_uuid': r['uuid']}}
+                        for i, r in enumerate(self.requests)]
+        self.database = self._create_database(database_size)
+
+    def _create_database(self, database_size):
+        # Tables with the FINALES2 schema (see finales_api_client/client/database_exports.py), padded with raw data
+        connection = sqlite3.connect(':memory:')
+        connection.execute('CREATE TABLE quantities (uuid TEXT PRIMARY KEY, quantity TEXT, method TEXT, '
+                           'specifications TEXT, result_output TEXT, is_active INTEGER, load_time DATETIME)')
+        connection.execute('CREATE TABLE requests (uuid TEXT PRIMARY KEY, quantity TEXT, methods TEXT, parameters TEXT, '
+                           'requesting_tenant_uuid TEXT, requesting_recieved_timestamp DATETIME, budget TEXT, '
+                           'status TEXT, load_time DATETIME)')
+        connection.execute('CREATE TABLE results (uuid TEXT PRIMARY KEY, quantity TEXT, method TEXT, parameters TEXT, '
+                           'data TEXT, posting_tenant_uuid TEXT, request_uuid TEXT, cost TEXT, status TEXT, '
+                           'posting_recieved_timestamp DATETIME, load_time DATETIME)')
+        connection.execute('CREATE TABLE raw_data (id INTEGER PRIMARY KEY, data BLOB)')
+        connection.executemany('INSERT INTO quantities VALUES (?, ?, ?, ?, ?, 1, NULL)',
+                               ((str(uuid.UUID(int=2 ** 65 + i)), c['quantity'], c['method'],
+                                 json.dumps(c['json_schema_specifications']), json.dumps(c['json_schema_result_output']))
+                                for i, c in enumerate(self.capabilities)))
+        connection.executemany('INSERT INTO requests VALUES (?, ?, ?, ?, ?, ?, NULL, ?, NULL)',
+                               ((r['uuid'], r['request']['quantity'], json.dumps(r['request']['methods']),
+                                 json.dumps(r['request']['parameters']), r['request']['tenant_uuid'],
+                                 r['ctime'].replace('T', ' '), r['status'])
+                                for r in self.requests))
+        connection.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, NULL)',
+                               ((r['uuid'], r['result']['quantity'], r['result']['method'],
+                                 json.dumps(r['result']['parameters']), json.dumps(r['result']['data']),
+                                 r['result']['tenant_uuid'], r['result']['request_uuid'], r['status'],
+                                 r['ctime'].replace('T', ' '))
+                                for r in self.results))
+        connection.commit()
+        row_size = 4096
+        padding = max(1, (database_size - len(connection.serialize())) // row_size)
+        connection.executemany('INSERT INTO raw_data (data) VALUES (?)', ((os.urandom(row_size),) for _ in range(padding)))
+        connection.commit()
+        database = connection.serialize()
+        connection.close()
+
+        return database
+
+    def is_authorized(self, path, authorization):
+        if path == '/user_management/authenticate':
+            return True
+
+        token = (authorization or '').removeprefix('Bearer ')
+
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    @_route('POST', r'/user_management/authenticate')
+    def post_authenticate(self, query, body, checksum, size):
+        expires_at = int(time.time()) + self.token_lifetime
+        claims = json.dumps({'sub': 'benchmark', 'exp': expires_at, 'jti': uuid.uuid4().hex}).encode('utf-8')
+        token = '.'.join(base64.urlsafe_b64encode(part).decode('ascii').rstrip('=')
+                         for part in (b'{"alg":"none"}', claims, b'signature'))
+
+        with self.lock:
+            self.tokens[token] = expires_at
+            self.authentication_count += 1
+
+        return 200, {'access_token': token, 'token_type': 'bearer'}
+
+    @_route('GET', r'/capabilities/')
+    def get_capabilities(self, query, body, checksum, size):
+        return 200, self.capabilities
+
+    @_route('GET', r'/all_requests/')
+    def get_all_requests(self, query, body, checksum, size):
+        return 200, self.requests
+
+    @_route('GET', r'/results_requested/')
+    def get_results_requested(self, query, body, checksum, size):
+        return 200, self.results
+
+    @_route('GET', r'/database_dump/([^/]+)')
+    def get_database_dump(self, query, body, checksum, size, access_key):
+        if access_key != self.access_key:
+            return 401, {'message': 'Invalid access key'}
+
+        return 200, self.database, 'application/octet-stream'
@@ -1,13 +1,28 @@
-import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date
+from urllib.parse import quote
 
+import requests
 
+from big_map_archive_api_client.client.multipart import (FilePartReader,
+                                                         MultipartCheckpoint,
+                                                         get_part_links,
+                                                         is_transfer_rejected)
 from big_map_archive_api_client.client.rest_api_connection import \
     RestAPIConnection
+from big_map_archive_api_client.client.sync_plan import SyncPlan
 from big_map_archive_api_client.utils import (
-    change_metadata, generate_full_metadata,
+    PIPE_BUFFER_SIZE, ChecksumEngine, HashingPipe, HashingReader, change_metadata,
+    compute_checksum, generate_full_metadata,
+    get_cache_directory, get_data_files_in_upload_dir,
     get_name_to_checksum_for_files_in_upload_dir)
+from big_map_archive_api_client.utils.json_codec import dumps, loads
+
+
+# Number of hits that the archive lets clients page through (the 'index.max_result_window' setting of its search
+# engine): pages beyond it are rejected with a 400 response
+MAX_RESULT_WINDOW = 10000
 
 
 class ArchiveAPIClientError(Exception):
@@ -15,17 +30,115 @@ class ArchiveAPIClientError(Exception):
     pass
 
 
+class MultipartNotSupportedError(ArchiveAPIClientError):
+    """Raised when the archive rejects a multipart transfer"""
+    pass
+
+
+class ChecksumMismatchError(ArchiveAPIClientError):
+    """Raised when the checksum computed by the archive for an uploaded file differs from the local one"""
+
+    def __init__(self, filename, local_checksum, remote_checksum):
+        """
+        Initialize internal variables
+        """
+        self.filename = filename
+        self.local_checksum = local_checksum
+        self.remote_checksum = remote_checksum
+        super().__init__(f'The content of {filename} was corrupted during the upload: '
+                         f'local checksum {local_checksum}, checksum on the archive {remote_checksum}')
+
+
+class SearchWindowError(ArchiveAPIClientError):
+    """Raised when a search matches more hits than the archive lets clients page through"""
+
+    def __init__(self, total):
+        """
+        Initialize internal variables
+        """
+        self.total = total
+        super().__init__(f'The search matches {total} hits, but the archive only returns the first {MAX_RESULT_WINDOW}; '
+                         f'narrow the search with a query')
+
+
+class UploadError(ArchiveAPIClientError):
+    """Raised when one or more files could not be uploaded"""
+
+    def __init__(self, errors):
+        """
+        Initialize internal variables
+        @param errors: mapping from filename to the exception raised while uploading the file
+        """
+        self.errors = errors
+        details = '; '.join(f'{filename} ({type(e).__name__}: {e})' for filename, e in errors.items())
+        super().__init__(f'{len(errors)} file(s) could not be uploaded: {details}')
+
+
+def check_search_window(page):
+    """
+    Raises a SearchWindowError exception if a page of a search result reports more hits than the archive's result
+    window, before pages beyond the window are requested
+    """
+    total = page.get('hits', {}).get('total', 0)
+
+    if total > MAX_RESULT_WINDOW:
+        raise SearchWindowError(total)
+
+
 class ArchiveAPIClient:
     """
     Class to interact with BMA's API
     """
 
-    def __init__(self, domain_name, port, token):
+    def __init__(self, domain_name, port, token, pool_connections=10, pool_maxsize=10, keep_alive=True,
+                 multipart_threshold=1024 ** 3, multipart_part_size=100 * 1024 ** 2, checksum_cache=None, http_cache=None,
+                 retry_policy=None, rate_limiter=None, checksum_engine=None):
         """
         Initialize internal variables
-        """
-        self._connection = RestAPIConnection(domain_name, port)
+        Files of at least 'multipart_threshold' bytes are uploaded in parts of 'multipart_part_size' bytes
+        The client takes ownership of 'checksum_cache' (a ChecksumCache object or None) and 'http_cache' (an HTTPCache object or None) and closes them
+        Requests that fail with a transient error are resent according to 'retry_policy' (a RetryPolicy object or None for the default policy)
+        Requests are sent within the budget of 'rate_limiter' (a RateLimiter object or None for no limit)
+        Local files are hashed by 'checksum_engine' (a ChecksumEngine object or None for a default engine), whose 'stats'
+        attribute holds the throughput of the last comparison with a draft's files
+        """
+        self._connection = RestAPIConnection(domain_name, port, pool_connections, pool_maxsize, keep_alive, http_cache,
+                                             retry_policy, rate_limiter)
         self._token = token
+        self._multipart_threshold = multipart_threshold
+        self._multipart_part_size = multipart_part_size
+        self._checksum_cache = checksum_cache
+        self._checksum_engine = checksum_engine if checksum_engine is not None else ChecksumEngine()
+        self._memo = {}  # Results of lookups on published records, kept for the lifetime of the client
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def checksum_cache(self):
+        """
+        Returns the cache used for the checksums of local files, or None
+        """
+        return self._checksum_cache
+
+    @property
+    def checksum_engine(self):
+        """
+        Returns the engine used for hashing local files
+        """
+        return self._checksum_engine
+
+    def close(self):
+        """
+        Closes the connection pool shared by all requests, the HTTP cache and the checksum cache
+        """
+        self._connection.close()
+
+        if self._checksum_cache is not None:
+            self._checksum_cache.close()
 
     def post_records(self, base_dir_path, metadata_file_path):
         """
@@ -35,10 +148,10 @@ class ArchiveAPIClient:
         """
         resource_path = '/api/records'
         metadata = generate_full_metadata(base_dir_path, metadata_file_path)
-        payload = json.dumps(metadata)
+        payload = dumps(metadata)
         response = self._connection.post(resource_path, self._token, payload)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def post_files(self, record_id, filenames):
         """
@@ -52,35 +165,102 @@ class ArchiveAPIClient:
         for filename in filenames:
             key_to_filename.append({'key': filename})
 
-        payload = json.dumps(key_to_filename)
+        payload = dumps(key_to_filename)
         response = self._connection.post(resource_path, self._token, payload)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def put_content(self, record_id, base_dir_path, upload_dir_path, filename):
         """
         Uploads a file's content
         Raises an HTTPError exception if the request fails
         """
+        response, _ = self._put_content(record_id, base_dir_path, upload_dir_path, filename)
+        return response
+
+    def _put_content(self, record_id, base_dir_path, upload_dir_path, filename):
+        """
+        Uploads a file's content while computing its md5 hash
+        Raises an HTTPError exception if the request fails
+        Returns the response's content and the file's checksum (e.g., 'md5:...')
+        """
         resource_path = f'/api/records/{record_id}/draft/files/{filename}/content'
         file_path = os.path.join(base_dir_path, upload_dir_path, filename)
 
         with open(file_path, 'rb') as f:
-            payload = f
+            stat = os.fstat(f.fileno())
+            payload = HashingReader(f)
             response = self._connection.put(resource_path, self._token, payload, 'application/octet-stream')
+            unchanged = os.fstat(f.fileno()).st_mtime_ns == stat.st_mtime_ns
+
+        response.raise_for_status()
+
+        # Spare hashing the file again during the next run
+        if self._checksum_cache is not None and unchanged:
+            self._checksum_cache.set(file_path, stat, payload.checksum)
+
+        return loads(response.content), payload.checksum
+
+    def post_multipart_file(self, record_id, filename, size, parts, part_size):
+        """
+        Inserts a link to a file into a draft and initiates a multipart transfer for the file's content
+        Raises an HTTPError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft/files'
+        payload = dumps([{
+            'key': filename,
+            'size': size,
+            'transfer': {
+                'type': 'M',
+                'parts': parts,
+                'part_size': part_size
+            }
+        }])
+        response = self._connection.post(resource_path, self._token, payload)
+        response.raise_for_status()
+        return loads(response.content)
+
+    def get_file(self, record_id, filename):
+        """
+        Gets the metadata of a draft's linked file, including the links for uploading its parts
+        Raises an HTTPError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft/files/{filename}'
+        response = self._connection.get(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    def put_content_part(self, part_url, file_path, offset, size):
+        """
+        Uploads a part of a file's content to the link returned by the archive for that part
+        Raises an HTTPError exception if the request fails
+        """
+        with FilePartReader(file_path, offset, size) as payload:
+            response = self._connection.put(part_url, self._token, payload, 'application/octet-stream')
 
         response.raise_for_status()
-        return response.json()
 
     def post_commit(self, record_id, filename):
         """
         Completes the upload of a file's content
+        The request is resent if it fails with a transient error: if the archive rejects it as the upload was already
+        completed (e.g., the first attempt succeeded but its response was lost), the file's metadata is returned
         Raises an HTTPError exception if the request fails
         """
         resource_path = f'/api/records/{record_id}/draft/files/{filename}/commit'
-        response = self._connection.post(resource_path, self._token)
+        response = self._connection.post(resource_path, self._token, idempotent=True)
+
+        if response.status_code == 400:
+            try:
+                entry = self.get_file(record_id, filename)
+            except requests.exceptions.HTTPError:
+                entry = None
+
+            if entry is not None and entry.get('status') == 'completed':
+                return entry
+
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def get_draft(self, record_id):
         """
@@ -90,7 +270,7 @@ class ArchiveAPIClient:
         resource_path = f'/api/records/{record_id}/draft'
         response = self._connection.get(resource_path, self._token)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def put_draft(self, record_id, metadata):
         """
@@ -98,10 +278,10 @@ class ArchiveAPIClient:
         Raises an HTTPError exception if the request fails
         """
         resource_path = f'/api/records/{record_id}/draft'
-        payload = json.dumps(metadata)
+        payload = dumps(metadata)
         response = self._connection.put(resource_path, self._token, payload)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def get_community_id(self, slug):
         """
@@ -113,7 +293,7 @@ class ArchiveAPIClient:
         resource_path = f'/api/communities?q=slug:{slug}'
         response = self._connection.get(resource_path, self._token)
         response.raise_for_status()
-        result = response.json()
+        result = loads(response.content)
         try:
             assert result["hits"]["total"] == 1
         except Exception:
@@ -136,10 +316,10 @@ class ArchiveAPIClient:
             "type": "community-submission"
         }
         resource_path = f'/api/records/{record_id}/draft/review'
-        payload = json.dumps(review)
+        payload = dumps(review)
         response = self._connection.put(resource_path, self._token, payload)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def post_review(self, record_id):
         """
@@ -150,9 +330,10 @@ class ArchiveAPIClient:
         @returns: json of request
         """
         resource_path = f'/api/records/{record_id}/draft/actions/submit-review'
+        self._memo.clear()  # Lookups on published records are outdated once the draft is published
         response = self._connection.post(resource_path, self._token)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def delete_draft(self, record_id):
         """
@@ -178,19 +359,26 @@ class ArchiveAPIClient:
         Note: starting from invenioRDM v12 this api call is replaced by post_review
         """
         resource_path = f'/api/records/{record_id}/draft/actions/publish'
+        self._memo.clear()  # Lookups on published records are outdated once the draft is published
         response = self._connection.post(resource_path, self._token)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def get_record(self, record_id):
         """
         Gets a published record's metadata
+        The metadata is fetched once per client; later calls return the same response
         Raises an HTTPError exception if the request fails
         """
-        resource_path = f'/api/records/{record_id}'
-        response = self._connection.get(resource_path, self._token)
-        response.raise_for_status()
-        return response.json()
+        key = ('record', record_id)
+
+        if key not in self._memo:
+            resource_path = f'/api/records/{record_id}'
+            response = self._connection.get(resource_path, self._token)
+            response.raise_for_status()
+            self._memo[key] = loads(response.content)
+
+        return self._memo[key]
 
     def get_records(self, all_versions, response_size):
         """
@@ -201,7 +389,53 @@ class ArchiveAPIClient:
         resource_path = f'/api/records?allversions={all_versions}&size={response_size}'
         response = self._connection.get(resource_path, self._token)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
+
+    def get_search_pages(self, resource_path, prefetch=True):
+        """
+        Iterates over the pages of a search result, following the 'next' links returned by the archive
+        If 'prefetch' is True, the next page is fetched in the background while the current page is consumed
+        Raises a SearchWindowError exception if the search matches more hits than the archive's result window
+        Raises an HTTPError exception if a request fails
+        """
+        def get_page(page_path):
+            response = self._connection.get(page_path, self._token)
+            response.raise_for_status()
+            page = loads(response.content)
+            check_search_window(page)
+            return page
+
+        if not prefetch:
+            while resource_path:
+                page = get_page(resource_path)
+                resource_path = page.get('links', {}).get('next')
+                yield page
+            return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(get_page, resource_path)
+
+            while future is not None:
+                page = future.result()
+                next_page_path = page.get('links', {}).get('next')
+                future = executor.submit(get_page, next_page_path) if next_page_path else None
+                yield page
+
+    def get_records_pages(self, all_versions, page_size=100, prefetch=True):
+        """
+        Iterates over the pages of published records' metadata
+        Raises an HTTPError exception if a request fails
+        """
+        resource_path = f'/api/records?allversions={all_versions}&size={page_size}&page=1'
+        return self.get_search_pages(resource_path, prefetch)
+
+    def iter_records(self, all_versions, page_size=100, prefetch=True):
+        """
+        Iterates over published records' metadata, one page in memory at a time
+        Raises an HTTPError exception if a request fails
+        """
+        for page in self.get_records_pages(all_versions, page_size, prefetch):
+            yield from page['hits']['hits']
 
     def post_draft(self, record_id):
         """
@@ -209,9 +443,9 @@ class ArchiveAPIClient:
         Raises an HTTPError exception if the request fails
         """
         resource_path = f'/api/records/{record_id}/draft'
-        response = self._connection.post(resource_path, self._token)
+        response = self._connection.post(resource_path, self._token, idempotent=True)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def post_versions(self, record_id):
         """
@@ -221,7 +455,7 @@ class ArchiveAPIClient:
         resource_path = f'/api/records/{record_id}/versions'
         response = self._connection.post(resource_path, self._token)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def get_files(self, record_id):
         """
@@ -231,7 +465,7 @@ class ArchiveAPIClient:
         resource_path = f'/api/records/{record_id}/draft/files'
         response = self._connection.get(resource_path, self._token)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def delete_filename(self, record_id, filename):
         """
@@ -251,7 +485,7 @@ class ArchiveAPIClient:
         resource_path = f'/api/records/{record_id}/draft/actions/files-import'
         response = self._connection.post(resource_path, self._token)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
     def update_metadata(self, record_id, base_dir_path, metadata_file_path):
         """
@@ -261,16 +495,189 @@ class ArchiveAPIClient:
         record_metadata = change_metadata(record_metadata, base_dir_path, metadata_file_path)
         self.put_draft(record_id, record_metadata)
 
-    def upload_files(self, record_id, base_dir_path, upload_dir_path, filenames):
+    def upload_file(self, record_id, base_dir_path, upload_dir_path, filename):
+        """
+        Uploads the content of a file whose link was already inserted into a draft and commits it
+        Raises a ChecksumMismatchError exception if the checksum computed by the archive differs from the one computed during the upload
+        """
+        _, checksum = self._put_content(record_id, base_dir_path, upload_dir_path, filename)
+        response = self.post_commit(record_id, filename)
+
+        if response.get('checksum') not in (None, checksum):
+            raise ChecksumMismatchError(filename, checksum, response['checksum'])
+
+    def upload_stream(self, record_id, filename, chunks, size, buffer_size=PIPE_BUFFER_SIZE):
+        """
+        Inserts a link to a file into a draft and uploads the file's content from a stream of chunks (e.g., a download
+        from another server), without writing it to disk
+        At most 'buffer_size' bytes are held in memory; the stream is read only as fast as the upload progresses
+        The upload is not resent if it fails, as the stream cannot be read again
+        Raises a ChecksumMismatchError exception if the checksum computed by the archive differs from the one computed during the upload
+        Returns the file's checksum (e.g., 'md5:...')
+        """
+        self.post_files(record_id, [filename])
+        resource_path = f'/api/records/{record_id}/draft/files/{filename}/content'
+
+        with HashingPipe(chunks, size, buffer_size) as payload:
+            response = self._connection.put(resource_path, self._token, payload, 'application/octet-stream')
+            response.raise_for_status()
+
+        response = self.post_commit(record_id, filename)
+
+        if response.get('checksum') not in (None, payload.checksum):
+            raise ChecksumMismatchError(filename, payload.checksum, response['checksum'])
+
+        return payload.checksum
+
+    def upload_file_multipart(self, record_id, base_dir_path, upload_dir_path, filename, jobs=1):
+        """
+        Inserts a link to a large file into a draft and uploads the file's content in parts, up to 'jobs' parts in parallel
+        Uploaded parts are recorded in a local checkpoint: uploading the same file to the same draft again only sends the missing parts
+        The file is hashed while its parts are uploaded, unless the checksum cache holds its checksum
+        Raises a ChecksumMismatchError exception if the checksum computed by the archive differs from the local one
+        Raises an HTTPError exception if a request fails
+        """
+        file_path = os.path.join(base_dir_path, upload_dir_path, filename)
+        checkpoint = MultipartCheckpoint(get_cache_directory('multipart'), record_id, file_path, self._multipart_part_size)
+
+        try:
+            # Part links are always fetched again as they may expire
+            part_links = get_part_links(self.get_file(record_id, filename), checkpoint) if checkpoint.load() else None
+        except requests.exceptions.HTTPError:
+            # The draft or the file link no longer exists
+            part_links = None
+
+        if part_links is None:
+            checkpoint.completed_parts = set()
+            part_links = self.init_multipart_file(record_id, filename, checkpoint)
+            checkpoint.save()
+
+        part_to_url = {link['part']: link['url'] for link in part_links}
+
+        def upload_part(part):
+            offset, size = checkpoint.get_part_range(part)
+            self.put_content_part(part_to_url[part], file_path, offset, size)
+            checkpoint.mark_completed(part)
+
+        # The file is hashed by its own worker, so that at most 'jobs' parts are uploaded at the same time
+        with ThreadPoolExecutor(max_workers=1) as checksum_executor, ThreadPoolExecutor(max_workers=jobs) as executor:
+            checksum_future = checksum_executor.submit(self._get_checksum, file_path)
+            # Raises the first failure once all parts were attempted, so that the checkpoint records every uploaded part
+            futures = [executor.submit(upload_part, part) for part in checkpoint.get_pending_parts()]
+
+        for future in futures:
+            future.result()
+
+        checksum = checksum_future.result()
+        response = self.post_commit(record_id, filename)
+        checkpoint.remove()
+
+        if response.get('checksum') not in (None, checksum):
+            raise ChecksumMismatchError(filename, checksum, response['checksum'])
+
+    def _get_checksum(self, file_path):
+        """
+        Returns the checksum of a local file (e.g., 'md5:...'), from the checksum cache if the file did not change since
+        it was last hashed
+        """
+        stat = os.stat(file_path)
+        checksum = self._checksum_cache.get(file_path, stat) if self._checksum_cache is not None else None
+
+        if checksum is None:
+            checksum = compute_checksum(file_path)
+
+            if self._checksum_cache is not None:
+                self._checksum_cache.set(file_path, stat, checksum)
+
+        return checksum
+
+    def init_multipart_file(self, record_id, filename, checkpoint):
+        """
+        Inserts a link to a large file into a draft, initiates a multipart transfer for the file's content and returns
+        the links for uploading its parts
+        A link to the file may already be in the draft, e.g., if the checkpoint of an earlier upload was lost: a pending
+        multipart transfer with the same parts is reused (all parts are sent again), any other link is deleted first
+        Raises a MultipartNotSupportedError exception if the archive rejects the multipart transfer type
+        Raises an HTTPError exception if another request fails
+        """
+        for attempt in range(2):
+            try:
+                self.post_multipart_file(record_id, filename, checkpoint.size, checkpoint.parts, checkpoint.part_size)
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code != 400:
+                    raise
+
+                if is_transfer_rejected(e.response):
+                    raise MultipartNotSupportedError(f'The archive rejected a multipart transfer for {filename}') from e
+
+                if attempt > 0:
+                    # The request is still rejected once the previous link was deleted
+                    raise
+
+                try:
+                    entry = self.get_file(record_id, filename)
+                except requests.exceptions.HTTPError:
+                    # There is no link to the file: the request was rejected for another reason
+                    raise e from None
+            else:
+                return self.get_file(record_id, filename)['links']['parts']
+
+            part_links = get_part_links(entry, checkpoint)
+
+            if part_links is not None:
+                return part_links
+
+            self.delete_filename(record_id, filename)
+
+    def upload_files(self, record_id, base_dir_path, upload_dir_path, filenames, jobs=1):
         """
         Uploads files located in the input folder to BIG-MAP Archive and
         insert file links into a draft
+        Files of at least the multipart threshold are uploaded one after another, each in parts that are sent in parallel
+        Smaller files are uploaded up to 'jobs' at a time, largest files first, so that a large file does not end up running alone at the end
+        Raises an UploadError exception listing every file that failed, once all other files were uploaded
         """
-        self.post_files(record_id, filenames)
+        filename_to_size = {
+            filename: os.path.getsize(os.path.join(base_dir_path, upload_dir_path, filename))
+            for filename in filenames
+        }
+        filenames = sorted(filenames, key=filename_to_size.get, reverse=True)
+        multipart_filenames = [f for f in filenames if filename_to_size[f] >= self._multipart_threshold]
+        filenames = [f for f in filenames if filename_to_size[f] < self._multipart_threshold]
 
-        for filename in filenames:
-            self.put_content(record_id, base_dir_path, upload_dir_path, filename)
-            self.post_commit(record_id, filename)
+        errors = {}
+        fallback_filenames = []
+
+        for filename in multipart_filenames:
+            try:
+                self.upload_file_multipart(record_id, base_dir_path, upload_dir_path, filename, jobs)
+            except MultipartNotSupportedError:
+                # Fall back to uploading the file in a single request
+                fallback_filenames.append(filename)
+            except Exception as e:
+                errors[filename] = e
+
+        filenames = fallback_filenames + filenames
+
+        if filenames:
+            self.post_files(record_id, filenames)
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            future_to_filename = {
+                executor.submit(self.upload_file, record_id, base_dir_path, upload_dir_path, filename): filename
+                for filename in filenames
+            }
+
+            for future in as_completed(future_to_filename):
+                e = future.exception()
+                if e is not None:
+                    errors[future_to_filename[future]] = e
+
+        if self._checksum_cache is not None:
+            self._checksum_cache.commit()
+
+        if errors:
+            raise UploadError(dict(sorted(errors.items())))
 
     def get_name_to_checksum_for_linked_files(self, record_id):
         """
@@ -302,13 +709,29 @@ class ArchiveAPIClient:
         for filename in filenames:
             self.delete_filename(record_id, filename)
 
+    def get_sync_plan(self, record_id, base_dir_path, upload_dir_path, link_all_files_from_previous=False):
+        """
+        Compares a draft's linked files with the files in the input folder
+        The draft's files are fetched once and only the local files with the same name as a linked file are hashed
+        Returns a SyncPlan object with the links to keep and delete, and the files to upload
+        """
+        linked_files = {f['name']: f['checksum'] for f in self.get_name_to_checksum_for_linked_files(record_id)}
+
+        local_files = dict.fromkeys(get_data_files_in_upload_dir(base_dir_path, upload_dir_path))
+        filenames = [name for name in local_files if name in linked_files]
+        files_in_upload_dir = get_name_to_checksum_for_files_in_upload_dir(base_dir_path, upload_dir_path,
+                                                                           self._checksum_cache, self._checksum_engine,
+                                                                           filenames)
+        local_files.update({f['name']: f['checksum'] for f in files_in_upload_dir})
+
+        return SyncPlan(linked_files, local_files, link_all_files_from_previous)
+
     def get_missing_files(self, record_id, base_dir_path, upload_dir_path):
         """
          Gets all linked files of a draft that are not in the input folder
         """
-        linked_files = self.get_name_to_checksum_for_linked_files(record_id)
-        files_in_upload_dir = get_name_to_checksum_for_files_in_upload_dir(base_dir_path, upload_dir_path)
-        filenames = [f['name'] for f in linked_files if f not in files_in_upload_dir]
+        sync_plan = self.get_sync_plan(record_id, base_dir_path, upload_dir_path)
+        filenames = sync_plan.changed + sync_plan.missing
 
         return filenames
 
@@ -316,24 +739,9 @@ class ArchiveAPIClient:
         """
         Gets all linked files of a draft for which there is a file in the input folder with the same name but a different content
         """
-        linked_files = self.get_name_to_checksum_for_linked_files(record_id)
-        files_in_upload_dir = get_name_to_checksum_for_files_in_upload_dir(base_dir_path, upload_dir_path)
-
-        filenames = []
-
-        # Iterate over the linked files
-        for file in linked_files:
-            name = file['name']
-            checksum = file['checksum']
-
-            # How many files in the upload directory with the same name but a different content are there?
-            same_name_different_content_files = [f for f in files_in_upload_dir
-                                                 if (f['name'] == name and f['checksum'] != checksum)]
-
-            if len(same_name_different_content_files) == 1:
-                filenames.append(name)
+        sync_plan = self.get_sync_plan(record_id, base_dir_path, upload_dir_path)
 
-        return filenames
+        return sync_plan.changed
 
     def get_links_to_delete(self, record_id, base_dir_path, upload_dir_path, link_all_files_from_previous):
         """
@@ -341,25 +749,17 @@ class ArchiveAPIClient:
           - the linked file is not in the input folder and 'discard' is set to 'True'
           - a file with the same name as the linked file appears in the input folder but its content is different (i.e., different md5 hashes)
         """
-        filenames = self.get_changed_content_files(record_id, base_dir_path, upload_dir_path)
-
-        if not link_all_files_from_previous:
-            filenames += self.get_missing_files(record_id, base_dir_path, upload_dir_path)
+        sync_plan = self.get_sync_plan(record_id, base_dir_path, upload_dir_path, link_all_files_from_previous)
 
-        # Remove duplicates
-        filenames = list(set(filenames))
-
-        return filenames
+        return sync_plan.delete
 
     def get_files_to_upload(self, record_id, base_dir_path, upload_dir_path):
         """
         Get all data files in the upload directory for which there is currently no link
         """
-        input_folder_files = get_name_to_checksum_for_files_in_upload_dir(base_dir_path, upload_dir_path)
-        linked_files = self.get_name_to_checksum_for_linked_files(record_id)
-        filenames = [f['name'] for f in input_folder_files if f not in linked_files]
+        sync_plan = self.get_sync_plan(record_id, base_dir_path, upload_dir_path)
 
-        return filenames
+        return sync_plan.upload
 
     def get_user_records(self, all_versions, response_size):
         """
@@ -369,49 +769,73 @@ class ArchiveAPIClient:
         resource_path = f'/api/user/records?allversions={all_versions}&size={response_size}'
         response = self._connection.get(resource_path, self._token)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
+
+    def iter_user_records(self, all_versions, page_size=100, prefetch=True, query=None):
+        """
+        Iterates over the metadata for all records (including drafts) of a user, one page in memory at a time
+        If 'query' is set (e.g., 'is_published:true'), only the records that match the search query are returned
+        Raises an HTTPError exception if a request fails
+        """
+        resource_path = f'/api/user/records?allversions={all_versions}&size={page_size}&page=1'
+
+        if query is not None:
+            resource_path += f'&q={quote(query)}'
+
+        for page in self.get_search_pages(resource_path, prefetch):
+            yield from page['hits']['hits']
 
     def get_latest_versions(self):
         """
         Gets the ids and the statuses of the latest version of all entries belonging to a user
         """
         all_versions = False
-        response_size = int(float('1e6'))
-        response = self.get_user_records(all_versions, response_size)
-        latest_versions = response['hits']['hits']
-        latest_versions = [{'id': v['id'], 'is_published': v['is_published']} for v in latest_versions]
+        latest_versions = [{'id': v['id'], 'is_published': v['is_published']} for v in self.iter_user_records(all_versions)]
         return latest_versions
 
     def get_published_user_records_with_given_title(self, title):
         """
         Gets the ids of the records owned by the user that are published and have a given title
         """
-        all_versions = True
-        response_size = int(float('1e6'))
-        response = self.get_user_records(all_versions, response_size)
-        user_records = response['hits']['hits']
-        record_ids = [r['id'] for r in user_records if (r['is_published'] and r['metadata']['title'] == title)]
+        key = ('published_records_with_title', title)
+
+        if key not in self._memo:
+            # The search returns the records whose title contains the words of 'title'; only exact matches are kept
+            escaped_title = title.replace('\\', '\\\\').replace('"', '\\"')
+            query = f'metadata.title:"{escaped_title}" AND is_published:true'
+            all_versions = True
+            self._memo[key] = [r['id'] for r in self.iter_user_records(all_versions, query=query)
+                               if (r['is_published'] and r['metadata']['title'] == title)]
 
-        return record_ids
+        return self._memo[key]
 
     def exists_and_is_published(self, record_id):
         """
         Returns True if the record id corresponds to a published record on the BIG-MAP Archive that is owned by the user, False otherwise
         """
-        # Gets the ids of the records owned by the user that are published
-        all_versions = True
-        response_size = int(float('1e6'))
-        response = self.get_user_records(all_versions, response_size)
-        user_records = response['hits']['hits']
-        record_ids = [r['id'] for r in user_records if r['is_published']]
+        key = ('exists_and_is_published', record_id)
+
+        if key not in self._memo:
+            # Looks for the record among the published records owned by the user
+            query = f'id:"{record_id}" AND is_published:true'
+            all_versions = True
+            hits = [r for r in self.iter_user_records(all_versions, page_size=10, prefetch=False, query=query)
+                    if r['id'] == record_id and r['is_published']]
+            self._memo[key] = bool(hits)
 
-        return True if record_id in record_ids else False
+            if hits:
+                self._memo[('title', record_id)] = hits[0]['metadata']['title']
+
+        return self._memo[key]
 
     def get_record_title(self, record_id):
         """
         Returns the title of a published record
         """
-        response = self.get_record(record_id)
-        title = response['metadata']['title']
+        key = ('title', record_id)
+
+        if key not in self._memo:
+            response = self.get_record(record_id)
+            self._memo[key] = response['metadata']['title']
 
-        return title
+        return self._memo[key]
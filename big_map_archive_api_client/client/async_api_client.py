@@ -0,0 +1,511 @@
+import asyncio
+import os
+from datetime import date
+from urllib.parse import quote
+
+from big_map_archive_api_client.client.api_client import (ArchiveAPIClientError,
+                                                          UploadError,
+                                                          check_search_window)
+from big_map_archive_api_client.client.async_rest_api_connection import \
+    AsyncRestAPIConnection
+from big_map_archive_api_client.client.sync_plan import SyncPlan
+from big_map_archive_api_client.utils import (
+    ChecksumEngine, change_metadata, generate_full_metadata, get_data_files_in_upload_dir,
+    get_name_to_checksum_for_files_in_upload_dir)
+from big_map_archive_api_client.utils.json_codec import dumps, loads
+
+
+class AsyncArchiveAPIClient:
+    """
+    Class to interact with BMA's API from an asyncio event loop
+    Mirrors ArchiveAPIClient; every method that sends requests is a coroutine
+    Failed requests raise an httpx.HTTPStatusError exception instead of a requests.HTTPError exception
+    """
+
+    def __init__(self, domain_name, port, token, max_connections=100, max_keepalive_connections=20, concurrency=100,
+                 checksum_engine=None):
+        """
+        Initialize internal variables
+        Local files are hashed by 'checksum_engine' (a ChecksumEngine object or None for a default engine), whose 'stats'
+        attribute holds the throughput of the last comparison with a draft's files
+        """
+        self._connection = AsyncRestAPIConnection(domain_name, port, max_connections, max_keepalive_connections, concurrency)
+        self._token = token
+        self._checksum_engine = checksum_engine if checksum_engine is not None else ChecksumEngine()
+
+    @property
+    def checksum_engine(self):
+        """
+        Returns the engine used for hashing local files
+        """
+        return self._checksum_engine
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Closes the connection pool shared by all requests
+        """
+        await self._connection.close()
+
+    async def post_records(self, base_dir_path, metadata_file_path):
+        """
+        Creates a draft on the archive from provided metadata
+        Raises an HTTPStatusError exception if the request fails
+        Returns the newly created draft's id
+        """
+        resource_path = '/api/records'
+        metadata = generate_full_metadata(base_dir_path, metadata_file_path)
+        payload = dumps(metadata)
+        response = await self._connection.post(resource_path, self._token, payload)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def post_files(self, record_id, filenames):
+        """
+        Updates a record's metadata by specifying the files that should be linked to it
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft/files'
+        key_to_filename = [{'key': filename} for filename in filenames]
+        payload = dumps(key_to_filename)
+        response = await self._connection.post(resource_path, self._token, payload)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def put_content(self, record_id, base_dir_path, upload_dir_path, filename):
+        """
+        Uploads a file's content, streaming it from disk
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft/files/{filename}/content'
+        file_path = os.path.join(base_dir_path, upload_dir_path, filename)
+        response = await self._connection.put_file(resource_path, self._token, file_path)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def post_commit(self, record_id, filename):
+        """
+        Completes the upload of a file's content
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft/files/{filename}/commit'
+        response = await self._connection.post(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def get_draft(self, record_id):
+        """
+        Gets a draft's metadata
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft'
+        response = await self._connection.get(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def put_draft(self, record_id, metadata):
+        """
+        Updates a draft's metadata
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft'
+        payload = dumps(metadata)
+        response = await self._connection.put(resource_path, self._token, payload)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def get_community_id(self, slug):
+        """
+        Get community id
+        Raises an HTTPStatusError exception if the request fails
+        @param slug: slug of the community
+        @returns: community uuid for given slug
+        """
+        resource_path = f'/api/communities?q=slug:{slug}'
+        response = await self._connection.get(resource_path, self._token)
+        response.raise_for_status()
+        result = loads(response.content)
+        try:
+            assert result["hits"]["total"] == 1
+        except Exception:
+            raise ArchiveAPIClientError(f"There is no community '{slug}' or you do not have permissions to create a record for community '{slug}'")
+
+        return result["hits"]["hits"][0]["id"]
+
+    async def put_draft_community(self, record_id, community_id):
+        """
+        Attribute draft to community - create a review in parent
+        Raises an HTTPStatusError exception if the request fails
+        @param record_id: record id
+        @param community_id: community uuid
+        @returns: json of review
+        """
+        review = {
+            "receiver": {
+                "community": community_id
+            },
+            "type": "community-submission"
+        }
+        resource_path = f'/api/records/{record_id}/draft/review'
+        payload = dumps(review)
+        response = await self._connection.put(resource_path, self._token, payload)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def post_review(self, record_id):
+        """
+        Submit review to community - create a request to include a record in the community
+        (that is equivalent to publish the record if the review policy is open)
+        Raises an HTTPStatusError exception if the request fails
+        @param record_id: record id
+        @returns: json of request
+        """
+        resource_path = f'/api/records/{record_id}/draft/actions/submit-review'
+        response = await self._connection.post(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def delete_draft(self, record_id):
+        """
+        Deletes a draft
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft'
+        response = await self._connection.delete(resource_path, self._token)
+        response.raise_for_status()
+
+    async def insert_publication_date(self, record_id):
+        """
+        Inserts a publication date into a record's metadata
+        """
+        response = await self.get_draft(record_id)
+        response['metadata']['publication_date'] = date.today().strftime('%Y-%m-%d')  # e.g., '2020-06-01'
+        await self.put_draft(record_id, response)
+
+    async def post_publish(self, record_id):
+        """
+        Publishes a draft to the archive (i.e., shares a record with all archive users)
+        Raises an HTTPStatusError exception if the request fails
+        Note: starting from invenioRDM v12 this api call is replaced by post_review
+        """
+        resource_path = f'/api/records/{record_id}/draft/actions/publish'
+        response = await self._connection.post(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def get_record(self, record_id):
+        """
+        Gets a published record's metadata
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}'
+        response = await self._connection.get(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def get_records(self, all_versions, response_size):
+        """
+        Gets published records' metadata
+        Raises an HTTPStatusError exception if the request fails
+        """
+        response_size = int(float(response_size))
+        resource_path = f'/api/records?allversions={all_versions}&size={response_size}'
+        response = await self._connection.get(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def get_search_pages(self, resource_path, prefetch=True):
+        """
+        Iterates asynchronously over the pages of a search result, following the 'next' links returned by the archive
+        If 'prefetch' is True, the next page is fetched in the background while the current page is consumed
+        Raises a SearchWindowError exception if the search matches more hits than the archive's result window
+        Raises an HTTPStatusError exception if a request fails
+        """
+        async def get_page(page_path):
+            response = await self._connection.get(page_path, self._token)
+            response.raise_for_status()
+            page = loads(response.content)
+            check_search_window(page)
+            return page
+
+        if not prefetch:
+            while resource_path:
+                page = await get_page(resource_path)
+                resource_path = page.get('links', {}).get('next')
+                yield page
+            return
+
+        task = asyncio.ensure_future(get_page(resource_path))
+
+        try:
+            while task is not None:
+                page = await task
+                next_page_path = page.get('links', {}).get('next')
+                task = asyncio.ensure_future(get_page(next_page_path)) if next_page_path else None
+                yield page
+        finally:
+            # The iteration was stopped early: the prefetched page is not needed
+            if task is not None and not task.done():
+                task.cancel()
+
+    def get_records_pages(self, all_versions, page_size=100, prefetch=True):
+        """
+        Iterates asynchronously over the pages of published records' metadata
+        Raises an HTTPStatusError exception if a request fails
+        """
+        resource_path = f'/api/records?allversions={all_versions}&size={page_size}&page=1'
+        return self.get_search_pages(resource_path, prefetch)
+
+    async def iter_records(self, all_versions, page_size=100, prefetch=True):
+        """
+        Iterates asynchronously over published records' metadata, one page in memory at a time
+        Raises an HTTPStatusError exception if a request fails
+        """
+        async for page in self.get_records_pages(all_versions, page_size, prefetch):
+            for record in page['hits']['hits']:
+                yield record
+
+    async def post_draft(self, record_id):
+        """
+        Creates a draft from a published record: same version with same record id
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft'
+        response = await self._connection.post(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def post_versions(self, record_id):
+        """
+        Creates a draft from a published record: a new version with a different record id
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/versions'
+        response = await self._connection.post(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def get_files(self, record_id):
+        """
+        Gets a draft's linked files (with their names and their md5 hashes)
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft/files'
+        response = await self._connection.get(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def delete_filename(self, record_id, filename):
+        """
+        Removes a link to a file from a draft
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft/files/{filename}'
+        response = await self._connection.delete(resource_path, self._token)
+        response.raise_for_status()
+
+    async def post_file_import(self, record_id):
+        """
+        Imports all file links from a published record into a draft (new version)
+        This avoids re-uploading files, which would cause duplication on the data store
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/records/{record_id}/draft/actions/files-import'
+        response = await self._connection.post(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def update_metadata(self, record_id, base_dir_path, metadata_file_path):
+        """
+        Updates the metadata of a draft using a file's content
+        """
+        record_metadata = await self.get_draft(record_id)
+        record_metadata = change_metadata(record_metadata, base_dir_path, metadata_file_path)
+        await self.put_draft(record_id, record_metadata)
+
+    async def upload_file(self, record_id, base_dir_path, upload_dir_path, filename):
+        """
+        Uploads the content of a file whose link was already inserted into a draft and commits it
+        """
+        await self.put_content(record_id, base_dir_path, upload_dir_path, filename)
+        await self.post_commit(record_id, filename)
+
+    async def upload_files(self, record_id, base_dir_path, upload_dir_path, filenames):
+        """
+        Uploads files located in the input folder to BIG-MAP Archive and
+        insert file links into a draft
+        All files are uploaded concurrently within the connection's concurrency limit, largest files first
+        Raises an UploadError exception listing every file that failed, once all other files were uploaded
+        """
+        await self.post_files(record_id, filenames)
+
+        filenames = sorted(filenames,
+                           key=lambda filename: os.path.getsize(os.path.join(base_dir_path, upload_dir_path, filename)),
+                           reverse=True)
+
+        results = await asyncio.gather(
+            *[self.upload_file(record_id, base_dir_path, upload_dir_path, filename) for filename in filenames],
+            return_exceptions=True)
+
+        errors = {filename: result for filename, result in zip(filenames, results) if isinstance(result, Exception)}
+
+        if errors:
+            raise UploadError(dict(sorted(errors.items())))
+
+    async def get_name_to_checksum_for_linked_files(self, record_id):
+        """
+        Gets the names and md5 hashes of a draft's linked files
+        """
+        response = await self.get_files(record_id)
+        entries = response['entries']
+
+        linked_files = [
+            {
+                'name': entry['key'],
+                'checksum': entry['checksum']
+            } for entry in entries]
+
+        return linked_files
+
+    async def get_links(self, record_id):
+        """
+        Gets the names of a draft's linked files
+        """
+        linked_files = await self.get_name_to_checksum_for_linked_files(record_id)
+        filenames = [file['name'] for file in linked_files]
+        return filenames
+
+    async def delete_links(self, record_id, filenames):
+        """
+        Deletes file links from a draft concurrently
+        """
+        await asyncio.gather(*[self.delete_filename(record_id, filename) for filename in filenames])
+
+    async def get_sync_plan(self, record_id, base_dir_path, upload_dir_path, link_all_files_from_previous=False):
+        """
+        Compares a draft's linked files with the files in the input folder
+        The draft's files are fetched once and only the local files with the same name as a linked file are hashed
+        Returns a SyncPlan object with the links to keep and delete, and the files to upload
+        """
+        linked_files = {f['name']: f['checksum'] for f in await self.get_name_to_checksum_for_linked_files(record_id)}
+
+        local_files = dict.fromkeys(await asyncio.to_thread(get_data_files_in_upload_dir, base_dir_path, upload_dir_path))
+        filenames = [name for name in local_files if name in linked_files]
+        files_in_upload_dir = await asyncio.to_thread(get_name_to_checksum_for_files_in_upload_dir,
+                                                      base_dir_path, upload_dir_path, None, self._checksum_engine,
+                                                      filenames)
+        local_files.update({f['name']: f['checksum'] for f in files_in_upload_dir})
+
+        return SyncPlan(linked_files, local_files, link_all_files_from_previous)
+
+    async def get_missing_files(self, record_id, base_dir_path, upload_dir_path):
+        """
+        Gets all linked files of a draft that are not in the input folder
+        """
+        sync_plan = await self.get_sync_plan(record_id, base_dir_path, upload_dir_path)
+        filenames = sync_plan.changed + sync_plan.missing
+
+        return filenames
+
+    async def get_changed_content_files(self, record_id, base_dir_path, upload_dir_path):
+        """
+        Gets all linked files of a draft for which there is a file in the input folder with the same name but a different content
+        """
+        sync_plan = await self.get_sync_plan(record_id, base_dir_path, upload_dir_path)
+
+        return sync_plan.changed
+
+    async def get_links_to_delete(self, record_id, base_dir_path, upload_dir_path, link_all_files_from_previous):
+        """
+        Reasons for deleting a file link in a draft:
+          - the linked file is not in the input folder and 'discard' is set to 'True'
+          - a file with the same name as the linked file appears in the input folder but its content is different (i.e., different md5 hashes)
+        """
+        sync_plan = await self.get_sync_plan(record_id, base_dir_path, upload_dir_path, link_all_files_from_previous)
+
+        return sync_plan.delete
+
+    async def get_files_to_upload(self, record_id, base_dir_path, upload_dir_path):
+        """
+        Get all data files in the upload directory for which there is currently no link
+        """
+        sync_plan = await self.get_sync_plan(record_id, base_dir_path, upload_dir_path)
+
+        return sync_plan.upload
+
+    async def get_user_records(self, all_versions, response_size, query=None):
+        """
+        Gets the metadata for all records (including drafts) of a user
+        If 'query' is set (e.g., 'is_published:true'), only the records that match the search query are returned
+        Raises an HTTPStatusError exception if the request fails
+        """
+        resource_path = f'/api/user/records?allversions={all_versions}&size={response_size}'
+
+        if query is not None:
+            resource_path += f'&q={quote(query)}'
+
+        response = await self._connection.get(resource_path, self._token)
+        response.raise_for_status()
+        return loads(response.content)
+
+    async def iter_user_records(self, all_versions, page_size=100, prefetch=True, query=None):
+        """
+        Iterates asynchronously over the metadata for all records (including drafts) of a user, one page in memory at a time
+        If 'query' is set (e.g., 'is_published:true'), only the records that match the search query are returned
+        Raises an HTTPStatusError exception if a request fails
+        """
+        resource_path = f'/api/user/records?allversions={all_versions}&size={page_size}&page=1'
+
+        if query is not None:
+            resource_path += f'&q={quote(query)}'
+
+        async for page in self.get_search_pages(resource_path, prefetch):
+            for record in page['hits']['hits']:
+                yield record
+
+    async def get_latest_versions(self):
+        """
+        Gets the ids and the statuses of the latest version of all entries belonging to a user
+        """
+        all_versions = False
+        latest_versions = [{'id': v['id'], 'is_published': v['is_published']}
+                           async for v in self.iter_user_records(all_versions)]
+        return latest_versions
+
+    async def get_published_user_records_with_given_title(self, title):
+        """
+        Gets the ids of the records owned by the user that are published and have a given title
+        """
+        # The search returns the records whose title contains the words of 'title'; only exact matches are kept
+        escaped_title = title.replace('\\', '\\\\').replace('"', '\\"')
+        query = f'metadata.title:"{escaped_title}" AND is_published:true'
+        all_versions = True
+        record_ids = [r['id'] async for r in self.iter_user_records(all_versions, query=query)
+                      if (r['is_published'] and r['metadata']['title'] == title)]
+
+        return record_ids
+
+    async def exists_and_is_published(self, record_id):
+        """
+        Returns True if the record id corresponds to a published record on the BIG-MAP Archive that is owned by the user, False otherwise
+        """
+        query = f'id:"{record_id}" AND is_published:true'
+        all_versions = True
+        record_ids = [r['id'] async for r in self.iter_user_records(all_versions, page_size=10, prefetch=False, query=query)
+                      if r['is_published']]
+
+        return record_id in record_ids
+
+    async def get_record_title(self, record_id):
+        """
+        Returns the title of a published record
+        """
+        response = await self.get_record(record_id)
+        title = response['metadata']['title']
+
+        return title
@@ -0,0 +1,154 @@
+import asyncio
+import os
+
+try:
+    import httpx
+except ImportError:  # Optional dependency, see the 'async' extra in setup.py
+    httpx = None
+
+
+class AsyncRestAPIConnection:
+    """Internal auxiliary class that handles the base connection for asyncio applications."""
+
+    def __init__(self, domain_name, port, max_connections=100, max_keepalive_connections=20, concurrency=100):
+        """
+        Initializes internal fields
+        At most 'concurrency' requests are in flight at any time, whatever the number of calling tasks
+        """
+        if httpx is None:
+            raise ImportError('AsyncRestAPIConnection requires httpx. Install it with: pip install big-map-archive-api-client[async]')
+
+        self.domain_name = domain_name
+        if domain_name=='127.0.0.1':
+            self._base_url = f'https://{domain_name}:{port}'
+        else:
+            self._base_url = f'https://{domain_name}'
+
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        verify = self.domain_name != '127.0.0.1'
+        self._client = httpx.AsyncClient(limits=limits, verify=verify, timeout=None)
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+        Closes the underlying connection pool
+        """
+        await self._client.aclose()
+
+    def _url(self, resource_path):
+        """
+        Returns the URL for a resource path
+        Absolute URLs (e.g., links returned by the API) are used as they are
+        """
+        if resource_path.startswith(('https://', 'http://')):
+            return resource_path
+
+        return self._base_url + resource_path
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Sends a request once a concurrency slot is free and returns a response
+        """
+        async with self._semaphore:
+            return await self._client.request(method, url, **kwargs)
+
+    async def get(self, resource_path, token):
+        """
+        Sends a GET request and returns a response
+        """
+        url = self._url(resource_path)
+
+        request_headers = {
+            'Accept': 'application/json',
+            'Content-type': 'application/json',
+            'Authorization': f'Bearer {token}'
+        }
+
+        response = await self._request('GET', url, headers=request_headers)
+        return response
+
+    async def post(self, resource_path, token, payload=None):
+        """
+        Sends a POST request and returns a response
+        """
+        url = self._url(resource_path)
+
+        kwargs = {}
+
+        if payload is not None:
+            kwargs['content'] = payload
+
+        request_headers = {
+            'Accept': 'application/json',
+            'Content-type': 'application/json',
+            'Authorization': f'Bearer {token}'
+        }
+        kwargs['headers'] = request_headers
+
+        response = await self._request('POST', url, **kwargs)
+        return response
+
+    async def put(self, resource_path, token, payload=None, content_type='application/json'):
+        """
+        Sends a PUT request and returns a response
+        """
+        url = self._url(resource_path)
+
+        kwargs = {}
+
+        if payload is not None:
+            kwargs['content'] = payload
+
+        request_headers = {
+            'Accept': 'application/json',
+            'Content-type': f'{content_type}',
+            'Authorization': f'Bearer {token}'
+        }
+        kwargs['headers'] = request_headers
+
+        response = await self._request('PUT', url, **kwargs)
+        return response
+
+    async def put_file(self, resource_path, token, file_path, chunk_size=1024 * 1024):
+        """
+        Sends a PUT request whose body is streamed from a file and returns a response
+        The file is read chunk by chunk, so that its content is never held in memory as a whole
+        """
+        url = self._url(resource_path)
+
+        request_headers = {
+            'Accept': 'application/json',
+            'Content-type': 'application/octet-stream',
+            'Content-Length': str(os.path.getsize(file_path)),
+            'Authorization': f'Bearer {token}'
+        }
+
+        async def iter_chunks():
+            loop = asyncio.get_running_loop()
+            with open(file_path, 'rb') as f:
+                while chunk := await loop.run_in_executor(None, f.read, chunk_size):
+                    yield chunk
+
+        response = await self._request('PUT', url, content=iter_chunks(), headers=request_headers)
+        return response
+
+    async def delete(self, resource_path, token):
+        """
+        Sends a DELETE request and returns a response
+        """
+        url = self._url(resource_path)
+
+        request_headers = {
+            'Accept': 'application/json',
+            'Content-type': 'application/json',
+            'Authorization': f'Bearer {token}'
+        }
+
+        response = await self._request('DELETE', url, headers=request_headers)
+        return response
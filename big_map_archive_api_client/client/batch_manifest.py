@@ -0,0 +1,47 @@
+from typing import List, Optional
+
+import yaml
+from pydantic import BaseModel, model_validator
+
+
+class BatchJob(BaseModel):
+    """A record to create (no record id) or update (record id of a published version) in a batch."""
+
+    metadata_file: str
+    data_files: str
+    record_id: Optional[str] = None
+    slug: Optional[str] = None
+    update_only: bool = False
+    link_all_files_from_previous: bool = False
+    publish: bool = False
+
+    @model_validator(mode='after')
+    def check_slug(self):
+        """
+        Checks that a community slug is provided for each record to create
+        """
+        if self.record_id is None and self.slug is None:
+            raise ValueError(f'a slug is required to create a record from {self.metadata_file}')
+
+        return self
+
+
+class BatchManifest(BaseModel):
+    """List of records to create or update with a single command."""
+
+    jobs: List[BatchJob]
+
+    @classmethod
+    def load_from_manifest_file(cls, file_path):
+        """
+        Creates a class instance
+        Initializes internal fields from a manifest file
+        Values under 'defaults' apply to every job that does not set them
+        """
+        with open(file_path) as f:
+            manifest = yaml.safe_load(f)
+
+        defaults = manifest.get('defaults') or {}
+        jobs = [{**defaults, **job} for job in manifest.get('jobs') or []]
+
+        return BatchManifest(jobs=jobs)
@@ -1,6 +1,16 @@
+import hashlib
+import os
+from typing import Optional
+
 import yaml
 
 from big_map_archive_api_client.client.api_client import ArchiveAPIClient
+from big_map_archive_api_client.client.async_api_client import \
+    AsyncArchiveAPIClient
+from big_map_archive_api_client.client.rate_limiter import RateLimiter
+from big_map_archive_api_client.client.retry import RetryPolicy
+from big_map_archive_api_client.utils import (ChecksumCache, HTTPCache,
+                                              get_cache_directory)
 from pydantic import BaseModel
 
 
@@ -10,6 +20,18 @@ class ClientConfig(BaseModel):
     domain_name: str
     port: int
     token: str
+    pool_connections: int = 10
+    pool_maxsize: int = 10
+    keep_alive: bool = True
+    max_attempts: int = 5
+    backoff_factor: float = 0.5
+    requests_per_second: Optional[float] = None
+    bytes_per_second: Optional[float] = None
+    multipart_threshold: int = 1024 ** 3
+    multipart_part_size: int = 100 * 1024 ** 2
+    http_cache: bool = False
+    http_cache_max_size: int = 100 * 1024 ** 2
+    http_cache_ttls: dict = {'/api/communities': 24 * 3600}
 
     @classmethod
     def load_from_config_file(cls, file_path):
@@ -23,9 +45,54 @@ class ClientConfig(BaseModel):
 
         return ClientConfig(**client_config)
 
-    def create_client(self):
+    def create_client(self, jobs=1, use_checksum_cache=False):
         """
         Creates a client to interact with BMA's API
         Initializes internal fields
+        The connection pool is sized so that 'jobs' parallel uploads each get a connection
+        If 'use_checksum_cache' is True, the checksums of local files are cached on disk between runs
+        If 'http_cache' is True in the configuration file, the responses to GET requests are cached on disk between runs
+        """
+        checksum_cache = ChecksumCache() if use_checksum_cache else None
+        http_cache = HTTPCache(max_size=self.http_cache_max_size, ttls=self.http_cache_ttls) if self.http_cache else None
+        rate_limiter = self.create_rate_limiter()
+
+        return ArchiveAPIClient(self.domain_name,
+                                self.port,
+                                self.token,
+                                self.pool_connections,
+                                max(self.pool_maxsize, jobs),
+                                self.keep_alive,
+                                self.multipart_threshold,
+                                self.multipart_part_size,
+                                checksum_cache,
+                                http_cache,
+                                RetryPolicy(self.max_attempts, self.backoff_factor),
+                                rate_limiter)
+
+    def create_rate_limiter(self):
+        """
+        Creates the rate limiter for requests_per_second and bytes_per_second, or returns None if neither is set
+        All processes on the host that use the same domain name and token share the same budget
+        """
+        if self.requests_per_second is None and self.bytes_per_second is None:
+            return None
+
+        # The token itself is never written to disk
+        key = hashlib.sha256(f'{self.domain_name}\n{self.token}'.encode()).hexdigest()[:32]
+        state_file_path = os.path.join(get_cache_directory('rate_limits'), f'{key}.json')
+
+        return RateLimiter(state_file_path, self.requests_per_second, self.bytes_per_second)
+
+    def create_async_client(self, concurrency=100):
+        """
+        Creates an asyncio client to interact with BMA's API
+        Initializes internal fields
+        At most 'concurrency' requests are in flight at any time
         """
-        return ArchiveAPIClient(self.domain_name, self.port, self.token)
+        return AsyncArchiveAPIClient(self.domain_name,
+                                     self.port,
+                                     self.token,
+                                     max(self.pool_maxsize, concurrency),
+                                     self.pool_maxsize,
+                                     concurrency)
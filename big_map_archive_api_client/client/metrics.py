@@ -0,0 +1,259 @@
+"""
+Request-level metrics for the connections to the archive and to FINALES servers
+
+Every attempt to send a request is passed to the active recorder, if any. While no recorder is set (the default),
+recording costs a single lookup of the module-level 'recorder' variable per request.
+"""
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float('inf'))
+
+recorder = None  # Active MetricsRecorder object, see set_recorder()
+
+_ID_PATTERNS = [
+    # Secret path segments (e.g., the access key of the FINALES database endpoint) must never reach the metrics
+    (re.compile(r'(?<=/database_dump/)[^/]+'), '{key}'),
+    (re.compile(r'(?<=/records/)[^/]+'), '{id}'),
+    (re.compile(r'(?<=/files/)[^/]+'), '{filename}'),
+    (re.compile(r'/[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}(?=/|$)'), '/{uuid}'),
+    (re.compile(r'/\d+(?=/|$)'), '/{n}')
+]
+
+
+def set_recorder(new_recorder):
+    """
+    Sets the recorder that receives the metrics of all requests (None to stop recording)
+    """
+    global recorder
+    recorder = new_recorder
+
+
+def get_endpoint(url):
+    """
+    Returns the endpoint template of a URL, e.g., '/api/records/{id}/draft/files/{filename}/content'
+    The query string is left out, so that requests to the same endpoint are aggregated
+    """
+    endpoint = urlsplit(url).path
+
+    for pattern, placeholder in _ID_PATTERNS:
+        endpoint = pattern.sub(placeholder, endpoint)
+
+    return endpoint
+
+
+class EndpointStats:
+    """
+    Aggregated metrics of the requests with the same method, endpoint template and status
+    """
+
+    def __init__(self):
+        """
+        Initializes internal fields
+        """
+        self.count = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, seconds, bytes_sent, bytes_received, retry):
+        """
+        Adds a request to the statistics
+        """
+        self.count += 1
+        self.retries += int(retry)
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+
+        for i, upper_bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= upper_bound:
+                self.buckets[i] += 1
+                break
+
+    def get_quantile(self, q):
+        """
+        Returns an upper bound of the q-quantile of the latency, from the histogram
+        """
+        rank = q * self.count
+        cumulative_count = 0
+
+        for upper_bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            cumulative_count += count
+
+            if cumulative_count >= rank:
+                return min(upper_bound, self.max_seconds)
+
+        return self.max_seconds
+
+
+class MetricsRecorder:
+    """
+    Collects the metrics of requests: method, endpoint template, status, latency, bytes sent and received, retries
+    Aggregates them into latency histograms and counters, and optionally writes a trace with one JSON line per request
+    """
+
+    def __init__(self, trace_file=None):
+        """
+        Initializes internal fields
+        @param trace_file: text file object to which each request is written as a JSON line, or None
+        """
+        self.started = time.time()
+        self.stats = {}
+        self._trace_file = trace_file
+        self._lock = threading.Lock()
+
+    def record(self, method, url, status, seconds, bytes_sent, bytes_received, attempt, error=None):
+        """
+        Records an attempt to send a request
+        @param status: status code of the response, or None if no response was received
+        @param attempt: 1 for the first attempt, 2 or more for the attempts that resend the request
+        @param error: name of the exception raised if no response was received
+        """
+        endpoint = get_endpoint(url)
+        key = (method, endpoint, str(status) if status is not None else (error or 'error'))
+
+        with self._lock:
+            stats = self.stats.get(key)
+
+            if stats is None:
+                stats = self.stats[key] = EndpointStats()
+
+            stats.add(seconds, bytes_sent, bytes_received, attempt > 1)
+
+            if self._trace_file is not None:
+                self._trace_file.write(json.dumps({
+                    'time': round(time.time(), 6),
+                    'method': method,
+                    'endpoint': endpoint,
+                    'status': status,
+                    'error': error,
+                    'seconds': round(seconds, 6),
+                    'bytes_sent': bytes_sent,
+                    'bytes_received': bytes_received,
+                    'attempt': attempt
+                }) + '\n')
+
+    def get_summary(self):
+        """
+        Returns the aggregated metrics as a dictionary
+        """
+        with self._lock:
+            items = sorted(self.stats.items())
+
+        elapsed = max(time.time() - self.started, 1e-9)
+        endpoints = []
+
+        for (method, endpoint, status), stats in items:
+            endpoints.append({
+                'method': method,
+                'endpoint': endpoint,
+                'status': status,
+                'count': stats.count,
+                'retries': stats.retries,
+                'seconds': {
+                    'total': round(stats.seconds, 6),
+                    'mean': round(stats.seconds / stats.count, 6),
+                    'p50': round(stats.get_quantile(0.5), 6),
+                    'p95': round(stats.get_quantile(0.95), 6),
+                    'max': round(stats.max_seconds, 6)
+                },
+                'bytes_sent': stats.bytes_sent,
+                'bytes_received': stats.bytes_received
+            })
+
+        bytes_sent = sum(e['bytes_sent'] for e in endpoints)
+        bytes_received = sum(e['bytes_received'] for e in endpoints)
+
+        return {
+            'elapsed_seconds': round(elapsed, 6),
+            'requests': sum(e['count'] for e in endpoints),
+            'retries': sum(e['retries'] for e in endpoints),
+            'bytes_sent': bytes_sent,
+            'bytes_received': bytes_received,
+            'bytes_sent_per_second': round(bytes_sent / elapsed, 3),
+            'bytes_received_per_second': round(bytes_received / elapsed, 3),
+            'endpoints': endpoints
+        }
+
+    def get_prometheus_text(self):
+        """
+        Returns the aggregated metrics in the Prometheus text format (e.g., for node-exporter's textfile collector)
+        """
+        with self._lock:
+            items = sorted(self.stats.items())
+
+        lines = [
+            '# HELP bma_http_request_duration_seconds Duration of the requests sent by bma.',
+            '# TYPE bma_http_request_duration_seconds histogram'
+        ]
+
+        for (method, endpoint, status), stats in items:
+            labels = f'method="{method}",endpoint="{_escape(endpoint)}",status="{_escape(status)}"'
+            cumulative_count = 0
+
+            for upper_bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative_count += count
+                le = '+Inf' if upper_bound == float('inf') else repr(upper_bound)
+                lines.append(f'bma_http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative_count}')
+
+            lines.append(f'bma_http_request_duration_seconds_sum{{{labels}}} {stats.seconds}')
+            lines.append(f'bma_http_request_duration_seconds_count{{{labels}}} {stats.count}')
+
+        counters = [
+            ('bma_http_request_retries_total', 'Requests sent again after a transient error.', 'retries'),
+            ('bma_http_request_bytes_sent_total', 'Bytes sent in request bodies.', 'bytes_sent'),
+            ('bma_http_response_bytes_received_total', 'Bytes received in response bodies.', 'bytes_received')
+        ]
+
+        for name, description, field in counters:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} counter')
+
+            for (method, endpoint, status), stats in items:
+                labels = f'method="{method}",endpoint="{_escape(endpoint)}",status="{_escape(status)}"'
+                lines.append(f'{name}{{{labels}}} {getattr(stats, field)}')
+
+        lines.append('# HELP bma_run_timestamp_seconds Time at which the command started.')
+        lines.append('# TYPE bma_run_timestamp_seconds gauge')
+        lines.append(f'bma_run_timestamp_seconds {self.started}')
+
+        return '\n'.join(lines) + '\n'
+
+    def export(self, file_path, metrics_format):
+        """
+        Writes the aggregated metrics to a file, as 'json' or 'prometheus'
+        The file is replaced atomically, so that a collector never reads a partial file
+        """
+        if metrics_format == 'prometheus':
+            text = self.get_prometheus_text()
+        else:
+            text = json.dumps(self.get_summary(), indent=2, sort_keys=True) + '\n'
+
+        temp_path = f'{file_path}.{os.getpid()}.tmp'
+
+        with open(temp_path, 'w') as f:
+            f.write(text)
+
+        os.replace(temp_path, file_path)
+
+    def close(self):
+        """
+        Closes the trace file
+        """
+        if self._trace_file is not None:
+            self._trace_file.close()
+
+
+def _escape(value):
+    # Label values in the Prometheus text format
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
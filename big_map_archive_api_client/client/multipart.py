@@ -0,0 +1,209 @@
+import hashlib
+import json
+import math
+import os
+import threading
+
+
+class FilePartReader:
+    """
+    File-like object that reads a byte range of a file
+    Used as a request body so that a file part is streamed from disk rather than loaded into memory
+    """
+
+    def __init__(self, file_path, offset, size):
+        """
+        Initializes internal fields
+        """
+        self._file = open(file_path, 'rb')
+        self._offset = offset
+        self._size = size
+        self._file.seek(offset)
+        self._position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        """
+        Returns the size of the part, which sets the request's Content-Length
+        """
+        return self._size
+
+    def read(self, n=-1):
+        """
+        Reads up to n bytes without going past the end of the part
+        """
+        remaining = self._size - self._position
+
+        if n is None or n < 0 or n > remaining:
+            n = remaining
+
+        chunk = self._file.read(n)
+        self._position += len(chunk)
+
+        return chunk
+
+    def seek(self, position, whence=os.SEEK_SET):
+        """
+        Moves to a position relative to the start of the part
+        """
+        if whence == os.SEEK_CUR:
+            position += self._position
+        elif whence == os.SEEK_END:
+            position += self._size
+
+        self._position = min(max(position, 0), self._size)
+        self._file.seek(self._offset + self._position)
+
+        return self._position
+
+    def tell(self):
+        """
+        Returns the position relative to the start of the part
+        """
+        return self._position
+
+    def close(self):
+        """
+        Closes the underlying file
+        """
+        self._file.close()
+
+
+def is_transfer_rejected(response):
+    """
+    Returns True if the archive answered a request initiating a multipart transfer with a validation error on the
+    transfer itself (e.g., an archive that only accepts uploads in a single request), rather than on the file link
+    """
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+
+    if not isinstance(body, dict):
+        return False
+
+    # e.g., {"message": "A validation error occurred.", "errors": [{"field": "0.transfer.type", "messages": [...]}]}
+    fields = [str(error.get('field', '')) for error in body.get('errors') or [] if isinstance(error, dict)]
+
+    return any('transfer' in field for field in fields) or 'transfer' in str(body.get('message', '')).lower()
+
+
+def get_part_links(entry, checkpoint):
+    """
+    Returns the links for uploading the parts of a draft's linked file if the file is waiting for the parts described
+    by a checkpoint (same size, number of parts and part size), None otherwise
+    """
+    part_links = entry.get('links', {}).get('parts')
+    part_size = (entry.get('transfer') or {}).get('part_size', checkpoint.part_size)
+
+    if (entry.get('status', 'pending') != 'pending' or not part_links or len(part_links) != checkpoint.parts
+            or entry.get('size') not in (None, checkpoint.size) or part_size != checkpoint.part_size):
+        return None
+
+    return part_links
+
+
+class MultipartCheckpoint:
+    """
+    Local record of the parts of a file that were uploaded to a draft
+    Allows an interrupted multipart upload to resume from the last uploaded part instead of starting from zero
+    A checkpoint is only reused for the same draft, file name, file size, modification time and part size
+    """
+
+    def __init__(self, checkpoint_dir_path, record_id, file_path, part_size):
+        """
+        Initializes internal fields
+        """
+        stat = os.stat(file_path)
+
+        self.record_id = record_id
+        self.filename = os.path.basename(file_path)
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.part_size = part_size
+        self.parts = max(1, math.ceil(self.size / part_size))
+        self.completed_parts = set()
+
+        key = hashlib.sha1(f'{record_id}/{self.filename}'.encode()).hexdigest()
+        self._path = os.path.join(checkpoint_dir_path, f'{key}.json')
+        self._lock = threading.Lock()
+
+    def _identity(self):
+        return {
+            'record_id': self.record_id,
+            'filename': self.filename,
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'part_size': self.part_size
+        }
+
+    def load(self):
+        """
+        Loads the completed parts from a previous run
+        Returns True if a checkpoint for the same upload was found, False otherwise
+        """
+        try:
+            with open(self._path, 'r') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if checkpoint.get('identity') != self._identity():
+            return False
+
+        self.completed_parts = set(checkpoint['completed_parts'])
+        return True
+
+    def save(self):
+        """
+        Writes the checkpoint to disk atomically, so that a crash never leaves a truncated checkpoint behind
+        """
+        with self._lock:
+            checkpoint = {
+                'identity': self._identity(),
+                'completed_parts': sorted(self.completed_parts)
+            }
+            temp_path = self._path + '.tmp'
+
+            with open(temp_path, 'w') as f:
+                json.dump(checkpoint, f)
+
+            os.replace(temp_path, self._path)
+
+    def mark_completed(self, part):
+        """
+        Records that a part was uploaded
+        """
+        with self._lock:
+            self.completed_parts.add(part)
+
+        self.save()
+
+    def remove(self):
+        """
+        Deletes the checkpoint once the upload is complete
+        """
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+    def get_pending_parts(self):
+        """
+        Gets the numbers (starting from 1) of the parts that still need to be uploaded
+        """
+        return [part for part in range(1, self.parts + 1) if part not in self.completed_parts]
+
+    def get_part_range(self, part):
+        """
+        Gets the offset and the size of a part
+        """
+        offset = (part - 1) * self.part_size
+        size = min(self.part_size, self.size - offset)
+
+        return offset, size
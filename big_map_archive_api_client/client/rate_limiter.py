@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+
+from requests.utils import super_len
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where the budget is only shared by the threads of a process
+    fcntl = None
+
+# Share of the bytes per second budget taken at once by a stream (in seconds), and bounds of that share (in bytes)
+QUANTUM_SECONDS = 0.1
+MIN_QUANTUM = 4096
+MAX_QUANTUM = 4 * 1024 ** 2
+# Shortest wait (in seconds), so that rounding errors in the buckets never lead to waits shorter than the clock's resolution
+MIN_DELAY = 0.001
+
+
+class RateLimiter:
+    """
+    Token buckets that limit the number of requests and the number of bytes sent and received per second
+    The buckets are stored in a state file protected by a lock file, so that all processes on a host that use the same
+    state file (e.g., cron jobs using the same token) share one budget
+    Request and response bodies are throttled while they are streamed: bytes are taken from the budget a quantum at a
+    time (a tenth of a second of budget) and kept in an allowance of the calling thread, so that a large upload or
+    download runs at the budgeted rate and a small request only updates the state file once
+    """
+
+    def __init__(self, state_file_path, requests_per_second=None, bytes_per_second=None, burst=1.0):
+        """
+        Initializes internal fields
+        A budget set to None is not limited
+        @param burst: number of seconds of budget that can be saved up while no request is sent
+        """
+        self.state_file_path = state_file_path
+        self.requests_per_second = requests_per_second
+        self.bytes_per_second = bytes_per_second
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(state_file_path), exist_ok=True)
+
+    @property
+    def quantum(self):
+        """
+        Returns the number of bytes taken from the budget at once by a stream
+        """
+        return int(min(max(self.bytes_per_second * QUANTUM_SECONDS, MIN_QUANTUM), MAX_QUANTUM))
+
+    def _update(self, request_count, byte_count):
+        """
+        Refills the buckets and takes a cost from them if they are non-negative
+        Returns the number of seconds to wait before the cost can be taken (0 if it was taken)
+        """
+        with self._lock, open(self.state_file_path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            try:
+                with open(self.state_file_path, 'r') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+
+            now = time.time()
+            buckets = [('requests', self.requests_per_second, request_count), ('bytes', self.bytes_per_second, byte_count)]
+            delay = 0
+
+            for name, rate, cost in buckets:
+                if rate is None:
+                    continue
+
+                bucket = state.get(name) or {'tokens': rate * self.burst, 'updated': now}
+                elapsed = max(0.0, now - bucket['updated'])
+                bucket['tokens'] = min(rate * self.burst, bucket['tokens'] + rate * elapsed)
+                bucket['updated'] = now
+                state[name] = bucket
+
+                if cost and bucket['tokens'] < 0:
+                    delay = max(delay, -bucket['tokens'] / rate, MIN_DELAY)
+
+            if delay == 0:
+                for name, rate, cost in buckets:
+                    if rate is not None:
+                        state[name]['tokens'] -= cost
+
+            temp_path = f'{self.state_file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+            with open(temp_path, 'w') as f:
+                json.dump(state, f)
+
+            os.replace(temp_path, self.state_file_path)
+
+        return delay
+
+    def _take(self, request_count, byte_count):
+        """
+        Waits until the buckets are non-negative and takes a cost from them; bytes are taken from the allowance of the
+        calling thread first, and the allowance is topped up by at least a quantum when it does not suffice
+        """
+        allowance = getattr(self._local, 'allowance', 0)
+        top_up = 0
+
+        if self.bytes_per_second is not None and byte_count > allowance:
+            top_up = max(byte_count - allowance, self.quantum)
+
+        if request_count or top_up:
+            while delay := self._update(request_count, top_up):
+                time.sleep(delay)
+
+        if self.bytes_per_second is not None:
+            self._local.allowance = allowance + top_up - byte_count
+
+    def acquire(self, byte_count=0):
+        """
+        Waits until a request that sends 'byte_count' bytes (e.g., a JSON payload) fits in the budget, and takes it from
+        the budget
+        """
+        self._take(1, byte_count)
+
+    def consume(self, byte_count):
+        """
+        Waits until 'byte_count' more bytes of a request or response body fit in the budget, and takes them from the budget
+        """
+        if byte_count > 0:
+            self._take(0, byte_count)
+
+    def throttle(self, chunks):
+        """
+        Yields the chunks of a stream (e.g., response.iter_content()) no faster than the bytes per second budget
+        """
+        for chunk in chunks:
+            self.consume(len(chunk))
+            yield chunk
+
+
+class ThrottledReader:
+    """
+    File-like object that reads a request body (e.g., a file being uploaded) no faster than the budget of a RateLimiter
+    """
+
+    def __init__(self, file, rate_limiter):
+        """
+        Initializes internal fields
+        """
+        self._file = file
+        self._rate_limiter = rate_limiter
+        self._size = super_len(file)
+
+    def __len__(self):
+        """
+        Returns the number of bytes left to read, which sets the request's Content-Length
+        """
+        return self._size
+
+    def read(self, n=-1):
+        """
+        Reads up to n bytes once they fit in the budget
+        """
+        chunk = self._file.read(n)
+        self._rate_limiter.consume(len(chunk))
+
+        return chunk
@@ -1,11 +1,29 @@
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import super_len
+
+from big_map_archive_api_client.client.rate_limiter import ThrottledReader
+from big_map_archive_api_client.client.retry import AdaptiveLimiter, RetryPolicy
+from big_map_archive_api_client.utils.http_cache import get_modified_prefixes
+
+# Size of the chunks in which response bodies are read when a bytes per second budget is set
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
 
 class RestAPIConnection:
     """Internal auxiliary class that handles the base connection."""
 
-    def __init__(self, domain_name, port):
+    def __init__(self, domain_name, port, pool_connections=10, pool_maxsize=10, keep_alive=True, http_cache=None,
+                 retry_policy=None, rate_limiter=None):
         """
         Initializes internal fields
+        A single connection pool is shared by all threads; each thread gets its own session mounted on that pool
+        The connection takes ownership of 'http_cache' (an HTTPCache object or None), which stores the responses to GET requests
+        Requests that fail with a transient error are resent according to 'retry_policy' (by default, RetryPolicy())
+        Every request (including resent ones) takes its share of the budget of 'rate_limiter' (a RateLimiter object or None),
+        and request and response bodies are throttled while they are transferred
         """
         self.domain_name = domain_name
         if domain_name=='127.0.0.1':
@@ -13,11 +31,144 @@ class RestAPIConnection:
         else:
             self._base_url = f'https://{domain_name}'
 
+        self._keep_alive = keep_alive
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        # Requests in flight are limited to the pool size, and to less while the server signals overload
+        self._limiter = AdaptiveLimiter(pool_maxsize)
+        self._rate_limiter = rate_limiter
+        self._http_cache = http_cache
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def session(self):
+        """
+        Returns the calling thread's session, which reuses connections (and thus TLS sessions) from the shared pool
+        """
+        session = getattr(self._local, 'session', None)
+
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+
+            if not self._keep_alive:
+                session.headers['Connection'] = 'close'
+
+            with self._lock:
+                self._sessions.append(session)
+
+            self._local.session = session
+
+        return session
+
+    def close(self):
+        """
+        Closes all sessions, the underlying connection pool and the HTTP cache
+        """
+        with self._lock:
+            sessions = self._sessions
+            self._sessions = []
+
+        for session in sessions:
+            session.close()
+
+        self._adapter.close()
+        self._local = threading.local()
+
+        if self._http_cache is not None:
+            self._http_cache.close()
+
+    def _url(self, resource_path):
+        """
+        Returns the URL for a resource path
+        Absolute URLs (e.g., links returned by the API) are used as they are
+        """
+        if resource_path.startswith(('https://', 'http://')):
+            return resource_path
+
+        return self._base_url + resource_path
+
+    def _request(self, method, url, idempotent=None, **kwargs):
+        """
+        Sends a request through the calling thread's session and returns a response
+        The request is resent if it fails with a transient error; see RetryPolicy for the requests that are never resent
+        """
+        response = self._retry_policy.send(self._send, method, url, self._limiter, idempotent, **kwargs)
+
+        # Cached responses about the modified record and searches for records may be outdated; communities are not
+        if method != 'GET' and self._http_cache is not None:
+            self._http_cache.expire(get_modified_prefixes(url))
+
+        return response
+
+    def _send(self, method, url, **kwargs):
+        """
+        Sends a request once, within the budget of the rate limiter, and returns a response
+        """
+        if self._rate_limiter is None:
+            return self.session.request(method, url, **kwargs)
+
+        if self._rate_limiter.bytes_per_second is None:
+            self._rate_limiter.acquire()
+            return self.session.request(method, url, **kwargs)
+
+        # Payloads in memory are taken from the budget with the request; files are taken while they are read
+        data = kwargs.get('data')
+
+        if hasattr(data, 'read'):
+            kwargs['data'] = ThrottledReader(data, self._rate_limiter)
+            self._rate_limiter.acquire()
+        else:
+            self._rate_limiter.acquire(super_len(data) if data is not None else 0)
+
+        if kwargs.pop('stream', False):
+            return self.session.request(method, url, stream=True, **kwargs)
+
+        # The response body is read as a stream, so that it is taken from the budget while it is downloaded
+        response = self.session.request(method, url, stream=True, **kwargs)
+        chunks = response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE)
+        response._content = b''.join(self._rate_limiter.throttle(chunks))
+        response._content_consumed = True
+
+        return response
+
+    def _cached_get(self, url, token, **kwargs):
+        """
+        Sends a GET request unless the HTTP cache holds a fresh response, and returns a response
+        An outdated cached response is revalidated with a conditional request and served if the server answers 304 Not Modified
+        """
+        entry = self._http_cache.get(url, token)
+
+        if entry is not None and entry.is_fresh():
+            return entry.to_response()
+
+        if entry is not None:
+            kwargs['headers'].update(entry.get_validators())
+
+        response = self._request('GET', url, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            self._http_cache.refresh(url, token)
+            return entry.to_response()
+
+        self._http_cache.set(url, token, response)
+
+        return response
+
     def get(self, resource_path, token):
         """
         Sends a GET request and returns a response
         """
-        url = self._base_url + resource_path
+        url = self._url(resource_path)
 
         kwargs = {}
 
@@ -31,14 +182,18 @@ class RestAPIConnection:
         if self.domain_name == "127.0.0.1":
             kwargs['verify'] = False
 
-        response = requests.get(url, **kwargs)
+        if self._http_cache is not None:
+            return self._cached_get(url, token, **kwargs)
+
+        response = self._request('GET', url, **kwargs)
         return response
 
-    def post(self, resource_path, token, payload=None):
+    def post(self, resource_path, token, payload=None, idempotent=False):
         """
         Sends a POST request and returns a response
+        Set 'idempotent' to True if sending the request twice has the same effect as sending it once, so that it can be resent
         """
-        url = self._base_url + resource_path
+        url = self._url(resource_path)
 
         kwargs = {}
 
@@ -55,14 +210,14 @@ class RestAPIConnection:
         if self.domain_name == "127.0.0.1":
             kwargs['verify'] = False
 
-        response = requests.post(url, **kwargs)
+        response = self._request('POST', url, idempotent, **kwargs)
         return response
 
     def put(self, resource_path, token, payload=None, content_type='application/json'):
         """
         Sends a PUT request and returns a response
         """
-        url = self._base_url + resource_path
+        url = self._url(resource_path)
 
         kwargs = {}
 
@@ -72,21 +227,25 @@ class RestAPIConnection:
         request_headers = {
             'Accept': 'application/json',
             'Content-type': f'{content_type}',
-            'Authorization': f'Bearer {token}'
         }
+
+        # Never send the token to another host (e.g., a pre-signed URL for uploading a file part to an object store)
+        if url.startswith(self._base_url + '/'):
+            request_headers['Authorization'] = f'Bearer {token}'
+
         kwargs['headers'] = request_headers
         kwargs['verify'] = True
         if self.domain_name == "127.0.0.1":
             kwargs['verify'] = False
 
-        response = requests.put(url, **kwargs)
+        response = self._request('PUT', url, **kwargs)
         return response
 
     def delete(self, resource_path, token):
         """
         Sends a DELETE request and returns a response
         """
-        url = self._base_url + resource_path
+        url = self._url(resource_path)
 
         kwargs = {}
 
@@ -100,5 +259,5 @@ class RestAPIConnection:
         if self.domain_name == "127.0.0.1":
             kwargs['verify'] = False
 
-        response = requests.delete(url, **kwargs)
+        response = self._request('DELETE', url, **kwargs)
         return response
@@ -0,0 +1,226 @@
+import email.utils
+import random
+import threading
+import time
+
+import requests
+from requests.utils import super_len
+from urllib3.exceptions import NewConnectionError
+
+from big_map_archive_api_client.client import metrics
+
+
+class AdaptiveLimiter:
+    """
+    Limit on the number of requests in flight, adjusted with additive increase and multiplicative decrease (AIMD)
+    The limit is halved when the server signals overload and grows back by one request per 'limit' successful requests
+    Requests in flight together fail together: the limit is halved at most once per congestion window, i.e., only
+    overloads of requests sent after the last decrease count
+    """
+
+    def __init__(self, maximum, minimum=1):
+        """
+        Initializes internal fields
+        The limit starts at 'maximum', which is typically the size of the connection pool
+        """
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self._in_flight = 0
+        self._generation = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self):
+        """
+        Waits until fewer requests than the current limit are in flight
+        Returns the generation of the limit, to be passed to decrease() if the request signals overload
+        """
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+
+            self._in_flight += 1
+
+            return self._generation
+
+    def release(self):
+        """
+        Signals that a request is no longer in flight
+        """
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    def increase(self):
+        """
+        Grows the limit after a successful request
+        """
+        with self._condition:
+            previous_limit = int(self.limit)
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+            if int(self.limit) > previous_limit:
+                self._condition.notify()
+
+    def decrease(self, generation=None):
+        """
+        Halves the limit after the server signaled overload
+        The overload is ignored if the request was sent before the last decrease ('generation' returned by acquire()
+        is older), as the limit already accounts for it
+        """
+        with self._condition:
+            if generation is not None and generation != self._generation:
+                return
+
+            self.limit = max(self.minimum, self.limit / 2)
+            self._generation += 1
+
+
+class RetryPolicy:
+    """
+    Resends requests that failed because of a transient error, waiting longer after each attempt
+    Only idempotent requests are resent after a server error or a lost connection; any request is resent after
+    '429 Too Many Requests' or a failed connection attempt, as the server did not process it
+    """
+
+    def __init__(self, max_attempts=5, backoff_factor=0.5, max_backoff=60, max_retry_after=300,
+                 retry_statuses=(429, 502, 503, 504), overload_statuses=(429, 503),
+                 idempotent_methods=('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')):
+        """
+        Initializes internal fields
+        The wait before attempt n + 1 is drawn uniformly between 0 and min(max_backoff, backoff_factor * 2 ** n) seconds,
+        or is the value of the response's Retry-After header (at most 'max_retry_after' seconds) if it is longer
+        """
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = retry_statuses
+        self.overload_statuses = overload_statuses
+        self.idempotent_methods = idempotent_methods
+
+    def get_delay(self, attempt, response=None):
+        """
+        Returns the number of seconds to wait after a failed attempt (starting from 1)
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+        retry_after = get_retry_after(response) if response is not None else None
+
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_retry_after))
+
+        return delay
+
+    def send(self, send, method, url, limiter=None, idempotent=None, **kwargs):
+        """
+        Sends a request with 'send' (e.g., requests.Session.request) and resends it while it fails with a transient error
+        Returns the last response; raises the last exception if the request could not be sent
+        @param limiter: AdaptiveLimiter object, informed of successes and overloads, or None
+        @param idempotent: whether the request can safely be sent twice; by default, derived from the method
+        """
+        if idempotent is None:
+            idempotent = method in self.idempotent_methods
+
+        data = kwargs.get('data')
+        can_resend = _is_replayable(data)
+        attempt = 0
+        recorder = metrics.recorder
+
+        if recorder is not None:
+            bytes_sent = super_len(data) if data is not None else 0
+
+        while True:
+            attempt += 1
+            can_retry = attempt < self.max_attempts and can_resend
+
+            if attempt > 1 and hasattr(data, 'seek'):
+                # A streamed body (e.g., a file being uploaded) is sent again from its start
+                data.seek(0)
+
+            if limiter is not None:
+                generation = limiter.acquire()
+
+            start = time.perf_counter()
+
+            try:
+                response = send(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if recorder is not None:
+                    recorder.record(method, url, None, time.perf_counter() - start, bytes_sent, 0, attempt, type(e).__name__)
+
+                # A request whose connection could not be established never reached the server
+                reason = getattr(e.args[0], 'reason', None) if e.args else None
+                not_sent = isinstance(e, requests.exceptions.ConnectTimeout) or isinstance(reason, NewConnectionError)
+
+                if not can_retry or not (idempotent or not_sent):
+                    raise
+
+                if limiter is not None:
+                    limiter.decrease(generation)
+
+                time.sleep(self.get_delay(attempt))
+                continue
+            finally:
+                if limiter is not None:
+                    limiter.release()
+
+            status_code = response.status_code
+
+            if recorder is not None:
+                bytes_received = int(response.headers.get('Content-Length') or 0)
+
+                if not bytes_received and not kwargs.get('stream'):
+                    bytes_received = len(response.content)
+
+                recorder.record(method, url, status_code, time.perf_counter() - start, bytes_sent, bytes_received, attempt)
+
+            if limiter is not None:
+                if status_code in self.overload_statuses:
+                    limiter.decrease(generation)
+                elif status_code < 500:
+                    limiter.increase()
+
+            if status_code in self.retry_statuses and can_retry and (idempotent or status_code == 429):
+                delay = self.get_delay(attempt, response)
+                response.close()
+                time.sleep(delay)
+                continue
+
+            return response
+
+
+def get_retry_after(response):
+    """
+    Returns the number of seconds requested by a response's Retry-After header (in seconds or as an HTTP date), or None
+    """
+    value = response.headers.get('Retry-After')
+
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_replayable(data):
+    """
+    Returns True if a request body can be sent again, i.e., it is held in memory or it is a stream that can be rewound
+    """
+    if data is None or isinstance(data, (bytes, str, dict, list, tuple)):
+        return True
+
+    return hasattr(data, 'seek')
@@ -0,0 +1,39 @@
+class SyncPlan:
+    """
+    Differences between the files linked to a draft and the files in an input folder
+    Both sides are indexed by file name, so that the plan is computed in linear time
+    """
+
+    def __init__(self, linked_files, local_files, link_all_files_from_previous):
+        """
+        Initializes internal fields
+        @param linked_files: mapping from the names of the draft's linked files to their checksums
+        @param local_files: mapping from the names of the files in the input folder to their checksums
+        (None for a file that is not linked, as its checksum is not needed)
+        @param link_all_files_from_previous: if True, linked files that are not in the input folder remain linked
+        """
+        self.unchanged = []  # Linked files with the same content in the input folder
+        self.changed = []  # Linked files with a different content in the input folder
+        self.missing = []  # Linked files that are not in the input folder
+        self.new = []  # Files in the input folder that are not linked
+
+        for name, checksum in linked_files.items():
+            if name not in local_files:
+                self.missing.append(name)
+            elif local_files[name] == checksum:
+                self.unchanged.append(name)
+            else:
+                self.changed.append(name)
+
+        self.new = [name for name in local_files if name not in linked_files]
+
+        # Links to delete from the draft and files to upload
+        self.delete = self.changed + ([] if link_all_files_from_previous else self.missing)
+        self.upload = self.changed + self.new
+
+        # Links that remain in the draft
+        self.keep = self.unchanged + (self.missing if link_all_files_from_previous else [])
+
+    def __repr__(self):
+        return (f'SyncPlan(keep={len(self.keep)}, delete={len(self.delete)}, '
+                f'upload={len(self.upload)}, unchanged={len(self.unchanged)})')
@@ -1,19 +1,63 @@
+from .checksum_cache import ChecksumCache
+from .compression import (CODECS, compress_chunks, compress_file,
+                          decompress_file, get_codec,
+                          get_compressed_filename, open_decompressed)
+from .http_cache import HTTPCache, HTTPCacheEntry
+from .hashing import (ChecksumEngine, HashingReader, HashingStats,
+                      compute_checksum)
+from .json_codec import (dumps, dumps_canonical, dumps_pretty,
+                         dumps_pretty_items, iter_items, loads)
+from .pipe import PIPE_BUFFER_SIZE, PIPE_CHUNK_SIZE, HashingPipe
+from .metadata import (convert_metadata_files, load_metadata_file,
+                       validate_partial_metadata)
 from .requests import (generate_full_metadata,
                        export_to_json_file,
+                       export_hits_to_json_file,
+                       export_items_to_json_file,
                        change_metadata,
                        get_data_files_in_upload_dir,
                        get_name_to_checksum_for_files_in_upload_dir,
                        get_title_from_metadata_file,
                        create_directory,
-                       recreate_directory)
+                       recreate_directory,
+                       get_cache_directory)
 
 __all__ = [
     'generate_full_metadata',
     'export_to_json_file',
+    'export_hits_to_json_file',
+    'export_items_to_json_file',
     'change_metadata',
     'get_data_files_in_upload_dir',
     'get_name_to_checksum_for_files_in_upload_dir',
+    'compute_checksum',
     'get_title_from_metadata_file',
     'create_directory',
-    'recreate_directory'
+    'recreate_directory',
+    'get_cache_directory',
+    'ChecksumCache',
+    'HTTPCache',
+    'HTTPCacheEntry',
+    'ChecksumEngine',
+    'HashingStats',
+    'HashingReader',
+    'HashingPipe',
+    'PIPE_CHUNK_SIZE',
+    'PIPE_BUFFER_SIZE',
+    'loads',
+    'dumps',
+    'dumps_canonical',
+    'dumps_pretty',
+    'dumps_pretty_items',
+    'iter_items',
+    'load_metadata_file',
+    'validate_partial_metadata',
+    'convert_metadata_files',
+    'CODECS',
+    'compress_chunks',
+    'compress_file',
+    'decompress_file',
+    'get_codec',
+    'get_compressed_filename',
+    'open_decompressed'
 ]
\ No newline at end of file
@@ -0,0 +1,92 @@
+import os
+import sqlite3
+import threading
+
+from .requests import get_cache_directory
+
+
+class ChecksumCache:
+    """
+    On-disk cache of the md5 hashes of local files, stored in a SQLite database
+    An entry is only used if the file's path, size, modification time (in ns) and inode are unchanged
+    """
+
+    def __init__(self, file_path=None):
+        """
+        Initializes internal fields
+        By default, the database is located in ~/.cache/bma/checksums/checksums.sqlite
+        """
+        if file_path is None:
+            file_path = os.path.join(get_cache_directory('checksums'), 'checksums.sqlite')
+
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        # Several processes may use the cache at the same time: wait for locks instead of failing
+        self._connection = sqlite3.connect(file_path, timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS checksums ('
+            'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, checksum TEXT)')
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, file_path, stat):
+        """
+        Returns the cached checksum of a file, or None if the file is unknown or changed since it was hashed
+        @param stat: result of os.stat for the file
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT checksum FROM checksums WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?',
+                (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, stat.st_ino)).fetchone()
+
+        return row[0] if row is not None else None
+
+    def set(self, file_path, stat, checksum):
+        """
+        Stores the checksum of a file
+        Changes are written to disk by commit()
+        @param stat: result of os.stat for the file, taken before the file was hashed
+        """
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO checksums (path, size, mtime_ns, inode, checksum) VALUES (?, ?, ?, ?, ?)',
+                (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, stat.st_ino, checksum))
+
+    def commit(self):
+        """
+        Writes pending changes to disk
+        """
+        with self._lock:
+            self._connection.commit()
+
+    def clear(self, dir_path=None):
+        """
+        Deletes all entries, or only the entries for files located in a given folder (and its sub-folders)
+        Returns the number of deleted entries
+        """
+        with self._lock:
+            if dir_path is None:
+                cursor = self._connection.execute('DELETE FROM checksums')
+            else:
+                dir_path = os.path.join(os.path.abspath(dir_path), '')
+                pattern = dir_path.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                cursor = self._connection.execute("DELETE FROM checksums WHERE path LIKE ? ESCAPE '\\'", (pattern,))
+
+            self._connection.commit()
+
+        return cursor.rowcount
+
+    def close(self):
+        """
+        Writes pending changes to disk and closes the database
+        """
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
@@ -0,0 +1,138 @@
+"""
+Streaming compression of files (e.g., back-up artifacts) with gzip, bz2 or xz
+
+Data is compressed in blocks of fixed size, each one a complete gzip member, bz2 stream or xz stream. Concatenated
+members are valid files for the standard tools (gunzip, bunzip2, unxz) and for the gzip, bz2 and lzma modules.
+Blocks are compressed in parallel threads, as the compressors release the GIL, while the input is still being read.
+The output only depends on the data, the codec and the level (gzip headers carry no timestamp), so that an unchanged
+file always gets the same checksum.
+"""
+import bz2
+import gzip
+import lzma
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Size of the blocks that are compressed independently (in bytes)
+COMPRESSION_BLOCK_SIZE = 16 * 1024 ** 2
+
+# Codec -> (file name suffix, default level, function that compresses a block, function that opens a compressed file)
+CODECS = {
+    'gzip': ('.gz', 6, lambda data, level: gzip.compress(data, compresslevel=level, mtime=0), gzip.open),
+    'bz2': ('.bz2', 9, lambda data, level: bz2.compress(data, compresslevel=level), bz2.open),
+    'xz': ('.xz', 6, lambda data, level: lzma.compress(data, preset=level), lzma.open)
+}
+
+
+def get_codec(filename):
+    """
+    Returns the codec of a compressed file from its name (e.g., 'gzip' for 'sqlite.db.gz'), or None
+    """
+    for codec, (suffix, _, _, _) in CODECS.items():
+        if filename.endswith(suffix):
+            return codec
+
+    return None
+
+
+def get_compressed_filename(filename, codec):
+    """
+    Returns the name of a file once compressed, e.g., 'sqlite.db.gz'
+    """
+    return filename + CODECS[codec][0]
+
+
+def compress_chunks(chunks, codec='gzip', level=None, jobs=1, block_size=COMPRESSION_BLOCK_SIZE):
+    """
+    Compresses a stream of chunks (e.g., a download or a file read in blocks) and yields the compressed blocks in order
+    Up to 'jobs' blocks are compressed at the same time; at most 2 * 'jobs' blocks are held in memory
+    """
+    _, default_level, compress, _ = CODECS[codec]
+    level = default_level if level is None else level
+
+    def get_blocks():
+        buffer = bytearray()
+        empty = True
+
+        for chunk in chunks:
+            buffer += chunk
+
+            while len(buffer) >= block_size:
+                empty = False
+                yield bytes(buffer[:block_size])
+                del buffer[:block_size]
+
+        # An empty input still gives a valid (empty) compressed file
+        if buffer or empty:
+            yield bytes(buffer)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+
+        for block in get_blocks():
+            pending.append(executor.submit(compress, block, level))
+
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def read_chunks(file_path, chunk_size=COMPRESSION_BLOCK_SIZE):
+    """
+    Yields the contents of a file in chunks
+    """
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def compress_file(file_path, codec='gzip', level=None, jobs=1, remove=True):
+    """
+    Compresses a file next to it (e.g., sqlite.db -> sqlite.db.gz) and, if 'remove' is True, removes the original
+    Returns the path to the compressed file
+    """
+    compressed_file_path = get_compressed_filename(file_path, codec)
+
+    with open(compressed_file_path, 'wb') as f:
+        for block in compress_chunks(read_chunks(file_path), codec, level, jobs):
+            f.write(block)
+
+    if remove:
+        os.remove(file_path)
+
+    return compressed_file_path
+
+
+def open_decompressed(file_path):
+    """
+    Opens a file for reading, decompressing it on the fly if its suffix is that of a codec (e.g., .gz)
+    """
+    codec = get_codec(file_path)
+
+    return open(file_path, 'rb') if codec is None else CODECS[codec][3](file_path, 'rb')
+
+
+def decompress_file(file_path, output_file_path=None, chunk_size=1024 ** 2):
+    """
+    Decompresses a file compressed with gzip, bz2 or xz (detected from its suffix), e.g., after downloading a back-up
+    By default, the output is written next to the input, without the suffix
+    Returns the path to the decompressed file
+    """
+    codec = get_codec(file_path)
+
+    if codec is None:
+        raise ValueError(f'Unknown compression for {file_path}: expected one of .gz, .bz2, .xz')
+
+    suffix, _, _, open_compressed = CODECS[codec]
+
+    if output_file_path is None:
+        output_file_path = file_path[:-len(suffix)]
+
+    with open_compressed(file_path, 'rb') as f_in, open(output_file_path, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out, chunk_size)
+
+    return output_file_path
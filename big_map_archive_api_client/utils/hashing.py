@@ -0,0 +1,155 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BUFFER_SIZE = 1024 * 1024  # in byte
+
+
+def compute_checksum(file_path, buffer_size=BUFFER_SIZE):
+    """
+    Computes the md5 hash of a file, in the format used by the archive (e.g., 'md5:...')
+    The file is read in large blocks into a reused buffer; hashlib releases the GIL while hashing them
+    """
+    with open(file_path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):  # Python >= 3.11
+            file_hash = hashlib.file_digest(f, 'md5')
+        else:
+            file_hash = hashlib.md5()
+            buffer = bytearray(buffer_size)
+            view = memoryview(buffer)
+            while n := f.readinto(buffer):
+                file_hash.update(view[:n])
+
+    return 'md5:' + file_hash.hexdigest()
+
+
+class HashingStats:
+    """Throughput of a ChecksumEngine run"""
+
+    def __init__(self, files=0, size=0, seconds=0.0):
+        """
+        Initializes internal fields
+        """
+        self.files = files
+        self.size = size
+        self.seconds = seconds
+
+    @property
+    def throughput(self):
+        """
+        Returns the number of bytes hashed per second
+        """
+        return self.size / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return f'{self.files} file(s), {self.size / 1e6:.1f} MB hashed in {self.seconds:.2f} s ({self.throughput / 1e6:.1f} MB/s)'
+
+
+class ChecksumEngine:
+    """
+    Computes the md5 hashes of many files in parallel
+    Files of at least 'large_file_threshold' bytes are hashed by a separate pool of workers, so that a few multi-GB files do not hold up all other files
+    Threads are used rather than processes, as hashing and reading from disk both release the GIL
+    """
+
+    def __init__(self, jobs=None, large_file_jobs=None, large_file_threshold=256 * 1024 ** 2, buffer_size=BUFFER_SIZE):
+        """
+        Initializes internal fields
+        By default, there is one worker per CPU for small files and half as many for large files
+        """
+        self.jobs = jobs or os.cpu_count() or 1
+        self.large_file_jobs = large_file_jobs or max(1, self.jobs // 2)
+        self.large_file_threshold = large_file_threshold
+        self.buffer_size = buffer_size
+        self.stats = HashingStats()
+        self._lock = threading.Lock()
+
+    def compute(self, file_paths):
+        """
+        Computes the checksums of files
+        Returns a dictionary mapping each file path to its checksum (e.g., 'md5:...')
+        The throughput of the run is available afterwards in the 'stats' attribute
+        """
+        path_to_size = {file_path: os.path.getsize(file_path) for file_path in file_paths}
+        large_file_paths = [p for p, size in path_to_size.items() if size >= self.large_file_threshold]
+        small_file_paths = [p for p, size in path_to_size.items() if size < self.large_file_threshold]
+
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.large_file_jobs) as large_file_executor, \
+                ThreadPoolExecutor(max_workers=self.jobs) as small_file_executor:
+            # Largest files first, so that they do not end up running alone at the end
+            path_to_future = {
+                file_path: large_file_executor.submit(compute_checksum, file_path, self.buffer_size)
+                for file_path in sorted(large_file_paths, key=path_to_size.get, reverse=True)
+            }
+            path_to_future.update({
+                file_path: small_file_executor.submit(compute_checksum, file_path, self.buffer_size)
+                for file_path in small_file_paths
+            })
+
+            path_to_checksum = {file_path: future.result() for file_path, future in path_to_future.items()}
+
+        with self._lock:
+            self.stats = HashingStats(len(path_to_checksum), sum(path_to_size.values()), time.perf_counter() - start)
+
+        return path_to_checksum
+
+
+class HashingReader:
+    """
+    File-like object that computes the md5 hash of a file while it is read, e.g., while it is streamed as a request body
+    This avoids reading a file from disk twice: once for hashing it and once for uploading it
+    """
+
+    def __init__(self, f):
+        """
+        Initializes internal fields
+        @param f: file object opened in binary mode
+        """
+        self._file = f
+        self._start = f.tell()
+        self._size = os.fstat(f.fileno()).st_size - self._start
+        self._hash = hashlib.md5()
+
+    def __len__(self):
+        """
+        Returns the number of bytes to read from the start, which sets the request's Content-Length
+        """
+        return self._size
+
+    def read(self, n=-1):
+        """
+        Reads up to n bytes and adds them to the hash
+        """
+        chunk = self._file.read(n)
+        self._hash.update(chunk)
+        return chunk
+
+    def seek(self, position, whence=os.SEEK_SET):
+        """
+        Moves back to the start of the file, e.g., before sending a request again
+        Only rewinding is supported, as the hash cannot skip bytes
+        """
+        if position != 0 or whence != os.SEEK_SET:
+            raise OSError('HashingReader can only be rewound to the start')
+
+        self._file.seek(self._start)
+        self._hash = hashlib.md5()
+
+        return 0
+
+    def tell(self):
+        """
+        Returns the position relative to the start
+        """
+        return self._file.tell() - self._start
+
+    @property
+    def checksum(self):
+        """
+        Returns the md5 hash of the bytes read so far, in the format used by the archive (e.g., 'md5:...')
+        """
+        return 'md5:' + self._hash.hexdigest()
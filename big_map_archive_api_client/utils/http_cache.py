@@ -0,0 +1,301 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from .requests import get_cache_directory
+
+# Uploads of file contents (whole files or parts) do not change any cached response until the file is committed
+_CONTENT_UPLOAD_PATH = re.compile(r'^/api/records/[^/]+/draft/files/[^/]+/content(/[^/]+)?$')
+_RECORD_PATH = re.compile(r'^/api/records/([^/?]+)')
+
+# Searches whose results change when any record is modified
+_SEARCH_PATHS = ('/api/records?', '/api/user/records?')
+
+
+def get_modified_prefixes(url):
+    """
+    Returns the URLs of the cached responses that a request modifying data at 'url' may make outdated: those of the
+    modified record (e.g., https://<domain>/api/records/<id>, and prefixes for its draft, files and versions) and of
+    the searches for records; see HTTPCache.expire()
+    Returns an empty list for uploads of file contents
+    """
+    parts = urlsplit(url)
+    base_url = f'{parts.scheme}://{parts.netloc}'
+
+    if _CONTENT_UPLOAD_PATH.match(parts.path):
+        return []
+
+    prefixes = [base_url + path for path in _SEARCH_PATHS]
+    match = _RECORD_PATH.match(parts.path)
+
+    if match is not None:
+        record_url = f'{base_url}/api/records/{match.group(1)}'
+        prefixes += [record_url, record_url + '/', record_url + '?']
+
+    return prefixes
+
+
+class HTTPCacheEntry:
+    """
+    Response to a GET request stored by HTTPCache
+    """
+
+    def __init__(self, url, body, etag, last_modified, content_type, expires):
+        """
+        Initializes internal fields
+        """
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.expires = expires
+
+    def is_fresh(self):
+        """
+        Returns True if the entry can be used without asking the server whether it changed
+        """
+        return time.time() < self.expires
+
+    def get_validators(self):
+        """
+        Returns the headers that make a GET request conditional on the entry being outdated
+        """
+        headers = {}
+
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+
+        return headers
+
+    def to_response(self):
+        """
+        Returns the entry as a requests.Response object with status code 200
+        """
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = self.url
+        response._content = self.body
+        response.headers = CaseInsensitiveDict({'Content-Type': self.content_type or 'application/json'})
+
+        if self.etag is not None:
+            response.headers['ETag'] = self.etag
+
+        if self.last_modified is not None:
+            response.headers['Last-Modified'] = self.last_modified
+
+        return response
+
+
+class HTTPCache:
+    """
+    On-disk cache of the responses to GET requests, indexed in a SQLite database
+    An entry is served without a request for the TTL of its endpoint, then revalidated with its ETag or Last-Modified header
+    Entries are evicted in least recently used order once the bodies take more than 'max_size' bytes
+    """
+
+    def __init__(self, dir_path=None, max_size=100 * 1024 ** 2, ttls=None):
+        """
+        Initializes internal fields
+        By default, the cache is located in ~/.cache/bma/http
+        @param ttls: mapping from path prefixes (e.g., '/api/communities') to the number of seconds during which
+        responses are served without revalidation; the longest matching prefix applies, other responses are always revalidated
+        """
+        if dir_path is None:
+            dir_path = get_cache_directory('http')
+
+        self.dir_path = dir_path
+        self.max_size = max_size
+        self.ttls = dict(ttls or {})
+        self._bodies_dir_path = os.path.join(dir_path, 'bodies')
+        os.makedirs(self._bodies_dir_path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Several processes may use the cache at the same time: wait for locks instead of failing
+        self._connection = sqlite3.connect(os.path.join(dir_path, 'index.sqlite'), timeout=30, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT, content_type TEXT, '
+            'size INTEGER, expires REAL, accessed REAL)')
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _key(url, token):
+        # Responses depend on the user, but the token itself is never written to disk
+        return hashlib.sha256(f'{token}\n{url}'.encode()).hexdigest()
+
+    def _body_path(self, key):
+        return os.path.join(self._bodies_dir_path, key)
+
+    def get_ttl(self, url):
+        """
+        Returns the number of seconds during which a response for a URL is served without revalidation
+        """
+        path = urlsplit(url).path
+        prefixes = [prefix for prefix in self.ttls if path.startswith(prefix)]
+
+        return self.ttls[max(prefixes, key=len)] if prefixes else 0
+
+    def get(self, url, token):
+        """
+        Returns the cached response for a URL as an HTTPCacheEntry object, or None if there is none
+        """
+        key = self._key(url, token)
+
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT etag, last_modified, content_type, expires FROM responses WHERE key = ?', (key,)).fetchone()
+
+            if row is None:
+                return None
+
+            try:
+                with open(self._body_path(key), 'rb') as f:
+                    body = f.read()
+            except FileNotFoundError:
+                # The body was evicted by another process
+                self._connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._connection.commit()
+                return None
+
+            self._connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+            self._connection.commit()
+
+        etag, last_modified, content_type, expires = row
+
+        return HTTPCacheEntry(url, body, etag, last_modified, content_type, expires)
+
+    def set(self, url, token, response):
+        """
+        Stores the response to a GET request if it can be reused, i.e., it succeeded and it has a validator or a TTL
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        ttl = self.get_ttl(url)
+
+        if response.status_code != 200 or 'no-store' in response.headers.get('Cache-Control', ''):
+            return
+
+        if etag is None and last_modified is None and ttl == 0:
+            return
+
+        key = self._key(url, token)
+        body = response.content
+
+        if len(body) > self.max_size:
+            return
+
+        temp_path = f'{self._body_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+        with open(temp_path, 'wb') as f:
+            f.write(body)
+
+        os.replace(temp_path, self._body_path(key))
+        now = time.time()
+
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses (key, url, etag, last_modified, content_type, size, expires, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, url, etag, last_modified, response.headers.get('Content-Type'), len(body), now + ttl, now))
+            self._evict()
+            self._connection.commit()
+
+    def refresh(self, url, token):
+        """
+        Marks the cached response for a URL as up to date, e.g., after the server answered 304 Not Modified
+        """
+        with self._lock:
+            self._connection.execute(
+                'UPDATE responses SET expires = ? WHERE key = ?', (time.time() + self.get_ttl(url), self._key(url, token)))
+            self._connection.commit()
+
+    def expire(self, prefixes=None):
+        """
+        Marks cached responses as outdated, so that they are revalidated before being served again: all of them if
+        'prefixes' is None, otherwise those whose URL starts with one of the prefixes that end with '/' or '?' or is
+        equal to one of the others
+        Called after a request that modifies data on the archive, with the prefixes from get_modified_prefixes()
+        """
+        if prefixes is not None and not prefixes:
+            return
+
+        condition = 'expires > ?'
+        parameters = [time.time()]
+
+        if prefixes is not None:
+            condition += ' AND (' + ' OR '.join('substr(url, 1, ?) = ?' if prefix[-1] in '/?' else 'url = ?'
+                                                for prefix in prefixes) + ')'
+            parameters += [value for prefix in prefixes
+                           for value in ((len(prefix), prefix) if prefix[-1] in '/?' else (prefix,))]
+
+        with self._lock:
+            # Most writes make no fresh entry outdated: they only read the index, without a write transaction
+            if self._connection.execute(f'SELECT 1 FROM responses WHERE {condition} LIMIT 1', parameters).fetchone():
+                self._connection.execute(f'UPDATE responses SET expires = 0 WHERE {condition}', parameters)
+                self._connection.commit()
+
+    def _evict(self):
+        # Deletes the least recently used entries until the bodies fit in max_size
+        total_size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+        if total_size <= self.max_size:
+            return
+
+        for key, size in self._connection.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            self._connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+            try:
+                os.remove(self._body_path(key))
+            except FileNotFoundError:
+                pass
+
+            total_size -= size
+
+            if total_size <= self.max_size:
+                break
+
+    def clear(self):
+        """
+        Deletes all entries
+        Returns the number of deleted entries
+        """
+        with self._lock:
+            keys = [key for key, in self._connection.execute('SELECT key FROM responses')]
+            self._connection.execute('DELETE FROM responses')
+            self._connection.commit()
+
+        for key in keys:
+            try:
+                os.remove(self._body_path(key))
+            except FileNotFoundError:
+                pass
+
+        return len(keys)
+
+    def close(self):
+        """
+        Closes the database
+        """
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
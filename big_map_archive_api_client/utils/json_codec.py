@@ -0,0 +1,212 @@
+"""
+JSON encoding and decoding for API payloads and exported files
+
+orjson is used when it is installed and the standard library otherwise. orjson formats some values differently
+(e.g., 0.00001 for 1e-05, UTF-8 for \\u00e9, 2-space indentation) and cannot encode integers beyond 64 bits:
+dumps_pretty() rewrites its output to match the standard library byte for byte, or leaves the object to the standard
+library, so that the checksum of an exported file does not depend on the installed packages. Hashes of exported items
+are always encoded with the standard library. NaN and Infinity decoded by loads() are encoded back as NaN and Infinity.
+Documents are decoded to the same values with both libraries. ijson, when installed, decodes documents incrementally.
+"""
+import codecs
+import json
+import re
+import textwrap
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson
+except ImportError:  # Optional dependency, see the 'speedups' extra in setup.py
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # Optional dependency, see the 'speedups' extra in setup.py
+    ijson = None
+
+# orjson decodes integers beyond 64 bits as floats: documents with such long numbers are decoded by the standard library
+_LONG_NUMBER = re.compile(rb'\d{20}')
+_LONG_NUMBER_TEXT = re.compile(r'\d{20}')
+
+# Marks the levels of indentation while dumps_pretty() rewrites the output of orjson; control characters are always
+# escaped in JSON strings, so that the marker only appears in the indentation
+_INDENT_MARKER = b'\x01'
+
+
+def _escape_non_ascii(error):
+    # Same escapes as the standard library, e.g., \\u00e9, and surrogate pairs beyond the BMP
+    return encode_basestring_ascii(error.object[error.start:error.end])[1:-1], error.end
+
+
+codecs.register_error('bma-json-escape', _escape_non_ascii)
+
+
+class _NonFiniteFloat(float):
+    """
+    NaN or Infinity decoded by the standard library; orjson refuses to encode float subclasses, so that these values
+    are left to the standard library, which writes them back as NaN or Infinity instead of null
+    """
+
+
+def _has_long_number(data):
+    pattern = _LONG_NUMBER_TEXT if isinstance(data, str) else _LONG_NUMBER
+    return pattern.search(data) is not None
+
+
+def loads(data):
+    """
+    Decodes a JSON document from bytes or a string
+    The values are the same with orjson and with the standard library, including integers beyond 64 bits and NaN
+    """
+    if orjson is not None and not _has_long_number(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # E.g., NaN or Infinity, which the standard library accepts
+
+    return json.loads(data, parse_constant=_NonFiniteFloat)
+
+
+def dumps(obj):
+    """
+    Encodes an object as a compact JSON document, e.g., for a request payload
+    The output may differ between orjson and the standard library: use dumps_canonical() for hashes
+    Returns bytes
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass  # E.g., an integer beyond 64 bits
+
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_canonical(obj):
+    """
+    Encodes an object as a compact JSON document with sorted keys, always with the standard library, e.g., to hash it
+    Returns bytes
+    """
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def _has_number_to_reformat(data):
+    # Numbers that orjson formats differently from the standard library (e.g., 1e16 for 1e+16, 0.00001 for 1e-05):
+    # outside strings, the letter e only appears in true, false and exponents
+    outside_strings = b''.join(data.replace(b'\\\\', b'').replace(b'\\"', b'').split(b'"')[0::2])
+
+    return (b'0.0000' in outside_strings
+            or outside_strings.count(b'e') != outside_strings.count(b'true') + outside_strings.count(b'false'))
+
+
+def _reindent(data, prefix):
+    # Doubles the indentation of every line (orjson indents by 2 spaces) and prepends 'prefix', deepest lines first
+    depth = 0
+
+    while b'\n' + b'  ' * (depth + 1) in data:
+        depth += 1
+
+    for level in range(depth, 0, -1):
+        data = data.replace(b'\n' + b'  ' * level, b'\n' + _INDENT_MARKER * level)
+
+    if prefix:
+        data = data.replace(b'\n', b'\n' + prefix)
+
+    return data.replace(_INDENT_MARKER, b'    ')
+
+
+def _dumps_pretty_with_orjson(obj):
+    # Returns the output of json.dumps(obj, indent=4, sort_keys=True) with the indentation of orjson, or None if
+    # orjson cannot produce the same output
+    try:
+        data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                            | orjson.OPT_PASSTHROUGH_DATACLASS)
+    except TypeError:
+        return None  # E.g., an integer beyond 64 bits, NaN decoded by loads(), or a key that is not a string
+
+    if _has_number_to_reformat(data):
+        return None
+
+    if b'null' in data:
+        try:
+            # orjson encodes NaN and Infinity as null; this check runs in the C encoder of the standard library
+            json.dumps(obj, allow_nan=False, check_circular=False)
+        except (TypeError, ValueError):
+            return None
+
+    if b'\x7f' in data:
+        data = data.replace(b'\x7f', b'\\u007f')
+
+    if not data.isascii():
+        data = data.decode('utf-8').encode('ascii', 'bma-json-escape')
+
+    return data
+
+
+def dumps_pretty(obj, level=0):
+    """
+    Encodes an object as a JSON document indented by 4 spaces, with sorted keys and non-ASCII characters escaped, e.g.,
+    for an exported file; every line is indented by 'level' more levels, e.g., for an item of an exported array
+    The output is the same as that of json.dumps(obj, indent=4, sort_keys=True), but is produced with orjson if possible
+    Returns bytes
+    """
+    if orjson is not None:
+        data = _dumps_pretty_with_orjson(obj)
+
+        if data is not None:
+            prefix = b'    ' * level
+            return prefix + _reindent(data, prefix)
+
+    text = json.dumps(obj, indent=4, sort_keys=True)
+
+    return (textwrap.indent(text, '    ' * level) if level else text).encode('ascii')
+
+
+def dumps_pretty_items(items, level=1):
+    """
+    Encodes a list of items as the lines of an array nested 'level' levels deep (at least 1) in an exported file: each
+    item as by dumps_pretty(item, level), separated by commas and line breaks
+    Encoding a page of items at once is much faster than encoding the items one by one
+    Returns bytes
+    """
+    if not items:
+        return b''
+
+    if orjson is not None:
+        data = _dumps_pretty_with_orjson(items)
+
+        if data is not None:
+            # The items are the lines of the encoded array, without its brackets, 1 level deep
+            prefix = b'    ' * (level - 1)
+            return _reindent(data[1:-2], prefix)[1:]
+
+    return b',\n'.join(dumps_pretty(item, level) for item in items)
+
+
+def iter_items(f, prefix):
+    """
+    Iterates over the items of an array located at 'prefix' in a JSON document (e.g., 'hits.hits' for search results)
+    With ijson, the document is read from the binary file object 'f' incrementally and never held in memory as a whole
+    Without ijson, the whole document is decoded first
+    """
+    count = 0
+
+    if ijson is not None:
+        start = f.tell()
+
+        try:
+            for item in ijson.items(f, f'{prefix}.item' if prefix else 'item', use_float=True):
+                yield item
+                count += 1
+
+            return
+        except ijson.JSONError:
+            # E.g., NaN or an integer beyond 64 bits, which ijson rejects: the rest is decoded by loads()
+            f.seek(start)
+
+    document = loads(f.read())
+
+    for key in prefix.split('.') if prefix else []:
+        document = document[key]
+
+    yield from document[count:]
@@ -0,0 +1,339 @@
+"""
+Conversion of partial metadata files (YAML) into the metadata of records
+
+Each file is parsed once with the libyaml loader, when available, and the parsed contents is kept in memory until the
+file is modified. Licenses, resource types and reference schemes are read from immutable tables.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from types import MappingProxyType
+
+import yaml
+
+# Parser implemented in C (libyaml), if PyYAML was built with it
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def _freeze(value):
+    # Read-only view of nested dictionaries and lists
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    # New, modifiable copy of a frozen value
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+RESOURCE_TYPES = _freeze({
+    'Dataset': {'id': 'dataset', 'title': {'en': 'Dataset'}},
+    'Software': {'id': 'software', 'title': {'en': 'Software'}},
+    'Other': {'id': 'other', 'title': {'en': 'Other'}}
+})
+
+LICENSES = _freeze({
+    'BIG-MAP Archive License': {
+        'description': {
+            'en': 'The BIG-MAP Archive License allows re-distribution and re-use of work within the BIG-MAP community.'
+        },
+        'icon': '',
+        'id': 'bm-1.0',
+        'props': {'scheme': 'spdx', 'url': 'https://www.big-map.eu/'},
+        'title': {'en': 'BIG-MAP Archive License'}
+    },
+    'Creative Commons Attribution Share Alike 4.0 International': {
+        'description': {
+            'en': 'Permits almost any use subject to providing credit and license notice. Frequently used for media assets and educational materials. The most common license for Open Access scientific publications. Not recommended for software.'
+        },
+        'icon': 'cc-by-sa-icon',
+        'id': 'cc-by-sa-4.0',
+        'props': {'scheme': 'spdx', 'url': 'https://creativecommons.org/licenses/by-sa/4.0/legalcode'},
+        'title': {'en': 'Creative Commons Attribution Share Alike 4.0 International'}
+    },
+    'MIT License': {
+        'description': {
+            'en': 'A short and simple permissive license with conditions only requiring preservation of copyright and license notices. Licensed works, modifications, and larger works may be distributed under different terms and without source code.'
+        },
+        'icon': '',
+        'id': 'mit',
+        'props': {'scheme': 'spdx', 'url': 'https://opensource.org/licenses/MIT'},
+        'title': {'en': 'MIT License'}
+    }
+})
+
+REFERENCE_SCHEMES = frozenset(['arxiv', 'doi', 'isbn', 'url'])
+
+RELATION_TYPE_REFERENCES = _freeze({'id': 'references', 'title': {'en': 'References'}})
+
+REQUIRED_FIELDS = _freeze({
+    'resource_type': str,
+    'title': str,
+    'authors': list,
+    'description': str,
+    'license': str,
+    'keywords': list,
+    'references': list
+})
+
+# Maximum number of parsed files kept in memory
+MAX_CACHED_FILES = 10000
+
+_cache = {}  # Absolute path -> (mtime in ns, size, parsed contents)
+_cache_lock = threading.Lock()
+
+
+def load_metadata_file(metadata_file_path):
+    """
+    Parses a YAML metadata file, or returns the parsed contents from a previous call if the file was not modified since
+    The returned object is shared between calls and should not be modified
+    """
+    metadata_file_path = os.path.abspath(metadata_file_path)
+    stat = os.stat(metadata_file_path)
+
+    with _cache_lock:
+        cached = _cache.get(metadata_file_path)
+
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    with open(metadata_file_path, 'rb') as f:
+        partial_metadata = yaml.load(f, Loader=SafeLoader)
+
+    _store(metadata_file_path, stat.st_mtime_ns, stat.st_size, partial_metadata)
+
+    return partial_metadata
+
+
+def _store(metadata_file_path, mtime_ns, size, partial_metadata):
+    with _cache_lock:
+        _cache.pop(metadata_file_path, None)
+
+        if len(_cache) >= MAX_CACHED_FILES:
+            del _cache[next(iter(_cache))]
+
+        _cache[metadata_file_path] = (mtime_ns, size, partial_metadata)
+
+
+def validate_partial_metadata(partial_metadata):
+    """
+    Checks that a partial metadata has all required fields, with the expected types and accepted values
+    Raises an exception otherwise
+    """
+    if not isinstance(partial_metadata, dict):
+        raise Exception('The input metadata file does not contain a mapping')
+
+    for field, expected_type in REQUIRED_FIELDS.items():
+        if field not in partial_metadata:
+            raise Exception(f'Missing field {field} in the input metadata file')
+
+        if not isinstance(partial_metadata[field], expected_type):
+            raise Exception(f'Invalid value for {field} in the input metadata file: {expected_type.__name__} expected')
+
+    if partial_metadata['resource_type'] not in RESOURCE_TYPES:
+        raise Exception(f'Invalid resource type {partial_metadata["resource_type"]} in the input metadata file')
+
+    if partial_metadata['license'] not in LICENSES:
+        raise Exception(f'Invalid license {partial_metadata["license"]} in the input metadata file')
+
+    for reference in partial_metadata['references']:
+        if reference['scheme'] not in REFERENCE_SCHEMES:
+            raise Exception(f'Invalid reference scheme {reference["scheme"]} in the input metadata file')
+
+
+def insert_resource_type(full_metadata, partial_metadata):
+    """
+    Inserts a resource type that was extracted from a 'partial' metadata into a 'full' metadata
+    Raises an exception if the extracted resource type is different from 'Dataset', 'Software', or 'Other'
+    """
+    resource_type = RESOURCE_TYPES.get(partial_metadata['resource_type'])
+
+    if resource_type is None:
+        raise Exception(f'Invalid resource type {partial_metadata["resource_type"]} in the input metadata file')
+
+    full_metadata['metadata']['resource_type'] = _thaw(resource_type)
+
+    return full_metadata
+
+
+def insert_creators(full_metadata, partial_metadata):
+    """
+    Inserts creators (i.e., authors) that were extracted from a 'partial' metadata into a 'full' metadata
+    """
+    full_metadata['metadata']['creators'] = [
+        {
+            'affiliations': [{'name': affiliation} for affiliation in author['affiliations']],
+            'person_or_org': {
+                'family_name': author['family_name'],
+                'given_name': author['given_name'],
+                'name': author['family_name'] + ', ' + author['given_name'],
+                'type': 'personal'
+            }
+        } for author in partial_metadata['authors']
+    ]
+
+    return full_metadata
+
+
+def insert_rights(full_metadata, partial_metadata):
+    """
+    Inserts a right (i.e., a license) that was extracted from a 'partial' metadata into a 'full' metadata. Only the following licenses are accepted:
+      - 'BIG-MAP Archive License'
+      - 'Creative Commons Attribution Share Alike 4.0 International'
+      - 'MIT License'
+    """
+    right = LICENSES.get(partial_metadata['license'])
+
+    if right is None:
+        raise Exception(f'Invalid license {partial_metadata["license"]} in the input metadata file')
+
+    full_metadata['metadata']['rights'] = [_thaw(right)]
+
+    return full_metadata
+
+
+def insert_subjects(full_metadata, partial_metadata):
+    """
+    Inserts subjects (i.e., keywords) that were extracted from a 'partial' metadata into a 'full' metadata
+    """
+    full_metadata['metadata']['subjects'] = [{'subject': keyword} for keyword in partial_metadata['keywords']]
+
+    return full_metadata
+
+
+def insert_related_identifiers(full_metadata, partial_metadata):
+    """
+    Inserts related identifiers (i.e., references) that were extracted from a 'partial' metadata into a 'full' metadata. Only the following reference schemes are accepted:
+      - 'arxiv'
+      - 'doi'
+      - 'isbn'
+      - 'url'
+    """
+    references = partial_metadata['references']
+
+    for reference in references:
+        if reference['scheme'] not in REFERENCE_SCHEMES:
+            raise Exception(f'Invalid reference scheme {reference["scheme"]} in the input metadata file')
+
+    full_metadata['metadata']['related_identifiers'] = [
+        {
+            'identifier': reference['identifier'],
+            'relation_type': _thaw(RELATION_TYPE_REFERENCES),
+            'scheme': reference['scheme']
+        } for reference in references
+    ]
+
+    return full_metadata
+
+
+def insert_metadata(full_metadata, partial_metadata):
+    """
+    Inserts all fields extracted from a 'partial' metadata into a 'full' metadata
+    """
+    full_metadata = insert_resource_type(full_metadata, partial_metadata)
+    full_metadata['metadata']['title'] = partial_metadata['title']
+    full_metadata = insert_creators(full_metadata, partial_metadata)
+    full_metadata['metadata']['description'] = partial_metadata['description']
+    full_metadata = insert_rights(full_metadata, partial_metadata)
+    full_metadata = insert_subjects(full_metadata, partial_metadata)
+    full_metadata = insert_related_identifiers(full_metadata, partial_metadata)
+
+    return full_metadata
+
+
+def build_full_metadata(partial_metadata):
+    """
+    Builds a record's full metadata from a partial metadata
+    """
+    full_metadata = {
+        'files': {
+            'enabled': True
+        },
+        'metadata': {
+            'resource_type': None,
+            'title': '',
+            'creators': [],
+            'description': '',
+            'rights': [],
+            'subjects': [],
+            'related_identifiers': [],
+            'publisher': 'BIG-MAP Archive'
+        }
+    }
+
+    return insert_metadata(full_metadata, partial_metadata)
+
+
+def _convert_metadata_file(metadata_file_path):
+    # Runs in a worker process: the parsed contents is sent back so that the parent process caches it
+    try:
+        stat = os.stat(metadata_file_path)
+
+        with open(metadata_file_path, 'rb') as f:
+            partial_metadata = yaml.load(f, Loader=SafeLoader)
+
+        validate_partial_metadata(partial_metadata)
+
+        return stat.st_mtime_ns, stat.st_size, partial_metadata, build_full_metadata(partial_metadata), None
+    except yaml.YAMLError as e:
+        return None, None, None, None, f'Invalid YAML syntax: {str(e)}'
+    except KeyError as e:
+        return None, None, None, None, f'Missing field {e.args[0]} in the input metadata file'
+    except Exception as e:
+        return None, None, None, None, str(e)
+
+
+def convert_metadata_files(base_dir_path, metadata_file_paths, max_workers=None, fail_fast=True):
+    """
+    Validates and converts many metadata files into full metadata, in parallel processes, before any request is sent
+    All files are first checked to exist, which is cheap, then parsed and validated
+    Returns a list of full metadata, in the order of the input paths
+    Raises an exception naming the first invalid file if 'fail_fast' is True (the pending files are not parsed),
+    otherwise naming all invalid files
+    """
+    file_paths = [os.path.abspath(os.path.join(base_dir_path, p)) for p in metadata_file_paths]
+
+    for file_path in file_paths:
+        if not os.path.isfile(file_path):
+            raise Exception(f'Metadata file {file_path} not found')
+
+    results = [None] * len(file_paths)
+    errors = []
+
+    def collect(index, result):
+        mtime_ns, size, partial_metadata, full_metadata, error = result
+
+        if error is not None:
+            errors.append(f'Invalid metadata file {file_paths[index]}. {error}')
+            return fail_fast
+
+        _store(file_paths[index], mtime_ns, size, partial_metadata)
+        results[index] = full_metadata
+        return False
+
+    # A few files are converted faster than worker processes are started
+    if max_workers == 1 or len(file_paths) < 64:
+        for index, file_path in enumerate(file_paths):
+            if collect(index, _convert_metadata_file(file_path)):
+                break
+    else:
+        max_workers = max_workers or os.cpu_count() or 1
+        chunksize = max(1, min(64, len(file_paths) // (4 * max_workers)))
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for index, result in enumerate(executor.map(_convert_metadata_file, file_paths, chunksize=chunksize)):
+                if collect(index, result):
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+
+    if errors:
+        raise Exception('\n'.join(errors))
+
+    return results
@@ -0,0 +1,131 @@
+import hashlib
+import queue
+import threading
+
+# Size of the chunks read from the source, e.g., from a download (in bytes)
+PIPE_CHUNK_SIZE = 1024 ** 2
+
+# Maximum number of bytes held in memory between the source and the reader
+PIPE_BUFFER_SIZE = 16 * 1024 ** 2
+
+_END = object()
+
+
+class HashingPipe:
+    """
+    File-like object that streams the chunks of a source (e.g., a download) to a reader (e.g., an upload) while
+    computing their md5 hash
+    The source is consumed by a background thread into a bounded buffer: when the buffer is full, the thread waits for
+    the reader, which in turn slows down the source (backpressure)
+    The pipe cannot be rewound, so a request that sends it as a body is never resent
+    """
+
+    def __init__(self, chunks, size, buffer_size=PIPE_BUFFER_SIZE, chunk_size=PIPE_CHUNK_SIZE):
+        """
+        Initializes internal fields and starts consuming the source
+        @param chunks: iterable of bytes objects, e.g., response.iter_content(chunk_size)
+        @param size: number of bytes that the source provides, which sets the request's Content-Length
+        """
+        self._size = size
+        self._position = 0
+        self._hash = hashlib.md5()
+        self._queue = queue.Queue(maxsize=max(1, buffer_size // chunk_size))
+        self._chunk = memoryview(b'')
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._fill, args=(chunks,), daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        """
+        Returns the number of bytes that remain to be read
+        """
+        return self._size - self._position
+
+    def _put(self, item):
+        # Waits for free space in the buffer, unless the pipe was closed by the reader
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def _fill(self, chunks):
+        try:
+            for chunk in chunks:
+                if chunk and not self._put(chunk):
+                    return
+        except BaseException as e:
+            self._put(e)
+            return
+
+        self._put(_END)
+
+    def read(self, n=-1):
+        """
+        Reads up to n bytes (or up to the end if n is negative) and adds them to the hash
+        Raises the exception raised by the source, if any, or an OSError exception if the source provided fewer or more
+        bytes than announced
+        """
+        parts = []
+        remaining = n if n is not None and n >= 0 else self._size - self._position
+
+        while remaining > 0:
+            if not self._chunk:
+                item = self._queue.get()
+
+                if item is _END:
+                    self._queue.put(_END)
+
+                    if self._position != self._size:
+                        raise OSError(f'The source ended after {self._position} of {self._size} bytes')
+                    break
+
+                if isinstance(item, BaseException):
+                    raise item
+
+                self._chunk = memoryview(item)
+
+            part = self._chunk[:remaining]
+            self._chunk = self._chunk[len(part):]
+            self._position += len(part)
+
+            if self._position > self._size:
+                raise OSError(f'The source provided more than {self._size} bytes')
+
+            parts.append(part)
+            remaining -= len(part)
+
+        data = b''.join(parts)
+        self._hash.update(data)
+
+        return data
+
+    def close(self):
+        """
+        Stops consuming the source, e.g., after the upload failed
+        The background thread ends once its current read from the source returns
+        """
+        self._closed.set()
+
+        # Unblock the thread if it waits for free space
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    @property
+    def checksum(self):
+        """
+        Returns the md5 hash of the bytes read so far, in the format used by the archive (e.g., 'md5:...')
+        """
+        return 'md5:' + self._hash.hexdigest()
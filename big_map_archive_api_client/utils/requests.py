@@ -1,200 +1,91 @@
 import datetime
-import hashlib
-import json
 import os
 import shutil
+from itertools import islice
 
-import yaml
+from .hashing import ChecksumEngine
+from .json_codec import dumps_pretty, dumps_pretty_items
+from .metadata import build_full_metadata, insert_metadata, load_metadata_file
+
+# Number of items encoded at once by the exporters that write items as soon as they are available
+EXPORT_BATCH_SIZE = 100
 
 
 def generate_full_metadata(base_dir_path, metadata_file_path):
     """
     Generates a record's full metadata from a YAML file containing only partial metadata
     """
-    full_metadata = {
-        'files': {
-            'enabled': True
-        },
-        'metadata': {
-            'resource_type': None,
-            'title': '',
-            'creators': [],
-            'description': '',
-            'rights': [],
-            'subjects': [],
-            'related_identifiers': [],
-            'publisher': 'BIG-MAP Archive'
-        }
-    }
-
     metadata_file_path = os.path.join(base_dir_path, metadata_file_path)
+    partial_metadata = load_metadata_file(metadata_file_path)
 
-    with open(metadata_file_path, 'r') as f:
-        partial_metadata = yaml.safe_load(f)
-
-    full_metadata = insert_resource_type(full_metadata, partial_metadata)
-    full_metadata['metadata']['title'] = partial_metadata['title']
-    full_metadata = insert_creators(full_metadata, partial_metadata)
-    full_metadata['metadata']['description'] = partial_metadata['description']
-    full_metadata = insert_rights(full_metadata, partial_metadata)
-    full_metadata = insert_subjects(full_metadata, partial_metadata)
-    full_metadata = insert_related_identifiers(full_metadata, partial_metadata)
+    return build_full_metadata(partial_metadata)
 
-    return full_metadata
 
-
-def insert_resource_type(full_metadata, partial_metadata):
-    """
-    Inserts a resource type that was extracted from a 'partial' metadata into a 'full' metadata
-    Raises an exception if the extracted resource type is different from 'Dataset', 'Software', or 'Other'
-    """
-    full_metadata['metadata']['resource_type'] = {
-        'id': '',
-        'title': {
-            'en': ''
-        }
-    }
-
-    if partial_metadata['resource_type'] == 'Dataset':
-        full_metadata['metadata']['resource_type']['id'] = 'dataset'
-        full_metadata['metadata']['resource_type']['title']['en'] = 'Dataset'
-    elif partial_metadata['resource_type'] == 'Software':
-        full_metadata['metadata']['resource_type']['id'] = 'software'
-        full_metadata['metadata']['resource_type']['title']['en'] = 'Software'
-    elif partial_metadata['resource_type'] == 'Other':
-        full_metadata['metadata']['resource_type']['id'] = 'other'
-        full_metadata['metadata']['resource_type']['title']['en'] = 'Other'
-    else:
-        raise Exception(f'Invalid resource type {partial_metadata["resource_type"]} in the input metadata file')
-
-    return full_metadata
-
-
-def insert_creators(full_metadata, partial_metadata):
+def export_to_json_file(base_dir_path, output_file_path, data):
     """
-    Inserts creators (i.e., authors) that were extracted from a 'partial' metadata into a 'full' metadata
+    Exports data to a JSON file (4-space indentation, sorted keys, non-ASCII characters escaped)
+    The file is created if it does not exist or its contents is cleared if it exists
     """
-    full_metadata['metadata']['creators'] = []
-    authors = partial_metadata['authors']
-
-    for author in authors:
-        creator = {
-            'affiliations': [],
-            'person_or_org': {
-                'family_name': '',
-                'given_name': '',
-                'name': '',
-                'type': 'personal'
-            }
-        }
-
-        affiliations = author['affiliations']
-        for affiliation in affiliations:
-            creator['affiliations'].append({'name': affiliation})
-
-        creator['person_or_org']['family_name'] = author['family_name']
-        creator['person_or_org']['given_name'] = author['given_name']
-        creator['person_or_org']['name'] = author['family_name'] + ', ' + author['given_name']
-        full_metadata['metadata']['creators'].append(creator)
+    output_file_path = os.path.join(base_dir_path, output_file_path)
 
-    return full_metadata
+    with open(output_file_path, "wb") as f:
+        f.write(dumps_pretty(data))
 
 
-def insert_rights(full_metadata, partial_metadata):
+def iter_batches(items, batch_size=EXPORT_BATCH_SIZE):
     """
-    Inserts a right (i.e., a license) that was extracted from a 'partial' metadata into a 'full' metadata. Only the following licenses are accepted:
-      - 'BIG-MAP Archive License'
-      - 'Creative Commons Attribution Share Alike 4.0 International'
-      - 'MIT License'
+    Yields lists of up to 'batch_size' consecutive items
     """
-    full_metadata['metadata']['rights'] = [{
-        'description': {
-            'en': ''
-        },
-        'icon': '',
-        'id': '',
-        'props': {
-            'scheme': '',
-            'url': ''
-        },
-        'title': {
-            'en': ''
-        }
-    }]
-
-    if partial_metadata['license'] == 'BIG-MAP Archive License':
-        full_metadata['metadata']['rights'][0]['description']['en'] = 'The BIG-MAP Archive License allows re-distribution and re-use of work within the BIG-MAP community.'
-        full_metadata['metadata']['rights'][0]['id'] = 'bm-1.0'
-        full_metadata['metadata']['rights'][0]['props']['scheme'] = 'spdx'
-        full_metadata['metadata']['rights'][0]['props']['url'] = 'https://www.big-map.eu/'
-        full_metadata['metadata']['rights'][0]['title']['en'] = 'BIG-MAP Archive License'
-    elif partial_metadata['license'] == 'Creative Commons Attribution Share Alike 4.0 International':
-        full_metadata['metadata']['rights'][0]['description']['en'] = 'Permits almost any use subject to providing credit and license notice. Frequently used for media assets and educational materials. The most common license for Open Access scientific publications. Not recommended for software.'
-        full_metadata['metadata']['rights'][0]['icon'] = 'cc-by-sa-icon'
-        full_metadata['metadata']['rights'][0]['id'] = 'cc-by-sa-4.0'
-        full_metadata['metadata']['rights'][0]['props']['scheme'] = 'spdx'
-        full_metadata['metadata']['rights'][0]['props']['url'] = 'https://creativecommons.org/licenses/by-sa/4.0/legalcode'
-        full_metadata['metadata']['rights'][0]['title']['en'] = 'Creative Commons Attribution Share Alike 4.0 International'
-    elif partial_metadata['license'] == 'MIT License':
-        full_metadata['metadata']['rights'][0]['description']['en'] = 'A short and simple permissive license with conditions only requiring preservation of copyright and license notices. Licensed works, modifications, and larger works may be distributed under different terms and without source code.'
-        full_metadata['metadata']['rights'][0]['id'] = 'mit'
-        full_metadata['metadata']['rights'][0]['props']['scheme'] = 'spdx'
-        full_metadata['metadata']['rights'][0]['props']['url'] = 'https://opensource.org/licenses/MIT'
-        full_metadata['metadata']['rights'][0]['title']['en'] = 'MIT License'
-    else:
-        raise Exception(f'Invalid license {partial_metadata["license"]} in the input metadata file')
-
-    return full_metadata
-
-
-def insert_subjects(full_metadata, partial_metadata):
-    """
-    Inserts subjects (i.e., keywords) that were extracted from a 'partial' metadata into a 'full' metadata
-    """
-    full_metadata['metadata']['subjects'] = [{'subject': keyword} for keyword in partial_metadata['keywords']]
+    items = iter(items)
 
-    return full_metadata
+    while batch := list(islice(items, batch_size)):
+        yield batch
 
 
-def insert_related_identifiers(full_metadata, partial_metadata):
+def export_hits_to_json_file(base_dir_path, output_file_path, total, hits):
     """
-    Inserts related identifiers (i.e., references) that were extracted from a 'partial' metadata into a 'full' metadata. Only the following reference schemes are accepted:
-      - 'arxiv'
-      - 'doi'
-      - 'isbn'
-      - 'url'
+    Exports search hits to a JSON file as {"hits": {"hits": [...], "total": ...}}, writing the hits as soon as they are available
+    The output is the same as export_to_json_file for the whole search result, but the hits are never all held in memory
+    The file is created if it does not exist or its contents is cleared if it exists
     """
-    full_metadata['metadata']['related_identifiers'] = []
-    references = partial_metadata['references']
+    output_file_path = os.path.join(base_dir_path, output_file_path)
 
-    for reference in references:
-        if reference['scheme'] not in ['arxiv', 'doi', 'isbn', 'url']:
-            raise Exception(f'Invalid reference scheme {reference["scheme"]} in the input metadata file')
+    with open(output_file_path, "wb") as f:
+        f.write(b'{\n    "hits": {\n        "hits": [')
+        separator = b'\n'
 
-    for reference in references:
-        related_identifier = {
-            'identifier': reference['identifier'],
-            'relation_type': {
-                'id': 'references',
-                'title': {'en': 'References'}
-            },
-            'scheme': reference['scheme']
-        }
+        for batch in iter_batches(hits):
+            f.write(separator)
+            f.write(dumps_pretty_items(batch, level=3))
+            separator = b',\n'
 
-        full_metadata['metadata']['related_identifiers'].append(related_identifier)
+        if separator == b',\n':
+            f.write(b'\n        ')
 
-    return full_metadata
+        f.write(b'],\n        "total": ' + dumps_pretty(total) + b'\n    }\n}')
 
 
-def export_to_json_file(base_dir_path, output_file_path, data):
+def export_items_to_json_file(base_dir_path, output_file_path, items):
     """
-    Exports data to a JSON file
+    Exports an iterable of items to a JSON file as an array, writing the items as soon as they are available
+    The output is the same as export_to_json_file for the list of items, but the items are never all held in memory
     The file is created if it does not exist or its contents is cleared if it exists
     """
     output_file_path = os.path.join(base_dir_path, output_file_path)
 
-    with open(output_file_path, "w") as f:
-        json.dump(data, f, indent=4, sort_keys=True)
+    with open(output_file_path, "wb") as f:
+        f.write(b'[')
+        separator = b'\n'
+
+        for batch in iter_batches(items):
+            f.write(separator)
+            f.write(dumps_pretty_items(batch, level=1))
+            separator = b',\n'
+
+        if separator == b',\n':
+            f.write(b'\n')
+
+        f.write(b']')
 
 
 def change_metadata(record_metadata, base_dir_path, metadata_file_path):
@@ -202,17 +93,8 @@ def change_metadata(record_metadata, base_dir_path, metadata_file_path):
     Updates a record's metadata from a YAML file containing only partial metadata
     """
     metadata_file_path = os.path.join(base_dir_path, metadata_file_path)
-
-    with open(metadata_file_path, 'r') as f:
-        partial_metadata = yaml.safe_load(f)
-
-    record_metadata = insert_resource_type(record_metadata, partial_metadata)
-    record_metadata['metadata']['title'] = partial_metadata['title']
-    record_metadata = insert_creators(record_metadata, partial_metadata)
-    record_metadata['metadata']['description'] = partial_metadata['description']
-    record_metadata = insert_rights(record_metadata, partial_metadata)
-    record_metadata = insert_subjects(record_metadata, partial_metadata)
-    record_metadata = insert_related_identifiers(record_metadata, partial_metadata)
+    partial_metadata = load_metadata_file(metadata_file_path)
+    record_metadata = insert_metadata(record_metadata, partial_metadata)
 
     # Update value of 'updated'
     now = datetime.datetime.now(datetime.timezone.utc)
@@ -223,31 +105,58 @@ def change_metadata(record_metadata, base_dir_path, metadata_file_path):
     return record_metadata
 
 
-def get_name_to_checksum_for_files_in_upload_dir(base_dir_path, upload_dir_path):
+def get_name_to_checksum_for_files_in_upload_dir(base_dir_path, upload_dir_path, checksum_cache=None, checksum_engine=None,
+                                                 filenames=None):
     """
-    Gets the names and md5 hashes of all files in the upload folder
+    Gets the names and md5 hashes of all files in the upload folder, or only of the given files if 'filenames' is provided
+    Files that are unchanged since they were last hashed are not read again if a checksum cache is provided
+    The other files are hashed in parallel by a checksum engine (a default ChecksumEngine if none is provided)
     """
     upload_dir_path = os.path.join(base_dir_path, upload_dir_path)
-    filenames = [
-        f for f in os.listdir(upload_dir_path)
-        if os.path.isfile(os.path.join(upload_dir_path, f))
-    ]
 
-    files_in_upload_dir = []
+    if filenames is None:
+        filenames = [
+            f for f in os.listdir(upload_dir_path)
+            if os.path.isfile(os.path.join(upload_dir_path, f))
+        ]
+
+    name_to_checksum = {}
+    path_to_stat = {}
 
     for filename in filenames:
         file_path = os.path.join(upload_dir_path, filename)
 
-        with open(file_path, "rb") as f:
-            file_hash = hashlib.md5()
-            while chunk := f.read(8192):
-                file_hash.update(chunk)
+        checksum = None
+
+        if checksum_cache is not None:
+            stat = os.stat(file_path)
+            path_to_stat[file_path] = stat
+            checksum = checksum_cache.get(file_path, stat)
+
+        name_to_checksum[filename] = checksum
+
+    file_paths = [os.path.join(upload_dir_path, f) for f, checksum in name_to_checksum.items() if checksum is None]
+
+    if file_paths:
+        if checksum_engine is None:
+            checksum_engine = ChecksumEngine()
+
+        path_to_checksum = checksum_engine.compute(file_paths)
+
+        for file_path, checksum in path_to_checksum.items():
+            name_to_checksum[os.path.basename(file_path)] = checksum
+
+            if checksum_cache is not None:
+                checksum_cache.set(file_path, path_to_stat[file_path], checksum)
+
+        if checksum_cache is not None:
+            checksum_cache.commit()
 
-        files_in_upload_dir.append(
-            {
-                'name': filename,
-                'checksum': 'md5:' + file_hash.hexdigest()
-            })
+    files_in_upload_dir = [
+        {
+            'name': filename,
+            'checksum': checksum
+        } for filename, checksum in name_to_checksum.items()]
 
     return files_in_upload_dir
 
@@ -255,9 +164,13 @@ def get_name_to_checksum_for_files_in_upload_dir(base_dir_path, upload_dir_path)
 def get_data_files_in_upload_dir(base_dir_path, upload_dir_path):
     """
     Gets the names of the files in the upload folder
+    The files are not read: their checksums are computed while they are uploaded
     """
-    files = get_name_to_checksum_for_files_in_upload_dir(base_dir_path, upload_dir_path)
-    filenames = [f['name'] for f in files]
+    upload_dir_path = os.path.join(base_dir_path, upload_dir_path)
+    filenames = [
+        f for f in os.listdir(upload_dir_path)
+        if os.path.isfile(os.path.join(upload_dir_path, f))
+    ]
     return filenames
 
 
@@ -267,9 +180,7 @@ def get_title_from_metadata_file(base_dir_path, metadata_file_path):
     """
     metadata_file_path = os.path.join(base_dir_path, metadata_file_path)
 
-    with open(metadata_file_path, 'r') as f:
-        partial_metadata = yaml.safe_load(f)
-
+    partial_metadata = load_metadata_file(metadata_file_path)
     title = partial_metadata['title']
 
     return title
@@ -295,3 +206,15 @@ def recreate_directory(base_dir_path, dir_path):
         shutil.rmtree(dir_path)
 
     os.makedirs(dir_path)
+
+
+def get_cache_directory(name):
+    """
+    Gets the path to a folder where the client keeps files between runs, and creates the folder if it does not exist
+    The folder is located in $XDG_CACHE_HOME/bma (by default, ~/.cache/bma)
+    """
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    dir_path = os.path.join(cache_home, 'bma', name)
+    os.makedirs(dir_path, exist_ok=True)
+
+    return dir_path
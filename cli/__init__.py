@@ -1,13 +1,26 @@
 """Module for the command line interface.
 
-Import here all groups that directly inherit from root.
+Only the topmost group is imported here. The groups that directly inherit from root are listed in cli.root.SUBCOMMANDS
+and imported on first use, so that the command line starts quickly.
 """
-from cli.root import cmd_root
-from cli.record import cmd_record
-from cli.finales_db import cmd_finales_db
+import importlib
+
+from cli.root import SUBCOMMANDS, cmd_root
 
 __all__ = [
     'cmd_root',
     'cmd_record',
-    'cmd_finales_db'
-]
\ No newline at end of file
+    'cmd_finales_db',
+    'cmd_cache'
+]
+
+
+def __getattr__(name):
+    # e.g., 'from cli import cmd_record' imports cli.record
+    for path in SUBCOMMANDS.values():
+        module_name, attribute = path.split(':')
+
+        if attribute == name:
+            return getattr(importlib.import_module(module_name), attribute)
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
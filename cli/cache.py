@@ -0,0 +1,50 @@
+import os
+
+import click
+
+
+@click.group('cache')
+def cmd_cache():
+    """
+    Manage the local caches of the command line client.
+    """
+
+
+@cmd_cache.command('clear-checksums')
+@click.option(
+    '--data-files',
+    help='Path to a directory whose files should be hashed again. By default, the checksums of all files are discarded.',
+    type=click.Path(exists=False, file_okay=False, dir_okay=True)
+)
+def cmd_cache_clear_checksums(data_files):
+    """
+    Discard cached checksums of data files, so that they are hashed again during the next upload.
+    """
+    from big_map_archive_api_client.utils import ChecksumCache
+
+    try:
+        with ChecksumCache() as checksum_cache:
+            if data_files is None:
+                count = checksum_cache.clear()
+            else:
+                count = checksum_cache.clear(os.path.join(os.getcwd(), data_files))
+
+        click.echo(f'{count} cached checksum(s) were discarded.')
+    except Exception as e:
+        click.echo(f'An error occurred. More info: {str(e)}.')
+
+
+@cmd_cache.command('clear-http')
+def cmd_cache_clear_http():
+    """
+    Discard cached responses of the archive, so that they are downloaded again during the next command.
+    """
+    from big_map_archive_api_client.utils import HTTPCache
+
+    try:
+        with HTTPCache() as http_cache:
+            count = http_cache.clear()
+
+        click.echo(f'{count} cached response(s) were discarded.')
+    except Exception as e:
+        click.echo(f'An error occurred. More info: {str(e)}.')
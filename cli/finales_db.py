@@ -2,21 +2,14 @@ import os
 import warnings
 
 import click
-import requests
 
-from big_map_archive_api_client.client.client_config import ClientConfig
-from big_map_archive_api_client.utils import (export_to_json_file,
-                                              get_title_from_metadata_file,
-                                              recreate_directory)
-from cli.record import cmd_record_create, cmd_record_update
-from cli.root import cmd_root
-from finales_api_client.client.client_config import FinalesClientConfig
+from cli.record import create_record, update_record
 
 # from datetime import datetime
 # from pathlib import Path
 
 
-@cmd_root.group('finales-db')
+@click.group('finales-db')
 @click.option(
     '--ignore',
     '-W',
@@ -74,18 +67,121 @@ def cmd_finales_db(ignore):
     help='Community slug of the record. Example: for the BIG-MAP community the slug is bigmap.',
     type=click.STRING
 )
-@click.pass_context
-def cmd_finales_db_copy(ctx,
-                        bma_config_file,
+@click.option(
+    '--jobs',
+    '-j',
+    show_default=True,
+    default=1,
+    help='Number of files that are uploaded in parallel.',
+    type=click.IntRange(min=1)
+)
+@click.option(
+    '--no-cache',
+    is_flag=True,
+    help='Hash all data files again instead of reusing the checksums of unchanged files from previous runs.'
+)
+@click.option(
+    '--stream-database',
+    is_flag=True,
+    help='Stream the database file from the FINALES server to the archive instead of writing it to data/temp first. The file is written to data/temp anyway if the FINALES server does not send its size.'
+)
+@click.option(
+    '--derive-exports',
+    is_flag=True,
+    help='Only download the database file from the FINALES server and build the capabilities, requests and results for requests from it, instead of downloading them. Files that cannot be built from the database file (unexpected schema) are downloaded.'
+)
+@click.option(
+    '--incremental',
+    is_flag=True,
+    help='Only upload what changed since the previous back-up, as recorded locally: new or changed requests and results are uploaded as delta files, the changed pages of the database file as a patch, and unchanged files remain linked from the previous version. No version is created if nothing changed. Use the command restore to rebuild the files of a version.'
+)
+@click.option(
+    '--full-every',
+    show_default=True,
+    default=7,
+    help='With --incremental, number of back-ups after which all files are uploaded again (full snapshot) and the delta files are discarded.',
+    type=click.IntRange(min=1)
+)
+@click.option(
+    '--rebase-ratio',
+    show_default=True,
+    default=0.5,
+    help='With --incremental, make a full snapshot once the database patches since the last one add up to more than this fraction of the size of the database file.',
+    type=click.FloatRange(min=0)
+)
+@click.option(
+    '--compress',
+    type=click.Choice(['gzip', 'bz2', 'xz']),
+    help='Compress the uploaded files with the given codec. The file names get the suffix of the codec (e.g., sqlite.db.gz). Large files are compressed in blocks on all cores. Use the command decompress to restore downloaded files.'
+)
+@click.option(
+    '--compression-level',
+    help='Compression level, from 1 (fastest) to 9 (smallest). Defaults to 6 for gzip and xz, and to 9 for bz2.',
+    type=click.IntRange(min=1, max=9)
+)
+def cmd_finales_db_copy(bma_config_file,
                         finales_config_file,
                         record_id,
                         metadata_file,
                         link_all_files_from_previous,
                         no_publish,
-                        slug):
+                        slug,
+                        jobs,
+                        no_cache,
+                        stream_database,
+                        derive_exports,
+                        incremental,
+                        full_every,
+                        rebase_ratio,
+                        compress,
+                        compression_level):
     """
     Back up the SQLite database of a FINALES server to a BIG-MAP Archive. This creates and publishes a new entry version, which provides links to data extracted from the database (capabilities, requests, and results for requests) and a copy of the whole database.
     """
+    import requests
+
+    from big_map_archive_api_client.client.client_config import ClientConfig
+    from big_map_archive_api_client.utils import (PIPE_CHUNK_SIZE,
+                                                  compress_chunks,
+                                                  compress_file,
+                                                  get_compressed_filename,
+                                                  get_data_files_in_upload_dir,
+                                                  get_title_from_metadata_file,
+                                                  recreate_directory)
+    from finales_api_client.client.client_config import FinalesClientConfig
+    from finales_api_client.client.database_exports import (
+        DATABASE_EXPORTS, export_database_contents, get_unsupported_exports)
+    from finales_api_client.client.incremental_backup import (BackupState,
+                                                              IncrementalBackup)
+
+    if incremental and stream_database:
+        raise click.UsageError('--incremental cannot be combined with --stream-database, as the database file is compared with the previous one.')
+
+    if derive_exports and stream_database:
+        raise click.UsageError('--derive-exports cannot be combined with --stream-database, as the exports are built from the database file in data/temp.')
+
+    if compression_level is not None and compress is None:
+        raise click.UsageError('--compression-level requires --compress.')
+
+    compression_jobs = os.cpu_count() or 1
+
+    def derive_database_exports(finales_client):
+        # Builds the exports from the database file, and downloads those that the schema of the file does not support
+        dir_path = os.path.join(base_dir_path, temp_dir_path)
+        unsupported = get_unsupported_exports(os.path.join(dir_path, 'sqlite.db'))
+
+        for filename, missing in unsupported.items():
+            click.echo(f'{filename} cannot be built from the database file (missing: {", ".join(missing)}). It is downloaded from the FINALES server instead.')
+
+        supported = [filename for filename in DATABASE_EXPORTS if filename not in unsupported]
+
+        for timing in export_database_contents(os.path.join(dir_path, 'sqlite.db'), dir_path, supported):
+            click.echo(f'{timing["file"]} was built from the database file in {timing["seconds"]:.2f} s ({timing["bytes"]} bytes).')
+
+        if unsupported:
+            for timing in finales_client.download_database_contents(dir_path, filenames=list(unsupported)):
+                click.echo(f'{timing["file"]} was downloaded from the FINALES server in {timing["seconds"]:.2f} s ({timing["bytes"]} bytes).')
+
     try:
         # Create/re-create folder where files are stored temporarily
         base_dir_path = os.getcwd()
@@ -94,102 +190,150 @@ def cmd_finales_db_copy(ctx,
 
         # Create a FinalesAPIClient object to interact with a FINALES server
         config_file_path = os.path.join(base_dir_path, finales_config_file)
-        client_config = FinalesClientConfig.load_from_config_file(config_file_path)
-        client = client_config.create_client()
-
-        # Get access token from FINALES server
-        response = client.post_authenticate()
-        finales_token = response['access_token']
-
-        # Get data from the FINALES database
-        # 1. Capabilities
-        response = client.get_capabilities(finales_token)
-        capabilities_filename = 'capabilities.json'
-        capabilities_file_path = os.path.join(base_dir_path, temp_dir_path, capabilities_filename)
-        export_to_json_file(base_dir_path, capabilities_file_path, response)
-
-        # 2. Requests
-        response = client.get_all_requests(finales_token)
-        requests_filename = 'requests.json'
-        requests_file_path = os.path.join(base_dir_path, temp_dir_path, requests_filename)
-        export_to_json_file(base_dir_path, requests_file_path, response)
-
-        # 3. Results for requests
-        response = client.get_results_requested(finales_token)
-        results_filename = 'results_for_requests.json'
-        results_file_path = os.path.join(base_dir_path, temp_dir_path, results_filename)
-        export_to_json_file(base_dir_path, results_file_path, response)
-
-        # 4. Database file
-        # Avoid storing the whole file in memory as it may be large
-        # See https://requests.readthedocs.io/en/latest/user/quickstart/
-        stream = True
-        chunk_size = 10000  # in byte
-
-        response = client.get_database_file(finales_token, stream)
-        results_filename = 'sqlite.db'
-        results_file_path = os.path.join(base_dir_path, temp_dir_path, results_filename)
-
-        with open(results_file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                f.write(chunk)
+        finales_client_config = FinalesClientConfig.load_from_config_file(config_file_path)
+        with finales_client_config.create_client() as client:
+            if derive_exports:
+                # Get a copy of the database file only, and build the capabilities, requests and results from it
+                timings = client.download_database_contents(os.path.join(base_dir_path, temp_dir_path),
+                                                            filenames=['sqlite.db'])
+            else:
+                # Get capabilities, requests, results for requests and a copy of the database file, concurrently
+                timings = client.download_database_contents(os.path.join(base_dir_path, temp_dir_path),
+                                                            include_database_file=not stream_database)
+
+            for timing in timings:
+                click.echo(f'{timing["file"]} was downloaded from the FINALES server in {timing["seconds"]:.2f} s ({timing["bytes"]} bytes).')
+
+            if derive_exports:
+                derive_database_exports(client)
+
+        def upload_database_file(archive_client, draft_id):
+            # Streams the database file from the FINALES server to the draft, without writing it to disk
+            database_filename = 'sqlite.db'
+
+            # A link to the previous version's database file may have been kept (--link-all-files-from-previous)
+            previous_filenames = {database_filename, get_compressed_filename(database_filename, compress)} \
+                if compress else {database_filename}
+            linked_filenames = [f for f in archive_client.get_links(draft_id) if f in previous_filenames]
+
+            if linked_filenames:
+                archive_client.delete_links(draft_id, linked_filenames)
+
+            with finales_client_config.create_client() as finales_client, \
+                    finales_client.get_database_file(stream=True) as response:
+                size = response.headers.get('Content-Length')
+
+                # The size of the compressed file is only known once it is written: compress while downloading
+                if compress:
+                    compressed_filename = get_compressed_filename(database_filename, compress)
+
+                    with open(os.path.join(base_dir_path, temp_dir_path, compressed_filename), 'wb') as f:
+                        for block in compress_chunks(response.iter_content(chunk_size=PIPE_CHUNK_SIZE), compress,
+                                                     compression_level, compression_jobs):
+                            f.write(block)
+
+                    archive_client.upload_files(draft_id, base_dir_path, temp_dir_path, [compressed_filename], jobs)
+                    database_filename = compressed_filename
+                # The size of the file is unknown if the server does not send it or compresses the response
+                elif size is not None and 'Content-Encoding' not in response.headers:
+                    archive_client.upload_stream(draft_id, database_filename, response.iter_content(PIPE_CHUNK_SIZE),
+                                                 int(size))
+                else:
+                    with open(os.path.join(base_dir_path, temp_dir_path, database_filename), 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=PIPE_CHUNK_SIZE):
+                            f.write(chunk)
+
+                    archive_client.upload_files(draft_id, base_dir_path, temp_dir_path, [database_filename], jobs)
+
+            click.echo(f'{database_filename} was streamed from the FINALES server to the archive.')
+
+        def compress_files(filenames):
+            # Compresses the files to upload in data/temp, one after the other (each one on all cores)
+            compressed_filenames = []
+
+            for filename in filenames:
+                file_path = os.path.join(base_dir_path, temp_dir_path, filename)
+                size = os.path.getsize(file_path)
+                compressed_file_path = compress_file(file_path, compress, compression_level, compression_jobs)
+                compressed_filenames.append(os.path.basename(compressed_file_path))
+                click.echo(f'{filename} was compressed with {compress} ({size} -> {os.path.getsize(compressed_file_path)} bytes).')
+
+            return compressed_filenames
 
         # Create an ArchiveAPIClient object to interact with the archive
         config_file_path = os.path.join(base_dir_path, bma_config_file)
         client_config = ClientConfig.load_from_config_file(config_file_path)
-        client = client_config.create_client()
-
-        title = get_title_from_metadata_file(base_dir_path, metadata_file)
-
-        # now = datetime.now()
-        # additional_description = f' The back-up was performed on {now.strftime("%B %-d, %Y")} at {now.strftime("%H:%M")}.'
-
-        publish = not no_publish
-
-        # Create new record
-        if record_id == '':
-            # Check whether the archive user already owns a published record with that title
-            record_ids = client.get_published_user_records_with_given_title(title)
-
-            if record_ids:
-                # Ask for confirmation
-                click.echo(f'Found a published record with the title "{title}" on the BIG-MAP Archive.')
-                click.echo('To create a new version of an existing record instead of creating a new record execute the command with the option --record-id.')
-                # record_ids[0] can be misleading if there is more than one record with the same title (not just a new version of a record but a distinct record with the same title)
-                # click.echo(f'To create a new version of the existing entry instead of creating a new record, execute the command with the option --record-id="{record_ids[0]}".')
-                click.confirm('Do you want to create a new record?', abort=True)
-
-            # Create a new record
-            ctx.invoke(cmd_record_create,
-                       config_file=bma_config_file,
-                       metadata_file=metadata_file,
-                       data_files=temp_dir_path,
-                       publish=publish,
-                       slug=slug)
-        # Create new version of record
-        else:
-            if not client.exists_and_is_published(record_id):
-                # The provided record id does not correspond to a published record on the BIG-MAP Archive owned by the user
-                click.echo(f'Invalid record id: {record_id}. You do not own a published record with this id.')
-                raise click.Abort
-
-            # Extract the title of the published record
-            record_title = client.get_record_title(record_id)
-
-            if title != record_title:
-                # Ask for confirmation
-                click.echo(f'The title "{title}" in the metadata file differs from the title of the published record "{record_title}".')
-                click.confirm('Do you want to continue with the new title?', abort=True)
-
-            # Update the record by creating a new version (update_only is False)
-            ctx.invoke(cmd_record_update,
-                       config_file=bma_config_file,
-                       record_id=record_id,
-                       update_only=False,
-                       metadata_file=metadata_file,
-                       data_files=temp_dir_path,
-                       link_all_files_from_previous=link_all_files_from_previous,
-                       publish=publish)
+        with client_config.create_client(jobs, not no_cache) as client:
+            title = get_title_from_metadata_file(base_dir_path, metadata_file)
+
+            # now = datetime.now()
+            # additional_description = f' The back-up was performed on {now.strftime("%B %-d, %Y")} at {now.strftime("%H:%M")}.'
+
+            publish = not no_publish
+            after_upload = upload_database_file if stream_database else None
+            incremental_backup = None
+
+            if incremental:
+                finales_address = f'{finales_client_config.ip_address}:{finales_client_config.port}'
+                state = BackupState.load(finales_address, client_config.domain_name, title)
+                incremental_backup = IncrementalBackup(state, record_id, full_every, rebase_ratio)
+                uploads = incremental_backup.prepare(os.path.join(base_dir_path, temp_dir_path))
+
+                if not uploads:
+                    click.echo(f'Nothing changed on the FINALES server since the version {record_id}. No new version was created.')
+                    return
+
+                # Unchanged files and previous delta files remain linked; a full snapshot drops the delta files
+                link_all_files_from_previous = not incremental_backup.full
+
+                # The checksums in the local state are those of the uncompressed files
+                if compress:
+                    uploads = compress_files(uploads)
+
+                kind = 'full snapshot' if incremental_backup.full else 'incremental back-up'
+                click.echo(f'{kind.capitalize()}: {", ".join(uploads)} will be uploaded.')
+            elif compress:
+                compress_files(sorted(get_data_files_in_upload_dir(base_dir_path, temp_dir_path)))
+
+            # Create new record
+            if record_id == '':
+                # Check whether the archive user already owns a published record with that title
+                record_ids = client.get_published_user_records_with_given_title(title)
+
+                if record_ids:
+                    # Ask for confirmation
+                    click.echo(f'Found a published record with the title "{title}" on the BIG-MAP Archive.')
+                    click.echo('To create a new version of an existing record instead of creating a new record execute the command with the option --record-id.')
+                    # record_ids[0] can be misleading if there is more than one record with the same title (not just a new version of a record but a distinct record with the same title)
+                    # click.echo(f'To create a new version of the existing entry instead of creating a new record, execute the command with the option --record-id="{record_ids[0]}".')
+                    click.confirm('Do you want to create a new record?', abort=True)
+
+                # Create a new record
+                new_record_id = create_record(client, base_dir_path, metadata_file, temp_dir_path, publish, slug, jobs,
+                                              after_upload=after_upload)
+            # Create new version of record
+            else:
+                if not client.exists_and_is_published(record_id):
+                    # The provided record id does not correspond to a published record on the BIG-MAP Archive owned by the user
+                    click.echo(f'Invalid record id: {record_id}. You do not own a published record with this id.')
+                    raise click.Abort
+
+                # Extract the title of the published record
+                record_title = client.get_record_title(record_id)
+
+                if title != record_title:
+                    # Ask for confirmation
+                    click.echo(f'The title "{title}" in the metadata file differs from the title of the published record "{record_title}".')
+                    click.confirm('Do you want to continue with the new title?', abort=True)
+
+                # Update the record by creating a new version (update_only is False)
+                new_record_id = update_record(client, base_dir_path, record_id, False, metadata_file, temp_dir_path,
+                                              link_all_files_from_previous, publish, jobs, after_upload=after_upload)
+
+            if incremental_backup is not None:
+                incremental_backup.commit(new_record_id, uploads)
+
+            click.echo(f'Please visit https://{client_config.domain_name}/{"records" if publish else "uploads"}/{new_record_id}.')
 
     except click.Abort:
         click.echo('Aborted.')
@@ -203,3 +347,69 @@ def cmd_finales_db_copy(ctx,
             click.echo(f'An error of type HTTPError occurred. More info: {str(e)}.')
     except Exception as e:
         click.echo(f'An error occurred. More info: {str(e)}.')
+
+
+@cmd_finales_db.command('restore')
+@click.option(
+    '--data-files',
+    required=True,
+    help='Path to the directory that contains the files of a version downloaded from the archive, including delta files and database patches. Compressed files are decompressed on the fly.',
+    type=click.Path(exists=True, file_okay=False, dir_okay=True)
+)
+@click.option(
+    '--output-dir',
+    required=True,
+    help='Path to the directory where the rebuilt files (sqlite.db, requests.json, etc) are written.',
+    type=click.Path(exists=False, file_okay=False, dir_okay=True)
+)
+def cmd_finales_db_restore(data_files, output_dir):
+    """
+    Rebuild the files of a version created with the option --incremental: the database file from the last full snapshot and its patches, and the requests and results from the last full snapshot and their delta files.
+    """
+    from big_map_archive_api_client.utils import create_directory
+    from finales_api_client.client.incremental_backup import restore_backup
+
+    try:
+        base_dir_path = os.getcwd()
+        create_directory(base_dir_path, output_dir)
+        restored = restore_backup(os.path.join(base_dir_path, data_files), os.path.join(base_dir_path, output_dir))
+        click.echo(f'{", ".join(restored)} were restored to {output_dir}.')
+    except Exception as e:
+        click.echo(f'An error occurred. More info: {str(e)}.')
+
+
+@cmd_finales_db.command('decompress')
+@click.option(
+    '--data-files',
+    required=True,
+    help='Path to the directory that contains the files of a back-up downloaded from the archive. Files compressed with gzip, bz2, or xz (.gz, .bz2, .xz) are decompressed next to them.',
+    type=click.Path(exists=True, file_okay=False, dir_okay=True)
+)
+@click.option(
+    '--keep',
+    is_flag=True,
+    help='Keep the compressed files.'
+)
+def cmd_finales_db_decompress(data_files, keep):
+    """
+    Decompress the files of a back-up created with the option --compress, e.g., to restore the SQLite database of a FINALES server.
+    """
+    from big_map_archive_api_client.utils import (decompress_file, get_codec,
+                                                  get_data_files_in_upload_dir)
+
+    try:
+        dir_path = os.path.join(os.getcwd(), data_files)
+        filenames = sorted(f for f in get_data_files_in_upload_dir(os.getcwd(), data_files) if get_codec(f))
+
+        for filename in filenames:
+            file_path = os.path.join(dir_path, filename)
+            output_file_path = decompress_file(file_path)
+
+            if not keep:
+                os.remove(file_path)
+
+            click.echo(f'{filename} was decompressed to {os.path.basename(output_file_path)}.')
+
+        click.echo(f'{len(filenames)} file(s) were decompressed.')
+    except Exception as e:
+        click.echo(f'An error occurred. More info: {str(e)}.')
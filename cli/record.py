@@ -1,17 +1,16 @@
+import itertools
 import os
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import click
-import requests
 
-from big_map_archive_api_client.client.client_config import ClientConfig
-from big_map_archive_api_client.utils import (create_directory,
-                                              export_to_json_file,
-                                              get_data_files_in_upload_dir)
-from cli.root import cmd_root
+# requests, pydantic and the client packages are imported by the commands that use them, so that 'bma --help' and
+# the other groups of commands start without loading them
 
 
-@cmd_root.group('record')
+@click.group('record')
 @click.option(
     '--ignore',
     '-W',
@@ -27,6 +26,109 @@ def cmd_record(ignore):
         warnings.filterwarnings('ignore')
 
 
+def create_record(client, base_dir_path, metadata_file, data_files, publish, slug, jobs, echo=click.echo,
+                  after_upload=None):
+    """
+    Creates a record from a metadata file and a folder of data files, and optionally publishes it
+    Shared by 'record create', 'record batch' and 'finales-db back-up'; progress messages are passed to 'echo'
+    'after_upload', if provided, is called with the client and the draft's id once the data files were uploaded
+    (e.g., to upload a file streamed from another server)
+    Returns the id of the new record
+    """
+    from big_map_archive_api_client.utils import get_data_files_in_upload_dir
+
+    # Get community id
+    community_id = client.get_community_id(slug)
+
+    # Create draft from input metadata.yaml
+    response = client.post_records(base_dir_path, metadata_file)
+    record_id = response['id']
+
+    # Attribute draft to community
+    response = client.put_draft_community(record_id, community_id)
+
+    # Upload data files and insert links in the draft's metadata
+    filenames = get_data_files_in_upload_dir(base_dir_path, data_files)
+
+    if filenames != []:
+        echo('Files are being uploaded...')
+        client.upload_files(record_id, base_dir_path, data_files, filenames, jobs)
+        echo('Files were uploaded.')
+
+    if after_upload is not None:
+        after_upload(client, record_id)
+    echo('A new entry was created.')
+
+    # Publish draft depending on user's choice
+    if publish:
+        client.insert_publication_date(record_id)
+        client.post_review(record_id)
+        echo('The entry was published.')
+
+    return record_id
+
+
+def update_record(client, base_dir_path, record_id, update_only, metadata_file, data_files,
+                  link_all_files_from_previous, publish, jobs, echo=click.echo, after_upload=None):
+    """
+    Updates the metadata of a published version, or creates a new version and optionally publishes it
+    Shared by 'record update', 'record batch' and 'finales-db back-up'; progress messages are passed to 'echo'
+    'after_upload', if provided, is called with the client and the new version's id once the data files were uploaded
+    Returns the id of the updated version or of the new version
+    """
+    if update_only:
+        # Create a draft (same version) and get the draft's id (same id)
+        response = client.post_draft(record_id)
+        record_id = response['id']  # Unchanged value for record_id
+
+        # Update the draft's metadata
+        client.update_metadata(record_id, base_dir_path, metadata_file)
+
+        # Publish the draft (update published record)
+        client.post_publish(record_id)
+
+        echo(f'The metadata of the version {record_id} was updated.')
+    else:
+        # Create a draft (new version) and get its id
+        response = client.post_versions(record_id)
+        record_id = response['id']  # Modified value for record_id
+
+        # Update the draft's metadata
+        client.update_metadata(record_id, base_dir_path, metadata_file)
+
+        # Import all file links from the published version after cleaning
+        filenames = client.get_links(record_id)
+        client.delete_links(record_id, filenames)
+        client.post_file_import(record_id)
+
+        # Compare the imported file links with the files in the input folder and remove outdated links
+        sync_plan = client.get_sync_plan(record_id, base_dir_path, data_files, link_all_files_from_previous)
+        client.delete_links(record_id, sync_plan.delete)
+
+        if client.checksum_engine.stats.files:
+            echo(f'Local files were compared with the previous version: {client.checksum_engine.stats}.')
+
+        # 5. Upload the files that are new or whose content changed
+        filenames = sync_plan.upload
+        echo('Files are being uploaded...')
+        client.upload_files(record_id, base_dir_path, data_files, filenames, jobs)
+        echo('Files were uploaded.')
+
+        if after_upload is not None:
+            after_upload(client, record_id)
+
+        echo('A new version was created.')
+
+        # 6. Publish (optional)
+        if publish:
+            client.insert_publication_date(record_id)
+            client.post_publish(record_id)
+
+            echo('The new version was published.')
+
+    return record_id
+
+
 @cmd_record.command('create')
 @click.option(
     '--config-file',
@@ -57,48 +159,45 @@ def cmd_record(ignore):
     help='Community slug of the record. Example: for the BIG-MAP community the slug is bigmap.',
     type=click.STRING
 )
+@click.option(
+    '--jobs',
+    '-j',
+    show_default=True,
+    default=1,
+    help='Number of files that are uploaded in parallel.',
+    type=click.IntRange(min=1)
+)
+@click.option(
+    '--no-cache',
+    is_flag=True,
+    help='Hash all data files again instead of reusing the checksums of unchanged files from previous runs.'
+)
 def cmd_record_create(config_file,
                       metadata_file,
                       data_files,
                       publish,
-                      slug):
+                      slug,
+                      jobs,
+                      no_cache):
     """
     Create a record on a BIG-MAP Archive and optionally publish it.
     """
+    import requests
+
+    from big_map_archive_api_client.client.client_config import ClientConfig
+
     try:
         base_dir_path = os.getcwd()
         config_file_path = os.path.join(base_dir_path, config_file)
         client_config = ClientConfig.load_from_config_file(config_file_path)
-        client = client_config.create_client()
+        with client_config.create_client(jobs, not no_cache) as client:
+            record_id = create_record(client, base_dir_path, metadata_file, data_files, publish, slug, jobs)
 
-        # Get community id
-        community_id = client.get_community_id(slug)
-
-        # Create draft from input metadata.yaml
-        response = client.post_records(base_dir_path, metadata_file)
-        record_id = response['id']
-
-        # Attribute draft to community
-        response = client.put_draft_community(record_id, community_id)
-
-        # Upload data files and insert links in the draft's metadata
-        filenames = get_data_files_in_upload_dir(base_dir_path, data_files)
-
-        if filenames != []:
-            click.echo('Files are being uploaded...')
-            client.upload_files(record_id, base_dir_path, data_files, filenames)
-            click.echo('Files were uploaded.')
-        click.echo('A new entry was created.')
-
-        # Publish draft depending on user's choice
-        if publish:
-            client.insert_publication_date(record_id)
-            client.post_review(record_id)
-            click.echo('The entry was published.')
-            click.echo(f'Please visit https://{client_config.domain_name}/records/{record_id}.')
-            exit(0)
+            if publish:
+                click.echo(f'Please visit https://{client_config.domain_name}/records/{record_id}.')
+                exit(0)
 
-        click.echo(f'Please visit https://{client_config.domain_name}/uploads/{record_id}.')
+            click.echo(f'Please visit https://{client_config.domain_name}/uploads/{record_id}.')
     except requests.exceptions.ConnectionError as e:
         click.echo(f'An error of type ConnectionError occurred. Check the domain name in {config_file}. More info: {str(e)}.')
     except requests.exceptions.HTTPError as e:
@@ -132,6 +231,12 @@ def cmd_record_get(config_file,
     """
     Get the metadata of a published version of an entry on a BIG-MAP Archive and save it to a file.
     """
+    import requests
+
+    from big_map_archive_api_client.client.client_config import ClientConfig
+    from big_map_archive_api_client.utils import (create_directory,
+                                                  export_to_json_file)
+
     try:
         base_dir_path = os.getcwd()
         output_dir_path = os.path.dirname(output_file)
@@ -140,13 +245,12 @@ def cmd_record_get(config_file,
         # Create an ArchiveAPIClient object to interact with the archive
         config_file_path = os.path.join(base_dir_path, config_file)
         client_config = ClientConfig.load_from_config_file(config_file_path)
-        client = client_config.create_client()
+        with client_config.create_client() as client:
+            response = client.get_record(record_id)
 
-        response = client.get_record(record_id)
+            export_to_json_file(base_dir_path, output_file, response)
 
-        export_to_json_file(base_dir_path, output_file, response)
-
-        click.echo(f'The metadata of the entry version {record_id} was obtained and saved in {output_file}.')
+            click.echo(f'The metadata of the entry version {record_id} was obtained and saved in {output_file}.')
     except requests.exceptions.ConnectionError as e:
         click.echo(f'An error of type ConnectionError occurred. Check the domain name in {config_file}. More info: {str(e)}.')
     except requests.exceptions.HTTPError as e:
@@ -179,12 +283,26 @@ def cmd_record_get(config_file,
     help='Path to the JSON file where the obtained record\'s metadata will be exported to.',
     type=click.Path(exists=False, file_okay=True, dir_okay=False),
 )
+@click.option(
+    '--page-size',
+    show_default=True,
+    default=100,
+    help='Number of records obtained per request. Records are written to the output file page by page.',
+    type=click.IntRange(min=1)
+)
 def cmd_record_get_all(config_file,
                        all_versions,
-                       output_file):
+                       output_file,
+                       page_size):
     """
     Get the metadata of the latest published version for each entry on a BIG-MAP Archive and save them to a file.
     """
+    import requests
+
+    from big_map_archive_api_client.client.client_config import ClientConfig
+    from big_map_archive_api_client.utils import (create_directory,
+                                                  export_hits_to_json_file)
+
     try:
         base_dir_path = os.getcwd()
         output_dir_path = os.path.dirname(output_file)
@@ -193,14 +311,17 @@ def cmd_record_get_all(config_file,
         # Create an ArchiveAPIClient object to interact with the archive
         config_file_path = os.path.join(base_dir_path, config_file)
         client_config = ClientConfig.load_from_config_file(config_file_path)
-        client = client_config.create_client()
-
-        response_size = '1e6'
-        response = client.get_records(all_versions, response_size)
+        with client_config.create_client() as client:
+            # Stream the records to the output file while the next page is being fetched
+            pages = client.get_records_pages(all_versions, page_size)
+            first_page = next(pages)
+            total = first_page['hits']['total']
+            hits = itertools.chain(first_page['hits']['hits'],
+                                   (hit for page in pages for hit in page['hits']['hits']))
 
-        export_to_json_file(base_dir_path, output_file, response)
+            export_hits_to_json_file(base_dir_path, output_file, total, hits)
 
-        click.echo(f'The metadata was obtained and saved in {output_file}.')
+            click.echo(f'The metadata was obtained and saved in {output_file}.')
     except requests.exceptions.ConnectionError as e:
         click.echo(f'An error of type ConnectionError occurred. Check the domain name in {config_file}. More info: {str(e)}.')
     except requests.exceptions.HTTPError as e:
@@ -253,71 +374,50 @@ def cmd_record_get_all(config_file,
     is_flag=True,
     help='Publish the newly created version.'
 )
+@click.option(
+    '--jobs',
+    '-j',
+    show_default=True,
+    default=1,
+    help='Number of files that are uploaded in parallel.',
+    type=click.IntRange(min=1)
+)
+@click.option(
+    '--no-cache',
+    is_flag=True,
+    help='Hash all data files again instead of reusing the checksums of unchanged files from previous runs.'
+)
 def cmd_record_update(config_file,
                       record_id,
                       update_only,
                       metadata_file,
                       data_files,
                       link_all_files_from_previous,
-                      publish):
+                      publish,
+                      jobs,
+                      no_cache):
     """
     Update a published version of an archive entry, or create a new version and optionally publish it. When updating a published version, only the metadata (title, list of authors, etc) can be modified.
     """
+    import requests
+
+    from big_map_archive_api_client.client.client_config import ClientConfig
+
     try:
         base_dir_path = os.getcwd()
         config_file_path = os.path.join(base_dir_path, config_file)
         client_config = ClientConfig.load_from_config_file(config_file_path)
-        client = client_config.create_client()
-
-        if update_only:
-            # Create a draft (same version) and get the draft's id (same id)
-            response = client.post_draft(record_id)
-            record_id = response['id']  # Unchanged value for record_id
-
-            # Update the draft's metadata
-            client.update_metadata(record_id, base_dir_path, metadata_file)
-
-            # Publish the draft (update published record)
-            client.post_publish(record_id)
-
-            click.echo(f'The metadata of the version {record_id} was updated.')
-            click.echo(f'Please visit https://{client_config.domain_name}/records/{record_id}.')
-        else:
-            # Create a draft (new version) and get its id
-            response = client.post_versions(record_id)
-            record_id = response['id']  # Modified value for record_id
-
-            # Update the draft's metadata
-            client.update_metadata(record_id, base_dir_path, metadata_file)
-
-            # Import all file links from the published version after cleaning
-            filenames = client.get_links(record_id)
-            client.delete_links(record_id, filenames)
-            client.post_file_import(record_id)
-
-            # Get a list of all file links to be removed and remove them
-            filenames = client.get_links_to_delete(record_id, base_dir_path, data_files, link_all_files_from_previous)
-            client.delete_links(record_id, filenames)
-
-            # 5. Get a list of files to upload and upload them
-            filenames = client.get_files_to_upload(record_id, base_dir_path, data_files)
-            click.echo('Files are being uploaded...')
-            client.upload_files(record_id, base_dir_path, data_files, filenames)
-            click.echo('Files were uploaded.')
-
-            click.echo('A new version was created.')
+        with client_config.create_client(jobs, not no_cache) as client:
+            record_id = update_record(client, base_dir_path, record_id, update_only, metadata_file, data_files,
+                                      link_all_files_from_previous, publish, jobs)
 
-            # 6. Publish (optional)
-            if publish:
-                client.insert_publication_date(record_id)
-                client.post_publish(record_id)
-
-                click.echo('The new version was published.')
+            if update_only or publish:
                 click.echo(f'Please visit https://{client_config.domain_name}/records/{record_id}.')
 
-                exit(0)
-
-            click.echo(f'Please visit https://{client_config.domain_name}/uploads/{record_id}.')
+                if publish:
+                    exit(0)
+            else:
+                click.echo(f'Please visit https://{client_config.domain_name}/uploads/{record_id}.')
     except requests.exceptions.ConnectionError as e:
         click.echo(f'An error of type ConnectionError occurred. Check the domain name in {config_file}. More info: {str(e)}.')
     except requests.exceptions.HTTPError as e:
@@ -330,3 +430,140 @@ def cmd_record_update(config_file,
             click.echo(f'An error of type HTTPError occurred. More info: {str(e)}.')
     except Exception as e:
         click.echo(f'An error occurred. More info: {str(e)}.')
+
+
+@cmd_record.command('batch')
+@click.option(
+    '--config-file',
+    required=True,
+    help='Path to the YAML file that specifies the domain name and a personal access token for the targeted BIG-MAP Archive. See bma_config.yaml in the GitHub repository.',
+    type=click.Path(exists=True, file_okay=True, dir_okay=False),
+)
+@click.option(
+    '--manifest',
+    required=True,
+    help='Path to the YAML file that lists the records to create or update. Paths in the manifest are relative to its directory. See data/input/example/batch/manifest.yaml in the GitHub repository.',
+    type=click.Path(exists=True, file_okay=True, dir_okay=False),
+)
+@click.option(
+    '--results-file',
+    show_default=True,
+    default='batch_results.json',
+    help='Path to the JSON file where the status of each record is exported to.',
+    type=click.Path(exists=False, file_okay=True, dir_okay=False),
+)
+@click.option(
+    '--workers',
+    '-w',
+    show_default=True,
+    default=4,
+    help='Number of records that are created or updated in parallel.',
+    type=click.IntRange(min=1)
+)
+@click.option(
+    '--jobs',
+    '-j',
+    show_default=True,
+    default=1,
+    help='Number of files that are uploaded in parallel for each record.',
+    type=click.IntRange(min=1)
+)
+@click.option(
+    '--no-cache',
+    is_flag=True,
+    help='Hash all data files again instead of reusing the checksums of unchanged files from previous runs.'
+)
+def cmd_record_batch(config_file,
+                     manifest,
+                     results_file,
+                     workers,
+                     jobs,
+                     no_cache):
+    """
+    Create or update many records on a BIG-MAP Archive with a single client, as listed in a manifest file.
+    """
+    import requests
+    from pydantic import ValidationError
+
+    from big_map_archive_api_client.client.batch_manifest import BatchManifest
+    from big_map_archive_api_client.client.client_config import ClientConfig
+    from big_map_archive_api_client.utils import (convert_metadata_files,
+                                                  create_directory,
+                                                  export_to_json_file)
+
+    try:
+        base_dir_path = os.getcwd()
+        manifest_file_path = os.path.join(base_dir_path, manifest)
+        batch_manifest = BatchManifest.load_from_manifest_file(manifest_file_path)
+        manifest_dir_path = os.path.dirname(os.path.abspath(manifest_file_path))
+
+        # Check all metadata files before any request is sent (the parsed files are kept for the jobs)
+        convert_metadata_files(manifest_dir_path, [job.metadata_file for job in batch_manifest.jobs])
+
+        output_dir_path = os.path.dirname(results_file)
+        create_directory(base_dir_path, output_dir_path)
+
+        config_file_path = os.path.join(base_dir_path, config_file)
+        client_config = ClientConfig.load_from_config_file(config_file_path)
+        total = len(batch_manifest.jobs)
+
+        def run_job(job):
+            start = time.monotonic()
+            result = job.model_dump()
+
+            try:
+                if job.record_id is None:
+                    record_id = create_record(client, manifest_dir_path, job.metadata_file, job.data_files,
+                                              job.publish, job.slug, jobs, echo=lambda message: None)
+                    result['status'] = 'created'
+                else:
+                    record_id = update_record(client, manifest_dir_path, job.record_id, job.update_only,
+                                              job.metadata_file, job.data_files, job.link_all_files_from_previous,
+                                              job.publish, jobs, echo=lambda message: None)
+                    result['status'] = 'updated'
+
+                published = job.publish or job.update_only
+                result['new_record_id'] = record_id
+                result['url'] = f'https://{client_config.domain_name}/{"records" if published else "uploads"}/{record_id}'
+                result['error'] = None
+            except Exception as e:
+                result['status'] = 'failed'
+                result['new_record_id'] = None
+                result['url'] = None
+                result['error'] = f'{type(e).__name__}: {str(e)}'
+
+            result['seconds'] = round(time.monotonic() - start, 3)
+
+            return result
+
+        # Each record uploads its files with 'jobs' threads; the connection pool is sized for all of them
+        with client_config.create_client(workers * jobs, not no_cache) as client:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(run_job, job): index for index, job in enumerate(batch_manifest.jobs)}
+                results = [None] * total
+
+                for done, future in enumerate(as_completed(futures), start=1):
+                    result = future.result()
+                    results[futures[future]] = result
+                    outcome = result['url'] if result['error'] is None else result['error']
+                    click.echo(f'[{done}/{total}] {result["status"]}: {result["metadata_file"]} ({outcome})')
+
+        failed = sum(result['status'] == 'failed' for result in results)
+        export_to_json_file(base_dir_path, results_file, {
+            'jobs': results,
+            'succeeded': total - failed,
+            'failed': failed
+        })
+
+        click.echo(f'{total - failed} of {total} record(s) were processed. The status of each record was saved in {results_file}.')
+
+        if failed:
+            exit(1)
+    except requests.exceptions.ConnectionError as e:
+        click.echo(f'An error of type ConnectionError occurred. Check the domain name in {config_file}. More info: {str(e)}.')
+    except requests.exceptions.HTTPError as e:
+        click.echo(f'An error of type HTTPError occurred. Check your token in {config_file}. More info: {str(e)}.')
+    except ValidationError as e:
+        click.echo(f'Invalid manifest file {manifest}. More info: {str(e)}.')
+    except Exception as e:
+        click.echo(f'An error occurred. More info: {str(e)}.')
@@ -1,11 +1,82 @@
 """Topmost command line, kept separate to prevent import cycles."""
 
+import importlib
+
 import click
 
+# Groups of commands, imported only when one of their commands runs (or their help is shown)
+SUBCOMMANDS = {
+    'cache': 'cli.cache:cmd_cache',
+    'finales-db': 'cli.finales_db:cmd_finales_db',
+    'record': 'cli.record:cmd_record'
+}
+
+DEFAULT_METRICS_FILES = {
+    'json': 'bma_metrics.json',
+    'prometheus': 'bma_metrics.prom',
+    'ndjson': 'bma_metrics.ndjson'
+}
+
 
-@click.group('bma')
-def cmd_root():
+class LazyGroup(click.Group):
+    """
+    Group whose subcommands are imported on first use, from 'module:attribute' paths
+    This keeps the start-up time of the command line low, as a command only imports the modules that it needs
+    """
+
+    def __init__(self, *args, lazy_subcommands=None, **kwargs):
+        """
+        Initializes internal fields
+        """
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_subcommands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and cmd_name in self.lazy_subcommands:
+            module_name, attribute = self.lazy_subcommands[cmd_name].split(':')
+            command = getattr(importlib.import_module(module_name), attribute)
+            self.add_command(command, cmd_name)
+
+        return super().get_command(ctx, cmd_name)
+
+
+@click.group('bma', cls=LazyGroup, lazy_subcommands=SUBCOMMANDS)
+@click.option(
+    '--metrics',
+    'metrics_format',
+    help='Record the requests sent by the command and save their metrics: a JSON summary, a file in the Prometheus text format (e.g., for the textfile collector of node-exporter) or a trace with one JSON line per request.',
+    type=click.Choice(['json', 'prometheus', 'ndjson'])
+)
+@click.option(
+    '--metrics-file',
+    help='Path to the file where the metrics are saved. By default, bma_metrics.json, bma_metrics.prom or bma_metrics.ndjson.',
+    type=click.Path(exists=False, file_okay=True, dir_okay=False)
+)
+@click.pass_context
+def cmd_root(ctx, metrics_format, metrics_file):
     """
     Command line client to interact with a BIG-MAP Archive. Source code available on GitHub: https://github.com/materialscloud-org/big-map-archive-api-client.
     """
-    pass
\ No newline at end of file
+    if metrics_format is None:
+        return
+
+    from big_map_archive_api_client.client import metrics
+
+    metrics_file = metrics_file or DEFAULT_METRICS_FILES[metrics_format]
+    trace_file = open(metrics_file, 'w') if metrics_format == 'ndjson' else None
+    recorder = metrics.MetricsRecorder(trace_file)
+    metrics.set_recorder(recorder)
+
+    def save_metrics():
+        metrics.set_recorder(None)
+        recorder.close()
+
+        if metrics_format != 'ndjson':
+            recorder.export(metrics_file, metrics_format)
+
+    # Called once the command has completed, including when it exits early
+    ctx.call_on_close(save_metrics)
+
@@ -1,5 +1,22 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from big_map_archive_api_client.utils import export_to_json_file
+from big_map_archive_api_client.utils.json_codec import loads
 from finales_api_client.client.rest_api_connection import \
     FinalesRestAPIConnection
+from finales_api_client.client.token_cache import (EXPIRY_MARGIN,
+                                                   get_token_expiry)
+
+# Files written by download_database_contents(), with the methods that get their contents
+DATABASE_CONTENTS = (
+    ('capabilities.json', 'get_capabilities'),
+    ('requests.json', 'get_all_requests'),
+    ('results_for_requests.json', 'get_results_requested'),
+    ('sqlite.db', 'get_database_file')
+)
 
 
 class FinalesAPIClient:
@@ -7,14 +24,34 @@ class FinalesAPIClient:
     Class to interact with BMA's API
     """
 
-    def __init__(self, ip_address, port, username, password, database_endpoint_access_key):
+    def __init__(self, ip_address, port, username, password, database_endpoint_access_key,
+                 pool_connections=10, pool_maxsize=10, keep_alive=True, retry_policy=None, token_cache=None):
         """
         Initialize internal variables
+        The access token is obtained when first needed, and kept in 'token_cache' (a TokenCache object), if any,
+        until it expires
         """
-        self._connection = FinalesRestAPIConnection(ip_address, port)
+        self._connection = FinalesRestAPIConnection(ip_address, port, pool_connections, pool_maxsize, keep_alive,
+                                                    retry_policy)
         self._username = username
         self._password = password
         self._database_endpoint_access_key = database_endpoint_access_key
+        self._token_cache = token_cache
+        self._token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes the connection pool shared by all requests
+        """
+        self._connection.close()
 
     def post_authenticate(self):
         """
@@ -30,10 +67,63 @@ class FinalesAPIClient:
 
         response = self._connection.post(resource_path=resource_path,
                                          payload=payload,
-                                         content_type='application/x-www-form-urlencoded')
-        return response.json()
+                                         content_type='application/x-www-form-urlencoded',
+                                         idempotent=True)
+        return loads(response.content)
+
+    def get_token(self, rejected_token=None):
+        """
+        Returns an access token: the current one while it is valid, otherwise a token from the token cache or, failing
+        that, a new token from the FINALES server
+        Pass the token that the server rejected as 'rejected_token' to get another one; threads that were rejected
+        with the same token share a single new token
+        Raises an HTTPError exception if the authentication fails
+        """
+        with self._token_lock:
+            if (self._token is not None and self._token != rejected_token
+                    and time.time() < self._token_expires_at - EXPIRY_MARGIN):
+                return self._token
+
+            if rejected_token is not None and self._token_cache is not None:
+                self._token_cache.clear()
+
+            cached = self._token_cache.get() if self._token_cache is not None and rejected_token is None else None
+
+            if cached is not None:
+                token, expires_at = cached
+            else:
+                response = self.post_authenticate()
+                token = response['access_token']
+                expires_at = get_token_expiry(response)
+
+                if self._token_cache is not None:
+                    self._token_cache.set(token, expires_at)
+
+            self._token = token
+            self._token_expires_at = expires_at
+
+            return token
 
-    def get_capabilities(self, token):
+    def _get(self, resource_path, token, query_string='', stream=False):
+        """
+        Sends a GET request with 'token', or with the client's access token if 'token' is None
+        If the server rejects the client's access token (401), e.g., because it was revoked, a new token is obtained
+        and the request is sent again once
+        """
+        if token is not None:
+            return self._connection.get(resource_path, token, query_string=query_string, stream=stream)
+
+        token = self.get_token()
+        response = self._connection.get(resource_path, token, query_string=query_string, stream=stream)
+
+        if response.status_code == 401:
+            response.close()
+            token = self.get_token(rejected_token=token)
+            response = self._connection.get(resource_path, token, query_string=query_string, stream=stream)
+
+        return response
+
+    def get_capabilities(self, token=None):
         """
         Gets all capabilities stored in the FINALES database
         Note that a capability corresponds to a tuple (quantity, method),
@@ -41,21 +131,21 @@ class FinalesAPIClient:
         Raises an HTTPError exception if the request fails
         """
         resource_path = '/capabilities/'
-        response = self._connection.get(resource_path, token, query_string='currently_available=false')
+        response = self._get(resource_path, token, query_string='currently_available=false')
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
-    def get_all_requests(self, token):
+    def get_all_requests(self, token=None):
         """
         Gets all requests stored in the FINALES database
         Raises an HTTPError exception if the request fails
         """
         resource_path = '/all_requests/'
-        response = self._connection.get(resource_path, token)
+        response = self._get(resource_path, token)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
-    def get_results_requested(self, token):
+    def get_results_requested(self, token=None):
         """
         Gets all results associated with requests stored in the FINALES database
         Note that:
@@ -66,11 +156,11 @@ class FinalesAPIClient:
         Raises an HTTPError exception if the request fails
         """
         resource_path = '/results_requested/'
-        response = self._connection.get(resource_path, token)
+        response = self._get(resource_path, token)
         response.raise_for_status()
-        return response.json()
+        return loads(response.content)
 
-    def get_database_file(self, token, stream):
+    def get_database_file(self, token=None, stream=False):
         """
         Downloads a copy of the SQLite database file
         This is done in chunks if stream is set to True
@@ -78,6 +168,44 @@ class FinalesAPIClient:
         """
         access_key = self._database_endpoint_access_key
         resource_path = f'/database_dump/{access_key}'
-        response = self._connection.get(resource_path, token, stream=stream)
+        response = self._get(resource_path, token, stream=stream)
         response.raise_for_status()
         return response
+
+    def download_database_contents(self, dir_path, max_workers=4, chunk_size=1024 ** 2, include_database_file=True,
+                                   filenames=None):
+        """
+        Downloads the capabilities, requests and results for requests (as JSON files) and a copy of the database file
+        into a folder, concurrently over the client's connection pool
+        The database file is streamed to disk in chunks of 'chunk_size' bytes, as it may be large; it is skipped if
+        'include_database_file' is False (e.g., when it is streamed to the archive instead)
+        Only the files in 'filenames' are downloaded, if it is provided (e.g., ['sqlite.db'])
+        Returns the timings of the downloads: a list of {'file', 'seconds', 'bytes'} dictionaries
+        Raises an HTTPError exception if a request fails
+        """
+        def download(filename, method_name):
+            start = time.monotonic()
+            file_path = os.path.join(dir_path, filename)
+
+            if method_name == 'get_database_file':
+                with self.get_database_file(stream=True) as response, open(file_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+            else:
+                export_to_json_file(dir_path, filename, getattr(self, method_name)())
+
+            return {
+                'file': filename,
+                'seconds': round(time.monotonic() - start, 3),
+                'bytes': os.path.getsize(file_path)
+            }
+
+        # Authenticate once, before the downloads start
+        self.get_token()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(download, filename, method_name) for filename, method_name in DATABASE_CONTENTS
+                       if (include_database_file or method_name != 'get_database_file')
+                       and (filenames is None or filename in filenames)]
+
+            return [future.result() for future in futures]
@@ -1,6 +1,8 @@
 from pydantic import BaseModel
 import yaml
+from big_map_archive_api_client.client.retry import RetryPolicy
 from finales_api_client.client.api_client import FinalesAPIClient
+from finales_api_client.client.token_cache import TokenCache
 
 class FinalesClientConfig(BaseModel):
     """Configuration data for Finales API's client."""
@@ -10,6 +12,12 @@ class FinalesClientConfig(BaseModel):
     username: str
     password: str
     database_endpoint_access_key: str
+    pool_connections: int = 10
+    pool_maxsize: int = 10
+    keep_alive: bool = True
+    max_attempts: int = 5
+    backoff_factor: float = 0.5
+    token_cache: bool = True
 
     @classmethod
     def load_from_config_file(cls, file_path):
@@ -28,4 +36,23 @@ class FinalesClientConfig(BaseModel):
         Creates a client to interact with Finales' API
         Initializes internal fields
         """
-        return FinalesAPIClient(self.ip_address, self.port, self.username, self.password, self.database_endpoint_access_key)
\ No newline at end of file
+        return FinalesAPIClient(self.ip_address,
+                                self.port,
+                                self.username,
+                                self.password,
+                                self.database_endpoint_access_key,
+                                self.pool_connections,
+                                self.pool_maxsize,
+                                self.keep_alive,
+                                RetryPolicy(self.max_attempts, self.backoff_factor),
+                                self.create_token_cache())
+
+    def create_token_cache(self):
+        """
+        Creates a cache that keeps the access token between runs, or returns None if it is disabled
+        The token is stored per server and user
+        """
+        if not self.token_cache:
+            return None
+
+        return TokenCache(f'{self.ip_address}:{self.port}\n{self.username}')
\ No newline at end of file
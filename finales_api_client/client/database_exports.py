@@ -0,0 +1,172 @@
+"""
+Exports of the capabilities, requests and results for requests built from a copy of the database of a FINALES server
+
+The queries assume the schema of FINALES2 (tables quantities, requests and results, with JSON stored as text) and
+rebuild the items returned by the endpoints /capabilities/, /all_requests/ and /results_requested/. Exports whose
+tables or columns are missing from the database file are reported by get_unsupported_exports(), so that they can be
+downloaded from the server instead.
+"""
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from big_map_archive_api_client.utils import export_items_to_json_file
+from big_map_archive_api_client.utils.json_codec import loads
+
+
+def _load_json(value):
+    # JSON columns are stored as text; NULL stays None
+    return loads(value) if isinstance(value, (str, bytes)) else value
+
+
+def _format_time(value):
+    # SQLAlchemy stores datetimes as 'YYYY-MM-DD HH:MM:SS.ffffff', the API returns them in ISO 8601
+    return value.replace(' ', 'T', 1) if isinstance(value, str) else value
+
+
+def capability_from_row(row):
+    quantity, method, specifications, result_output = row
+
+    return {
+        'quantity': quantity,
+        'method': method,
+        'json_schema_specifications': _load_json(specifications),
+        'json_schema_result_output': _load_json(result_output)
+    }
+
+
+def request_from_row(row):
+    uuid, ctime, status, quantity, methods, parameters, tenant_uuid = row
+
+    return {
+        'uuid': uuid,
+        'ctime': _format_time(ctime),
+        'status': status,
+        'request': {
+            'quantity': quantity,
+            'methods': _load_json(methods),
+            'parameters': _load_json(parameters),
+            'tenant_uuid': tenant_uuid
+        }
+    }
+
+
+def result_from_row(row):
+    uuid, ctime, status, quantity, method, parameters, data, tenant_uuid, request_uuid = row
+
+    return {
+        'uuid': uuid,
+        'ctime': _format_time(ctime),
+        'status': status,
+        'result': {
+            'data': _load_json(data),
+            'quantity': quantity,
+            'method': method,
+            'parameters': _load_json(parameters),
+            'tenant_uuid': tenant_uuid,
+            'request_uuid': request_uuid
+        }
+    }
+
+
+# Exported file -> (tables and columns read, query, function that turns a row into an item)
+DATABASE_EXPORTS = {
+    'capabilities.json': (
+        {'quantities': ('quantity', 'method', 'specifications', 'result_output')},
+        'SELECT quantity, method, specifications, result_output FROM quantities ORDER BY rowid',
+        capability_from_row
+    ),
+    'requests.json': (
+        {'requests': ('uuid', 'requesting_recieved_timestamp', 'status', 'quantity', 'methods', 'parameters',
+                      'requesting_tenant_uuid')},
+        'SELECT uuid, requesting_recieved_timestamp, status, quantity, methods, parameters, requesting_tenant_uuid '
+        'FROM requests ORDER BY rowid',
+        request_from_row
+    ),
+    'results_for_requests.json': (
+        {'results': ('uuid', 'posting_recieved_timestamp', 'status', 'quantity', 'method', 'parameters', 'data',
+                     'posting_tenant_uuid', 'request_uuid'),
+         'requests': ('uuid',)},
+        'SELECT uuid, posting_recieved_timestamp, status, quantity, method, parameters, data, posting_tenant_uuid, '
+        'request_uuid FROM results WHERE request_uuid IN (SELECT uuid FROM requests) ORDER BY rowid',
+        result_from_row
+    )
+}
+
+
+def connect_read_only(database_file_path):
+    """
+    Opens a database file for reading only; the file is not locked, as it is a copy that does not change
+    """
+    uri = Path(database_file_path).resolve().as_uri() + '?mode=ro&immutable=1'
+    return sqlite3.connect(uri, uri=True)
+
+
+def get_unsupported_exports(database_file_path):
+    """
+    Returns the exports that cannot be built from a database file, with the tables and columns that are missing,
+    e.g., {'capabilities.json': ['quantities.result_output']}
+    Raises an sqlite3.DatabaseError exception if the file is not a SQLite database
+    """
+    connection = connect_read_only(database_file_path)
+
+    try:
+        columns = {}
+        unsupported = {}
+
+        for filename, (tables, _, _) in DATABASE_EXPORTS.items():
+            missing = []
+
+            for table, table_columns in tables.items():
+                if table not in columns:
+                    columns[table] = {row[1] for row in connection.execute(f'PRAGMA table_info("{table}")')}
+
+                if not columns[table]:
+                    missing.append(table)
+                else:
+                    missing += [f'{table}.{column}' for column in table_columns if column not in columns[table]]
+
+            if missing:
+                unsupported[filename] = missing
+
+        return unsupported
+    finally:
+        connection.close()
+
+
+def export_database_contents(database_file_path, dir_path, filenames=None, max_workers=3, batch_size=1000):
+    """
+    Builds the exports (e.g., requests.json) from a database file into a folder, in parallel
+    Each export is read through its own connection and cursor, 'batch_size' rows at a time, and written item by item,
+    so that no export is ever held in memory as a whole
+    Returns the timings of the exports: a list of {'file', 'seconds', 'bytes'} dictionaries
+    """
+    def export(filename):
+        start = time.monotonic()
+        _, query, item_from_row = DATABASE_EXPORTS[filename]
+        connection = connect_read_only(database_file_path)
+
+        def iter_items():
+            cursor = connection.execute(query)
+
+            while rows := cursor.fetchmany(batch_size):
+                for row in rows:
+                    yield item_from_row(row)
+
+        try:
+            export_items_to_json_file(dir_path, filename, iter_items())
+        finally:
+            connection.close()
+
+        return {
+            'file': filename,
+            'seconds': round(time.monotonic() - start, 3),
+            'bytes': os.path.getsize(os.path.join(dir_path, filename))
+        }
+
+    filenames = list(DATABASE_EXPORTS) if filenames is None else filenames
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(export, filenames))
@@ -0,0 +1,314 @@
+import hashlib
+import os
+import re
+import shutil
+from datetime import datetime, timezone
+
+from big_map_archive_api_client.utils import (compute_checksum,
+                                              export_to_json_file,
+                                              get_cache_directory, get_codec,
+                                              open_decompressed)
+from big_map_archive_api_client.utils.json_codec import (dumps,
+                                                         dumps_canonical,
+                                                         iter_items, loads)
+
+from .sqlite_delta import (PageSignature, apply_patch, compute_signature,
+                           get_page_size, write_patch)
+
+# Exports that are backed up as delta files, with the field that identifies their items
+DELTA_EXPORTS = {
+    'requests.json': 'uuid',
+    'results_for_requests.json': 'uuid'
+}
+
+# Database file that is backed up as page-level patches
+DATABASE_FILENAME = 'sqlite.db'
+
+DELTA_FILENAME_PATTERN = re.compile(r'^(?P<name>.+)\.delta_(?P<number>\d{4})\.json$')
+PATCH_FILENAME_PATTERN = re.compile(r'^sqlite\.patch_(?P<number>\d{4})\.(?P<extension>json|bin)$')
+
+
+def get_item_hash(item):
+    """
+    Returns a short hash of an exported item (e.g., a request), which changes whenever any of its fields changes
+    """
+    return hashlib.blake2b(dumps_canonical(item), digest_size=8).hexdigest()
+
+
+def get_item_key(item, key_field):
+    # Items without an id are identified by their contents: a changed item then shows as removed and added
+    key = item.get(key_field) if isinstance(item, dict) else None
+    return str(key) if key is not None else get_item_hash(item)
+
+
+class BackupState:
+    """
+    Local state of the back-ups of a FINALES server to an archive entry: the last version created, the checksums of
+    the files it links, the hashes of the exported items (watermarks), the number of versions since the last full
+    snapshot and the size of the database patches since then
+    The hashes of the pages of the last database file are kept next to the state (see PageSignature)
+    """
+
+    def __init__(self, file_path):
+        """
+        Initializes internal fields from the state file, if it exists
+        """
+        self.file_path = file_path
+
+        try:
+            with open(file_path, 'rb') as f:
+                state = loads(f.read())
+        except (OSError, ValueError):
+            state = {}
+
+        self.record_id = state.get('record_id')
+        self.versions_since_full = state.get('versions_since_full', 0)
+        self.delta_count = state.get('delta_count', 0)
+        self.checksums = state.get('checksums', {})
+        self.item_hashes = state.get('item_hashes', {})
+        self.patch_bytes = state.get('patch_bytes', 0)
+        self.database_size = state.get('database_size', 0)
+        self.updated = state.get('updated')
+        self.signature = PageSignature(f'{os.path.splitext(file_path)[0]}.sig')
+
+    @classmethod
+    def load(cls, finales_address, domain_name, title):
+        """
+        Loads the state of the back-ups of a FINALES server to the entry with the given title on an archive
+        The state is stored in ~/.cache/bma/finales_backups
+        """
+        key = hashlib.sha256(f'{finales_address}\n{domain_name}\n{title}'.encode('utf-8')).hexdigest()[:32]
+
+        return cls(os.path.join(get_cache_directory('finales_backups'), f'{key}.json'))
+
+    def save(self):
+        """
+        Writes the state to its file, atomically
+        """
+        temp_path = f'{self.file_path}.{os.getpid()}.tmp'
+
+        with open(temp_path, 'wb') as f:
+            f.write(dumps({
+                'record_id': self.record_id,
+                'versions_since_full': self.versions_since_full,
+                'delta_count': self.delta_count,
+                'checksums': self.checksums,
+                'item_hashes': self.item_hashes,
+                'patch_bytes': self.patch_bytes,
+                'database_size': self.database_size,
+                'updated': self.updated
+            }))
+
+        os.replace(temp_path, self.file_path)
+
+
+class IncrementalBackup:
+    """
+    Reduces the files of a back-up (in a folder) to what changed since the previous version of the entry
+    - files whose checksum is unchanged are removed from the folder, as their links are imported from the previous version
+    - requests.json and results_for_requests.json are replaced by delta files with the new, changed and removed items
+    - sqlite.db is replaced by a patch with the pages that changed (sqlite.patch_<n>.bin) and its manifest
+      (sqlite.patch_<n>.json)
+    A full snapshot (all files, no delta) is made for the first back-up, when the previous version is not the one in
+    the local state, after every 'full_every' back-ups, once the patches add up to more than 'rebase_ratio' times the
+    size of the database file, and when the page size of the database file changed
+    """
+
+    def __init__(self, state, previous_record_id, full_every=7, rebase_ratio=0.5):
+        """
+        Initializes internal fields
+        """
+        self.state = state
+        self.previous_record_id = previous_record_id
+        self.full = (not previous_record_id or state.record_id != previous_record_id
+                     or state.versions_since_full + 1 >= full_every
+                     or state.patch_bytes > rebase_ratio * state.database_size)
+        self._checksums = {}
+        self._item_hashes = {}
+        self._signature = None
+        self._patch_bytes = 0
+        self._database_size = state.database_size
+
+    def prepare(self, dir_path):
+        """
+        Computes the checksums and item hashes of the files in the folder and, unless a full snapshot is made, removes
+        the unchanged files and writes delta files
+        Returns the names of the files left to upload (an empty list if nothing changed)
+        """
+        filenames = sorted(f for f in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, f)))
+        self._checksums = {filename: compute_checksum(os.path.join(dir_path, filename)) for filename in filenames}
+
+        # A full snapshot that is due is postponed until something changes
+        if self.state.record_id == self.previous_record_id and self._checksums == self.state.checksums:
+            return []
+
+        # Database patches are computed against the signature of the database file of the previous version
+        if DATABASE_FILENAME in self._checksums:
+            page_size = get_page_size(os.path.join(dir_path, DATABASE_FILENAME))
+            signature = self.state.signature
+            self.full = self.full or not (signature.is_usable(page_size)
+                                          and signature.checksum == self.state.checksums.get(DATABASE_FILENAME))
+
+        delta_number = self.state.delta_count + 1
+        uploads = []
+
+        for filename in filenames:
+            file_path = os.path.join(dir_path, filename)
+            checksum = self._checksums[filename]
+
+            if filename in DELTA_EXPORTS:
+                previous_hashes = self.state.item_hashes.get(filename, {})
+                item_hashes = {}
+                changed_items = []
+
+                # The export is decoded item by item: only the changed items are held in memory
+                with open(file_path, 'rb') as f:
+                    for item in iter_items(f, ''):
+                        key = get_item_key(item, DELTA_EXPORTS[filename])
+                        item_hashes[key] = get_item_hash(item)
+
+                        if not self.full and previous_hashes.get(key) != item_hashes[key]:
+                            changed_items.append(item)
+
+                self._item_hashes[filename] = item_hashes
+
+                if not self.full:
+                    os.remove(file_path)
+                    removed_keys = sorted(set(previous_hashes) - set(item_hashes))
+
+                    if changed_items or removed_keys:
+                        delta_filename = f'{filename[:-len(".json")]}.delta_{delta_number:04d}.json'
+                        export_to_json_file(dir_path, delta_filename, {
+                            'previous_version': self.previous_record_id,
+                            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                            'items': changed_items,
+                            'removed': removed_keys
+                        })
+                        uploads.append(delta_filename)
+
+                    continue
+
+            if filename == DATABASE_FILENAME:
+                self._database_size = os.path.getsize(file_path)
+
+                if self.full:
+                    self._signature = (page_size, checksum, compute_signature(file_path, page_size))
+                elif self.state.checksums.get(filename) != checksum:
+                    patch_name = f'sqlite.patch_{delta_number:04d}'
+                    manifest, hashes = write_patch(file_path, self.state.signature,
+                                                   os.path.join(dir_path, f'{patch_name}.bin'))
+                    manifest['previous_version'] = self.previous_record_id
+                    manifest['created'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+                    export_to_json_file(dir_path, f'{patch_name}.json', manifest)
+                    os.remove(file_path)
+                    self._signature = (page_size, checksum, hashes)
+                    self._patch_bytes = os.path.getsize(os.path.join(dir_path, f'{patch_name}.bin'))
+                    uploads += [f'{patch_name}.bin', f'{patch_name}.json']
+                    continue
+
+            if self.full or self.state.checksums.get(filename) != checksum:
+                uploads.append(filename)
+            else:
+                os.remove(file_path)
+
+        return uploads
+
+    def commit(self, record_id, uploads):
+        """
+        Records the version that was created from the prepared files
+        """
+        state = self.state
+        state.record_id = record_id
+        state.checksums = self._checksums
+        state.item_hashes = self._item_hashes
+        state.database_size = self._database_size
+        state.updated = datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+        if self.full:
+            state.versions_since_full = 0
+            state.delta_count = 0
+            state.patch_bytes = 0
+        else:
+            state.versions_since_full += 1
+            state.patch_bytes += self._patch_bytes
+
+            if any('.delta_' in filename or '.patch_' in filename for filename in uploads):
+                state.delta_count += 1
+
+        # If the state is not saved after the signature, the checksums differ and the next back-up is a full snapshot
+        if self._signature is not None:
+            state.signature.save(*self._signature)
+
+        state.save()
+
+
+def restore_backup(dir_path, output_dir_path):
+    """
+    Rebuilds the files of a back-up version from the files it links (downloaded to a folder, possibly compressed):
+    sqlite.db is rebuilt from the last full snapshot and its patches, requests.json and results_for_requests.json from
+    the last full snapshot and their delta files
+    The items changed by delta files are moved to the end of the exports
+    Returns the names of the rebuilt files
+    Raises a ValueError exception if a patch does not apply to the database file
+    """
+    # Name without the compression suffix -> path to the downloaded file
+    paths = {}
+
+    for filename in sorted(os.listdir(dir_path)):
+        codec = get_codec(filename)
+        name = filename[:filename.rindex('.')] if codec else filename
+        paths[name] = os.path.join(dir_path, filename)
+
+    def copy(name):
+        with open_decompressed(paths[name]) as f_in, open(os.path.join(output_dir_path, name), 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 ** 2)
+
+    restored = []
+
+    for name in paths:
+        if not (DELTA_FILENAME_PATTERN.match(name) or PATCH_FILENAME_PATTERN.match(name)):
+            copy(name)
+            restored.append(name)
+
+    # Patches are applied in order, each one to the result of the previous one
+    patch_names = sorted(name for name in paths
+                         if (match := PATCH_FILENAME_PATTERN.match(name)) and match.group('extension') == 'json')
+
+    if patch_names and DATABASE_FILENAME not in paths:
+        raise ValueError(f'{DATABASE_FILENAME} is missing: patches cannot be applied')
+
+    for name in patch_names:
+        with open_decompressed(paths[name]) as f:
+            manifest = loads(f.read())
+
+        with open_decompressed(paths[f'{name[:-len(".json")]}.bin']) as patch_file:
+            apply_patch(os.path.join(output_dir_path, DATABASE_FILENAME), patch_file, manifest)
+
+    for export_name, key_field in DELTA_EXPORTS.items():
+        delta_names = sorted(name for name in paths
+                             if (match := DELTA_FILENAME_PATTERN.match(name))
+                             and f'{match.group("name")}.json' == export_name)
+
+        if not delta_names:
+            continue
+
+        file_path = os.path.join(output_dir_path, export_name)
+
+        with open(file_path, 'rb') as f:
+            items = {get_item_key(item, key_field): item for item in iter_items(f, '')}
+
+        for name in delta_names:
+            with open_decompressed(paths[name]) as f:
+                delta = loads(f.read())
+
+            for item in delta['items']:
+                key = get_item_key(item, key_field)
+                items.pop(key, None)
+                items[key] = item
+
+            for key in delta['removed']:
+                items.pop(key, None)
+
+        export_to_json_file(output_dir_path, export_name, list(items.values()))
+
+    return restored
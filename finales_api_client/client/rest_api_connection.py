@@ -1,17 +1,83 @@
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from big_map_archive_api_client.client.retry import AdaptiveLimiter, RetryPolicy
 
 
 class FinalesRestAPIConnection:
     """Internal auxiliary class that handles the base connection."""
-    def __init__(self, ip_address, port):
+    def __init__(self, ip_address, port, pool_connections=10, pool_maxsize=10, keep_alive=True, retry_policy=None):
         """
         Initializes internal fields
+        A single connection pool is shared by all threads; each thread gets its own session mounted on that pool
+        Requests that fail with a transient error are resent according to 'retry_policy' (by default, RetryPolicy())
         """
         self._base_url = f'https://{ip_address}:{port}'
 
-    def post(self, resource_path, token=None, payload=None, content_type='application/json'):
+        self._keep_alive = keep_alive
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        # Requests in flight are limited to the pool size, and to less while the server signals overload
+        self._limiter = AdaptiveLimiter(pool_maxsize)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def session(self):
+        """
+        Returns the calling thread's session, which reuses connections (and thus TLS sessions) from the shared pool
+        """
+        session = getattr(self._local, 'session', None)
+
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+
+            if not self._keep_alive:
+                session.headers['Connection'] = 'close'
+
+            with self._lock:
+                self._sessions.append(session)
+
+            self._local.session = session
+
+        return session
+
+    def close(self):
+        """
+        Closes all sessions and the underlying connection pool
+        """
+        with self._lock:
+            sessions = self._sessions
+            self._sessions = []
+
+        for session in sessions:
+            session.close()
+
+        self._adapter.close()
+        self._local = threading.local()
+
+    def _request(self, method, url, idempotent=None, **kwargs):
+        """
+        Sends a request through the calling thread's session and returns a response
+        The request is resent if it fails with a transient error; see RetryPolicy for the requests that are never resent
+        """
+        return self._retry_policy.send(self.session.request, method, url, self._limiter, idempotent, **kwargs)
+
+    def post(self, resource_path, token=None, payload=None, content_type='application/json', idempotent=False):
         """
         Sends a POST request and returns a response
+        Set 'idempotent' to True if sending the request twice has the same effect as sending it once, so that it can be resent
         """
         url = self._base_url + resource_path
 
@@ -30,7 +96,7 @@ class FinalesRestAPIConnection:
 
         kwargs['headers'] = request_headers
 
-        response = requests.post(url, **kwargs)
+        response = self._request('POST', url, idempotent, **kwargs)
         return response
 
     def get(self, resource_path, token, query_string='', payload=None, stream=False):
@@ -52,5 +118,5 @@ class FinalesRestAPIConnection:
         if payload is not None:
             kwargs['data'] = payload
 
-        response = requests.get(url, **kwargs)
+        response = self._request('GET', url, **kwargs)
         return response
@@ -0,0 +1,157 @@
+import hashlib
+import os
+
+from big_map_archive_api_client.utils import compute_checksum
+from big_map_archive_api_client.utils.json_codec import dumps, loads
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+# Size of the blocks compared in files that are not SQLite databases (in bytes)
+DEFAULT_PAGE_SIZE = 4096
+
+# Size of the hash of each page in a signature file (in bytes)
+PAGE_HASH_SIZE = 16
+
+
+def get_page_size(file_path):
+    """
+    Returns the page size of a SQLite database, read from its header, or DEFAULT_PAGE_SIZE for any other file
+    """
+    with open(file_path, 'rb') as f:
+        header = f.read(18)
+
+    if len(header) < 18 or not header.startswith(SQLITE_HEADER):
+        return DEFAULT_PAGE_SIZE
+
+    page_size = int.from_bytes(header[16:18], 'big')
+
+    # The value 1 stands for 65536
+    return 65536 if page_size == 1 else page_size
+
+
+def iter_pages(file_path, page_size):
+    """
+    Yields the pages of a file (the last one may be shorter)
+    """
+    with open(file_path, 'rb') as f:
+        while page := f.read(page_size):
+            yield page
+
+
+def get_page_hash(page):
+    return hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+
+
+def compute_signature(file_path, page_size):
+    """
+    Returns the signature of a file: the concatenated hashes of its pages
+    """
+    return b''.join(get_page_hash(page) for page in iter_pages(file_path, page_size))
+
+
+class PageSignature:
+    """
+    Local signature of the database file of the last back-up: its page size, its checksum and the hashes of its pages
+    Stored next to the state of the back-ups, in a JSON file (page size, checksum) and a binary file (hashes)
+    """
+
+    def __init__(self, file_path):
+        """
+        Initializes internal fields from the signature files, if they exist
+        @param file_path: path to the binary file, e.g., ~/.cache/bma/finales_backups/<key>.sig
+        """
+        self.file_path = file_path
+
+        try:
+            with open(f'{file_path}.json', 'rb') as f:
+                header = loads(f.read())
+
+            with open(file_path, 'rb') as f:
+                hashes = f.read()
+        except (OSError, ValueError):
+            header, hashes = {}, b''
+
+        self.page_size = header.get('page_size')
+        self.checksum = header.get('checksum')
+        self.hashes = hashes
+
+    @property
+    def page_count(self):
+        return len(self.hashes) // PAGE_HASH_SIZE
+
+    def is_usable(self, page_size):
+        """
+        Returns True if the signature can be compared with a database file with the given page size
+        """
+        return self.page_size == page_size and self.checksum is not None
+
+    def save(self, page_size, checksum, hashes):
+        """
+        Replaces the signature with that of a new database file, atomically
+        """
+        for path, data in ((self.file_path, hashes),
+                           (f'{self.file_path}.json', dumps({'page_size': page_size, 'checksum': checksum}))):
+            temp_path = f'{path}.{os.getpid()}.tmp'
+
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+
+            os.replace(temp_path, path)
+
+        self.page_size, self.checksum, self.hashes = page_size, checksum, hashes
+
+
+def write_patch(file_path, signature, patch_file_path):
+    """
+    Writes the pages of a database file that differ from a signature to a patch file, in increasing order
+    Returns the manifest of the patch (page size, page count, changed pages, checksums before and after) and the
+    hashes of the pages of the file
+    """
+    page_size = signature.page_size
+    pages = []
+    hashes = []
+
+    with open(patch_file_path, 'wb') as patch:
+        for number, page in enumerate(iter_pages(file_path, page_size)):
+            page_hash = get_page_hash(page)
+            hashes.append(page_hash)
+
+            if signature.hashes[number * PAGE_HASH_SIZE:(number + 1) * PAGE_HASH_SIZE] != page_hash:
+                pages.append(number)
+                patch.write(page)
+
+    manifest = {
+        'page_size': page_size,
+        'size': os.path.getsize(file_path),
+        'pages': pages,
+        'previous_checksum': signature.checksum,
+        'checksum': compute_checksum(file_path),
+        'patch_checksum': compute_checksum(patch_file_path)
+    }
+
+    return manifest, b''.join(hashes)
+
+
+def apply_patch(file_path, patch_file, manifest):
+    """
+    Applies a patch to a copy of the database file it was computed from
+    @param patch_file: file object open for reading, positioned at the start of the patch
+    Raises a ValueError exception if the file is not the one the patch was computed from, or if the result differs
+    """
+    if compute_checksum(file_path) != manifest['previous_checksum']:
+        raise ValueError(f'{os.path.basename(file_path)} is not the version the patch was computed from')
+
+    page_size = manifest['page_size']
+    size = manifest['size']
+
+    with open(file_path, 'r+b') as f:
+        for number in manifest['pages']:
+            # The last page of the file may be shorter
+            page = patch_file.read(min(page_size, size - number * page_size))
+            f.seek(number * page_size)
+            f.write(page)
+
+        f.truncate(size)
+
+    if compute_checksum(file_path) != manifest['checksum']:
+        raise ValueError(f'{os.path.basename(file_path)} differs from the backed-up version after applying the patch')
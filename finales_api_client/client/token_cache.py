@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import os
+import time
+
+from big_map_archive_api_client.utils import get_cache_directory
+from big_map_archive_api_client.utils.json_codec import dumps, loads
+
+# Lifetime assumed for a token whose expiry is unknown (in seconds)
+DEFAULT_TOKEN_LIFETIME = 600
+
+# A token is renewed this many seconds before it expires, so that it does not expire while requests are in flight
+EXPIRY_MARGIN = 30
+
+
+def get_token_expiry(token_response, default_lifetime=DEFAULT_TOKEN_LIFETIME):
+    """
+    Returns the time (in seconds since the epoch) at which the token of an authentication response expires
+    Uses 'expires_in' if the server sends it, otherwise the 'exp' claim of the token if it is a JWT
+    """
+    now = time.time()
+
+    if 'expires_in' in token_response:
+        return now + float(token_response['expires_in'])
+
+    try:
+        payload = token_response['access_token'].split('.')[1]
+        claims = loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return now + default_lifetime
+
+
+class TokenCache:
+    """
+    On-disk cache of the access token of a FINALES user, so that the token is reused by later runs until it expires
+    The file is only readable by the current user
+    """
+
+    def __init__(self, key, dir_path=None):
+        """
+        Initializes internal fields
+        By default, tokens are stored in ~/.cache/bma/finales_tokens, in a file named after a hash of 'key'
+        @param key: identifies the server and the user, e.g., '<ip address>:<port>\n<username>'
+        """
+        if dir_path is None:
+            dir_path = get_cache_directory('finales_tokens')
+
+        self.file_path = os.path.join(dir_path, hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '.json')
+
+    def get(self):
+        """
+        Returns the cached token and the time at which it expires, or None if there is none or it expires soon
+        """
+        try:
+            with open(self.file_path, 'rb') as f:
+                entry = loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+        if 'access_token' not in entry or entry.get('expires_at', 0) - EXPIRY_MARGIN <= time.time():
+            return None
+
+        return entry['access_token'], entry['expires_at']
+
+    def set(self, token, expires_at):
+        """
+        Stores a token and the time at which it expires (in seconds since the epoch)
+        The file is replaced atomically
+        """
+        temp_path = f'{self.file_path}.{os.getpid()}.tmp'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dumps({'access_token': token, 'expires_at': expires_at}))
+
+        os.replace(temp_path, self.file_path)
+
+    def clear(self):
+        """
+        Removes the cached token, e.g., after the server rejected it
+        """
+        try:
+            os.remove(self.file_path)
+        except FileNotFoundError:
+            pass
@@ -17,8 +17,12 @@ setup(
     long_description_content_type = "text/markdown",
     url = 'https://github.com/materialscloud-org/big-map-archive-api-client',
     py_modules = ['cli', 'big_map_archive_api_client', 'finales_api_client'],
-    packages = find_packages(),
+    packages = find_packages(exclude=['benchmarks', 'benchmarks.*']),
     install_requires = [requirements],
+    extras_require = {
+        'async': ['httpx'],
+        'speedups': ['orjson', 'ijson'],
+    },
     entry_points = '''
         [console_scripts]
         bma=cli:cmd_root
@@ -0,0 +1,92 @@
+import httpx
+import pytest
+import requests
+
+from big_map_archive_api_client.client.api_client import ArchiveAPIClient
+from big_map_archive_api_client.client.async_api_client import AsyncArchiveAPIClient
+from big_map_archive_api_client.utils.json_codec import dumps
+
+DOMAIN_NAME = 'archive.example.org'
+
+
+class FakeConnection:
+    """
+    Stand-in for RestAPIConnection that answers GET requests from a mapping of URLs to JSON bodies and records the
+    requested URLs
+    """
+
+    def __init__(self, base_url, bodies):
+        self.base_url = base_url
+        self.bodies = bodies
+        self.urls = []
+
+    def get(self, resource_path, token):
+        url = resource_path if resource_path.startswith('https://') else self.base_url + resource_path
+        self.urls.append(url)
+        return build_response(200, self.bodies[url])
+
+    def close(self):
+        pass
+
+
+def build_response(status_code=200, body=None, headers=None):
+    """
+    Returns a response with a JSON body (an empty object by default)
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = dumps(body if body is not None else {})
+    response.headers.update(headers or {})
+    return response
+
+
+@pytest.fixture
+def base_url():
+    """
+    Returns the URL of the archive used by the clients of the tests
+    """
+    return f'https://{DOMAIN_NAME}'
+
+
+@pytest.fixture
+def make_response():
+    """
+    Returns a function that creates responses: make_response(status_code=200, body=None, headers=None)
+    """
+    return build_response
+
+
+@pytest.fixture
+def make_client(base_url):
+    """
+    Returns a function that creates an ArchiveAPIClient whose requests are handled by 'connection' (by default, a
+    FakeConnection answering from 'bodies'); the requested URLs are recorded in 'client.urls'
+    """
+    def make_client(bodies=None, connection=None, **kwargs):
+        client = ArchiveAPIClient(DOMAIN_NAME, 443, 'token', **kwargs)
+        client._connection = connection if connection is not None else FakeConnection(base_url, bodies or {})
+        client.urls = getattr(client._connection, 'urls', None)
+        return client
+
+    return make_client
+
+
+@pytest.fixture
+def make_async_client():
+    """
+    Returns a function that creates an AsyncArchiveAPIClient whose requests are answered from a mapping of URLs to
+    JSON bodies; the requested URLs are recorded in 'client.urls'
+    """
+    def make_async_client(bodies):
+        client = AsyncArchiveAPIClient(DOMAIN_NAME, 443, 'token')
+        client.urls = []
+
+        def handler(request):
+            url = str(request.url)
+            client.urls.append(url)
+            return httpx.Response(200, content=dumps(bodies[url]))
+
+        client._connection._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return client
+
+    return make_async_client
@@ -0,0 +1,71 @@
+import asyncio
+
+from big_map_archive_api_client.utils import compute_checksum
+
+
+def make_record(record_id, title, is_published=True):
+    return {'id': record_id, 'is_published': is_published, 'metadata': {'title': title}}
+
+
+def test_iter_user_records_follows_next_links(make_async_client, base_url):
+    # Like InvenioRDM, the 'next' links are absolute URLs
+    first_page = base_url + '/api/user/records?allversions=False&size=2&page=1'
+    second_page = base_url + '/api/user/records?allversions=False&size=2&page=2'
+    third_page = base_url + '/api/user/records?allversions=False&size=2&page=3'
+    client = make_async_client({
+        first_page: {'hits': {'hits': [make_record('a', 'A'), make_record('b', 'B')]}, 'links': {'next': second_page}},
+        second_page: {'hits': {'hits': [make_record('c', 'C'), make_record('d', 'D', False)]},
+                      'links': {'next': third_page}},
+        third_page: {'hits': {'hits': [make_record('e', 'E')]}, 'links': {}}
+    })
+
+    async def collect():
+        return [record['id'] async for record in client.iter_user_records(False, page_size=2)]
+
+    assert asyncio.run(collect()) == ['a', 'b', 'c', 'd', 'e']
+    assert client.urls == [first_page, second_page, third_page]
+
+
+def test_get_latest_versions_reads_every_page(make_async_client, base_url):
+    first_page = base_url + '/api/user/records?allversions=False&size=100&page=1'
+    second_page = base_url + '/api/user/records?allversions=False&size=100&page=2'
+    client = make_async_client({
+        first_page: {'hits': {'hits': [make_record('a', 'A')]}, 'links': {'next': second_page}},
+        second_page: {'hits': {'hits': [make_record('b', 'B', False)]}, 'links': {}}
+    })
+
+    assert asyncio.run(client.get_latest_versions()) == [{'id': 'a', 'is_published': True},
+                                                        {'id': 'b', 'is_published': False}]
+
+
+def test_sync_plan_methods(tmp_path, make_async_client, base_url):
+    upload_dir_path = tmp_path / 'data'
+    upload_dir_path.mkdir()
+
+    for name, content in (('unchanged.txt', b'same'), ('changed.txt', b'new'), ('new.txt', b'added')):
+        (upload_dir_path / name).write_bytes(content)
+
+    client = make_async_client({
+        base_url + '/api/records/abcde-12345/draft/files': {'entries': [
+            {'key': 'unchanged.txt', 'checksum': compute_checksum(str(upload_dir_path / 'unchanged.txt'))},
+            {'key': 'changed.txt', 'checksum': 'md5:00000000000000000000000000000000'},
+            {'key': 'missing.txt', 'checksum': 'md5:00000000000000000000000000000000'}
+        ]}
+    })
+
+    async def run():
+        return (await client.get_missing_files('abcde-12345', str(tmp_path), 'data'),
+                await client.get_changed_content_files('abcde-12345', str(tmp_path), 'data'),
+                await client.get_links_to_delete('abcde-12345', str(tmp_path), 'data', False),
+                await client.get_links_to_delete('abcde-12345', str(tmp_path), 'data', True),
+                sorted(await client.get_files_to_upload('abcde-12345', str(tmp_path), 'data')))
+
+    missing, changed, delete, delete_keeping_previous, upload = asyncio.run(run())
+
+    assert missing == ['changed.txt', 'missing.txt']
+    assert changed == ['changed.txt']
+    assert delete == ['changed.txt', 'missing.txt']
+    assert delete_keeping_previous == ['changed.txt']
+    assert upload == ['changed.txt', 'new.txt']
+    # Only the local files with the same name as a linked file were hashed
+    assert (client.checksum_engine.stats.files, client.checksum_engine.stats.size) == (2, len(b'same') + len(b'new'))
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from big_map_archive_api_client.utils.http_cache import HTTPCache, get_modified_prefixes
+
+
+@pytest.fixture
+def cache(tmp_path, make_response, base_url):
+    cache = HTTPCache(str(tmp_path), ttls={'/api/communities': 3600, '/api/records': 3600, '/api/user/records': 3600})
+
+    for path in ('/api/communities?q=slug:bigmap', '/api/records/abcde-12345', '/api/records/abcde-12345/draft',
+                 '/api/records/fghij-67890', '/api/records?allversions=false&size=10&page=1',
+                 '/api/user/records?allversions=false&size=10&page=1'):
+        cache.set(base_url + path, 'token', make_response(headers={'ETag': '"1"'}))
+
+    with cache:
+        yield cache
+
+
+def fresh_paths(cache, base_url):
+    return sorted(url[len(base_url):] for url, expires in cache._connection.execute('SELECT url, expires FROM responses')
+                  if expires > time.time())
+
+
+def test_write_expires_the_modified_record_and_searches_only(cache, base_url):
+    cache.expire(get_modified_prefixes(base_url + '/api/records/abcde-12345/draft/actions/publish'))
+
+    assert fresh_paths(cache, base_url) == ['/api/communities?q=slug:bigmap', '/api/records/fghij-67890']
+
+
+def test_content_uploads_expire_nothing(cache, base_url):
+    for path in ('/api/records/abcde-12345/draft/files/a.bin/content',
+                 '/api/records/abcde-12345/draft/files/a.bin/content/3'):
+        assert get_modified_prefixes(base_url + path) == []
+        cache.expire(get_modified_prefixes(base_url + path))
+
+    assert len(fresh_paths(cache, base_url)) == 6
+
+
+def test_new_record_expires_searches(cache, base_url):
+    cache.expire(get_modified_prefixes(base_url + '/api/records'))
+
+    assert fresh_paths(cache, base_url) == ['/api/communities?q=slug:bigmap', '/api/records/abcde-12345',
+                                            '/api/records/abcde-12345/draft', '/api/records/fghij-67890']
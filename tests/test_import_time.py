@@ -0,0 +1,17 @@
+import statistics
+
+import pytest
+
+from benchmarks.import_time import HEAVY_MODULES, SNIPPETS, get_import_times
+
+# Milliseconds allowed for the imports of each snippet, as checked by 'python -m benchmarks.import_time'
+BUDGET = 60
+
+
+@pytest.mark.parametrize('label', list(SNIPPETS))
+def test_command_line_imports_within_budget(label):
+    runs = [get_import_times(SNIPPETS[label]) for _ in range(3)]
+    imported_heavy_modules = [name for name in HEAVY_MODULES if any(name in import_times for import_times, _ in runs)]
+
+    assert imported_heavy_modules == []
+    assert statistics.median(total for _, total in runs) / 1000 <= BUDGET
@@ -0,0 +1,96 @@
+import io
+import json
+import math
+import textwrap
+
+import pytest
+
+from big_map_archive_api_client.utils import (export_hits_to_json_file, export_items_to_json_file,
+                                              export_to_json_file, json_codec)
+
+orjson = pytest.importorskip('orjson')
+
+VALUES = [
+    {'small': 1e-05, 'large': 1e16, 'negative': -2.5e-300, 'plain': 0.1},
+    {'nan': float('nan'), 'inf': float('inf')},
+    {'big': 2 ** 70, 'negative_big': -(2 ** 80), 'u64': 2 ** 64 - 1},
+    [{'b': 1, 'a': [1.5e-7, 'é', None]}],
+    {'text': 'Müller – 😀 "quoted" \\ \x7f\x00\n', 'e': [True, False, 1.0, -0.0, 'e'], 'empty': [{}, []]}
+]
+
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def backend(request, monkeypatch):
+    monkeypatch.setattr(json_codec, 'orjson', orjson if request.param == 'orjson' else None)
+    return request.param
+
+
+def encode_with(backend_name, monkeypatch, function, value):
+    monkeypatch.setattr(json_codec, 'orjson', orjson if backend_name == 'orjson' else None)
+    return function(value)
+
+
+@pytest.mark.parametrize('value', VALUES)
+@pytest.mark.parametrize('function', [json_codec.dumps_pretty, json_codec.dumps_canonical])
+def test_exports_do_not_depend_on_backend(value, function, monkeypatch):
+    assert encode_with('orjson', monkeypatch, function, value) == encode_with('stdlib', monkeypatch, function, value)
+
+
+@pytest.mark.parametrize('value', [value for value in VALUES if 'nan' not in value])
+def test_dumps_encodes_any_value(value, backend):
+    # Payloads may be formatted differently (orjson encodes NaN as null), but must decode to the same values
+    decoded = json_codec.loads(json_codec.dumps(value))
+    assert json_codec.dumps_canonical(decoded) == json_codec.dumps_canonical(value)
+
+
+@pytest.mark.parametrize('document', [
+    b'{"small": 1e-05, "large": 1e+16, "big": 1180591620717411303424}',
+    b'[NaN, Infinity, -Infinity, 1e400]',
+    '{"text": "é", "id": 123456789012345678901234567890}'
+])
+def test_loads_does_not_depend_on_backend(document, monkeypatch):
+    monkeypatch.setattr(json_codec, 'orjson', orjson)
+    with_orjson = json_codec.loads(document)
+    monkeypatch.setattr(json_codec, 'orjson', None)
+    with_stdlib = json_codec.loads(document)
+
+    assert json_codec.dumps_canonical(with_orjson) == json_codec.dumps_canonical(with_stdlib)
+
+
+def test_big_integers_stay_integers(backend):
+    assert json_codec.loads(b'[1180591620717411303424]') == [2 ** 70]
+    assert math.isnan(json_codec.loads(b'[NaN]')[0])
+
+
+@pytest.mark.parametrize('value', VALUES)
+@pytest.mark.parametrize('level', [0, 1, 3])
+def test_dumps_pretty_matches_baseline_format(value, level, backend):
+    expected = textwrap.indent(json.dumps(value, indent=4, sort_keys=True), '    ' * level)
+    assert json_codec.dumps_pretty(value, level) == expected.encode('ascii')
+
+
+@pytest.mark.parametrize('level', [1, 3])
+def test_dumps_pretty_items_matches_dumps_pretty(level, backend):
+    assert json_codec.dumps_pretty_items(VALUES, level) == b',\n'.join(json_codec.dumps_pretty(value, level)
+                                                                       for value in VALUES)
+    assert json_codec.dumps_pretty_items([], level) == b''
+
+
+def test_iter_items_decodes_values_rejected_by_ijson():
+    document = b'[{"id": 1}, {"id": 2, "value": NaN}, {"id": 123456789012345678901234567890}]'
+    items = list(json_codec.iter_items(io.BytesIO(document), ''))
+
+    assert [item['id'] for item in items] == [1, 2, 123456789012345678901234567890]
+    assert math.isnan(items[1]['value'])
+
+
+@pytest.mark.parametrize('count', [0, 1, 250])
+def test_streaming_exports_match_export_to_json_file(tmp_path, count, backend):
+    hits = [{'id': i, 'metadata': VALUES[i % len(VALUES)]} for i in range(count)]
+    export_to_json_file(str(tmp_path), 'expected_hits.json', {'hits': {'hits': hits, 'total': count}})
+    export_hits_to_json_file(str(tmp_path), 'hits.json', count, iter(hits))
+    export_to_json_file(str(tmp_path), 'expected_items.json', hits)
+    export_items_to_json_file(str(tmp_path), 'items.json', iter(hits))
+
+    assert (tmp_path / 'hits.json').read_bytes() == (tmp_path / 'expected_hits.json').read_bytes()
+    assert (tmp_path / 'items.json').read_bytes() == (tmp_path / 'expected_items.json').read_bytes()
@@ -0,0 +1,25 @@
+import io
+import json
+
+from big_map_archive_api_client.client.metrics import MetricsRecorder, get_endpoint
+
+SECRET = 's3cr3tKey'
+
+
+def test_get_endpoint():
+    assert get_endpoint('https://archive.example.org/api/records/abcde-12345/draft/files/data.csv/content?x=1') == \
+        '/api/records/{id}/draft/files/{filename}/content'
+    assert get_endpoint(f'http://127.0.0.1:13371/database_dump/{SECRET}') == '/database_dump/{key}'
+
+
+def test_secret_path_segments_are_not_recorded():
+    trace_file = io.StringIO()
+    recorder = MetricsRecorder(trace_file)
+    recorder.record('GET', f'http://127.0.0.1:13371/database_dump/{SECRET}', 200, 0.5, 0, 1024, 1)
+    recorder.record('GET', f'http://127.0.0.1:13371/database_dump/{SECRET}/', None, 0.1, 0, 0, 2, 'ConnectionError')
+
+    outputs = [trace_file.getvalue(), json.dumps(recorder.get_summary()), recorder.get_prometheus_text()]
+
+    for output in outputs:
+        assert SECRET not in output
+        assert '/database_dump/{key}' in output
@@ -0,0 +1,176 @@
+import json
+
+import pytest
+import requests
+
+from big_map_archive_api_client.client.api_client import ChecksumMismatchError, MultipartNotSupportedError
+from big_map_archive_api_client.utils import compute_checksum
+
+RECORD_ID = 'abcde-12345'
+FILES_PATH = f'/api/records/{RECORD_ID}/draft/files'
+PART_SIZE = 4
+
+
+class FakeArchive:
+    """
+    Draft files endpoints of the archive, recording the requests; 'post_error' is the body of the 400 response to the
+    initiation of a multipart transfer, if any
+    Committed files get 'checksum'; if 'resend_commit' is True, the commit is answered as if it was resent after its
+    response was lost
+    """
+
+    def __init__(self, make_response, entries=None, post_error=None, checksum=None, resend_commit=False):
+        self.make_response = make_response
+        self.entries = dict(entries or {})
+        self.post_error = post_error
+        self.checksum = checksum
+        self.resend_commit = resend_commit
+        self.requests = []
+
+    def get(self, resource_path, token):
+        self.requests.append(('GET', resource_path))
+        key = resource_path[len(FILES_PATH) + 1:]
+
+        if key not in self.entries:
+            return self.make_response(404, {'status': 404, 'message': 'Not found.'})
+
+        return self.make_response(200, self.entries[key])
+
+    def post(self, resource_path, token, payload=None, idempotent=False):
+        self.requests.append(('POST', resource_path))
+
+        if resource_path.endswith('/commit'):
+            entry = self.entries[resource_path[len(FILES_PATH) + 1:-len('/commit')]]
+
+            if entry['status'] == 'completed':
+                return self.make_response(400, {'status': 400, 'message': 'File is not in pending state.'})
+
+            entry.update(status='completed', checksum=self.checksum)
+
+            if self.resend_commit:
+                return self.post(resource_path, token, payload, idempotent)
+
+            return self.make_response(200, entry)
+
+        item, = json.loads(payload)
+
+        if self.post_error is not None:
+            return self.make_response(400, self.post_error)
+
+        if item['key'] in self.entries:
+            return self.make_response(400, {'status': 400, 'message': f'File with key {item["key"]} already exists.'})
+
+        parts = item['transfer']['parts']
+        self.entries[item['key']] = make_entry(item['key'], item['size'], parts)
+
+        return self.make_response(201, {'entries': [self.entries[item['key']]]})
+
+    def put(self, resource_path, token, payload=None, content_type='application/json'):
+        self.requests.append(('PUT', resource_path))
+        return self.make_response(200)
+
+    def delete(self, resource_path, token):
+        self.requests.append(('DELETE', resource_path))
+        del self.entries[resource_path[len(FILES_PATH) + 1:]]
+        return self.make_response(204)
+
+    def close(self):
+        pass
+
+
+def make_entry(key, size, parts, status='pending'):
+    return {
+        'key': key,
+        'size': size,
+        'status': status,
+        'links': {'parts': [{'part': part, 'url': f'{FILES_PATH}/{key}/content/{part}'} for part in range(1, parts + 1)]}
+    }
+
+
+@pytest.fixture
+def make_archive(make_response):
+    def make_archive(entries=None, **kwargs):
+        return FakeArchive(make_response, entries, **kwargs)
+
+    return make_archive
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'data' / 'large.bin').write_bytes(b'0123456789')
+
+    return tmp_path
+
+
+@pytest.fixture
+def upload(upload_dir, make_client):
+    def upload(archive):
+        client = make_client(connection=archive, multipart_part_size=PART_SIZE)
+        client.upload_file_multipart(RECORD_ID, str(upload_dir), 'data', 'large.bin')
+
+    return upload
+
+
+def test_upload_creates_link(upload, make_archive):
+    archive = make_archive()
+    upload(archive)
+
+    assert ('DELETE', f'{FILES_PATH}/large.bin') not in archive.requests
+    assert [path for method, path in archive.requests if method == 'PUT'] == [
+        f'{FILES_PATH}/large.bin/content/{part}' for part in (1, 2, 3)]
+
+
+def test_upload_reuses_pending_link_without_checkpoint(upload, make_archive):
+    archive = make_archive({'large.bin': make_entry('large.bin', 10, 3)})
+    upload(archive)
+
+    assert ('DELETE', f'{FILES_PATH}/large.bin') not in archive.requests
+    assert len([method for method, _ in archive.requests if method == 'PUT']) == 3
+    assert archive.requests[-1] == ('POST', f'{FILES_PATH}/large.bin/commit')
+
+
+@pytest.mark.parametrize('entry', [make_entry('large.bin', 10, 3, 'completed'), make_entry('large.bin', 8, 2)])
+def test_upload_replaces_other_link(entry, upload, make_archive):
+    archive = make_archive({'large.bin': entry})
+    upload(archive)
+
+    assert ('DELETE', f'{FILES_PATH}/large.bin') in archive.requests
+    assert len(archive.entries['large.bin']['links']['parts']) == 3
+    assert archive.requests[-1] == ('POST', f'{FILES_PATH}/large.bin/commit')
+
+
+def test_upload_raises_not_supported_when_transfer_rejected(upload, make_archive):
+    archive = make_archive(post_error={'status': 400, 'message': 'A validation error occurred.',
+                                      'errors': [{'field': '0.transfer.type', 'messages': ['Invalid transfer type.']}]})
+
+    with pytest.raises(MultipartNotSupportedError):
+        upload(archive)
+
+
+def test_upload_raises_http_error_for_other_rejections(upload, make_archive):
+    archive = make_archive(post_error={'status': 400, 'message': 'Draft is locked.'})
+
+    with pytest.raises(requests.exceptions.HTTPError) as exc_info:
+        upload(archive)
+
+    assert not isinstance(exc_info.value, MultipartNotSupportedError)
+
+
+def test_upload_verifies_checksum(upload, make_archive, upload_dir):
+    archive = make_archive(checksum=compute_checksum(str(upload_dir / 'data' / 'large.bin')))
+    upload(archive)
+
+    archive = make_archive(checksum='md5:00000000000000000000000000000000')
+
+    with pytest.raises(ChecksumMismatchError):
+        upload(archive)
+
+
+def test_upload_accepts_resent_commit_of_completed_file(upload, make_archive, upload_dir):
+    archive = make_archive(checksum=compute_checksum(str(upload_dir / 'data' / 'large.bin')), resend_commit=True)
+    upload(archive)
+
+    assert archive.requests[-1] == ('GET', f'{FILES_PATH}/large.bin')
+    assert archive.entries['large.bin']['status'] == 'completed'
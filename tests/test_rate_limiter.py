@@ -0,0 +1,103 @@
+import io
+
+import pytest
+import requests
+
+from big_map_archive_api_client.client import rate_limiter as rate_limiter_module
+from big_map_archive_api_client.client.rate_limiter import RateLimiter, ThrottledReader
+from big_map_archive_api_client.client.rest_api_connection import RestAPIConnection
+
+BYTES_PER_SECOND = 100_000
+SIZE = 1_000_000
+
+
+class FakeClock:
+    """
+    Replaces time.time() and time.sleep() in the rate limiter, so that waits take no time
+    """
+
+    def __init__(self):
+        self.now = 1_000_000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limiter_module, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def rate_limiter(tmp_path):
+    return RateLimiter(str(tmp_path / 'state.json'), requests_per_second=10, bytes_per_second=BYTES_PER_SECOND)
+
+
+def test_file_body_is_throttled_while_it_is_read(clock, rate_limiter):
+    reader = ThrottledReader(io.BytesIO(b'x' * SIZE), rate_limiter)
+    assert len(reader) == SIZE
+
+    # The burst (a second of budget) is read without waiting
+    for _ in range(BYTES_PER_SECOND // 10_000):
+        reader.read(10_000)
+
+    assert clock.sleeps == []
+
+    while reader.read(10_000):
+        pass
+
+    assert clock.now - 1_000_000.0 == pytest.approx((SIZE - BYTES_PER_SECOND) / BYTES_PER_SECOND, abs=0.2)
+    # Waits are spread over the transfer instead of one wait before it
+    assert max(clock.sleeps) <= 0.2
+
+
+def test_chunks_are_throttled_while_they_are_yielded(clock, rate_limiter):
+    chunks = (b'x' * 10_000 for _ in range(SIZE // 10_000))
+
+    assert sum(len(chunk) for chunk in rate_limiter.throttle(chunks)) == SIZE
+    assert clock.now - 1_000_000.0 == pytest.approx((SIZE - BYTES_PER_SECOND) / BYTES_PER_SECOND, abs=0.2)
+
+
+def test_small_request_updates_the_state_once(clock, rate_limiter, monkeypatch):
+    updates = []
+    update = rate_limiter._update
+    monkeypatch.setattr(rate_limiter, '_update', lambda *args: updates.append(args) or update(*args))
+
+    rate_limiter.acquire(500)
+    rate_limiter.consume(1000)
+
+    assert updates == [(1, rate_limiter.quantum)]
+
+
+class FakeSession:
+    """
+    Session that reads the request body and answers with a body of the same size
+    """
+
+    def request(self, method, url, data=None, stream=False, **kwargs):
+        body = b''
+
+        while chunk := data.read(8192):
+            body += chunk
+
+        response = requests.Response()
+        response.status_code = 200
+        response.raw = io.BytesIO(body)
+        return response
+
+
+def test_upload_and_download_are_throttled(clock, rate_limiter):
+    connection = RestAPIConnection('archive.example.org', 443, rate_limiter=rate_limiter)
+    connection._local.session = FakeSession()
+
+    response = connection._send('PUT', 'https://archive.example.org/api/files', data=io.BytesIO(b'x' * SIZE))
+
+    assert response.content == b'x' * SIZE
+    assert clock.now - 1_000_000.0 == pytest.approx((2 * SIZE - BYTES_PER_SECOND) / BYTES_PER_SECOND, abs=0.2)
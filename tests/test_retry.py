@@ -0,0 +1,47 @@
+import threading
+
+from big_map_archive_api_client.client.retry import AdaptiveLimiter, RetryPolicy
+
+
+def test_concurrent_overloads_halve_the_limit_once(make_response):
+    limiter = AdaptiveLimiter(16)
+    policy = RetryPolicy(max_attempts=1)
+    in_flight = threading.Barrier(8)
+
+    def send(method, url, **kwargs):
+        # All requests are in flight when the server answers 429 to each of them
+        in_flight.wait(timeout=5)
+        return make_response(429)
+
+    threads = [threading.Thread(target=policy.send, args=(send, 'PUT', 'https://archive/api/files', limiter))
+               for _ in range(8)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert limiter.limit == 8
+
+
+def test_overload_after_a_decrease_halves_the_limit_again():
+    limiter = AdaptiveLimiter(16)
+
+    first = limiter.acquire()
+    limiter.release()
+    limiter.decrease(first)
+    limiter.decrease(first)
+    assert limiter.limit == 8
+
+    second = limiter.acquire()
+    limiter.release()
+    limiter.decrease(second)
+    assert limiter.limit == 4
+
+
+def test_decrease_without_generation_always_halves():
+    limiter = AdaptiveLimiter(16)
+    limiter.decrease()
+    limiter.decrease()
+    assert limiter.limit == 4
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from big_map_archive_api_client.client.api_client import MAX_RESULT_WINDOW, SearchWindowError
+
+FIRST_PAGE_PATH = '/api/records?allversions=False&size=100&page=1'
+SECOND_PAGE_PATH = '/api/records?allversions=False&size=100&page=2'
+
+
+def make_pages(base_url, total):
+    page = {'hits': {'hits': [{'id': 'a'}], 'total': total}, 'links': {'next': base_url + SECOND_PAGE_PATH}}
+    return {base_url + FIRST_PAGE_PATH: page, base_url + SECOND_PAGE_PATH: page}
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_search_beyond_result_window_is_rejected_before_paging(prefetch, make_client, base_url):
+    client = make_client(make_pages(base_url, MAX_RESULT_WINDOW + 1))
+
+    with pytest.raises(SearchWindowError):
+        next(client.get_records_pages(False, prefetch=prefetch))
+
+    assert client.urls == [base_url + FIRST_PAGE_PATH]
+
+
+def test_search_within_result_window_is_paged(make_client, base_url):
+    client = make_client(make_pages(base_url, MAX_RESULT_WINDOW))
+    pages = client.get_records_pages(False, prefetch=False)
+
+    next(pages)
+    next(pages)
+
+    assert client.urls == [base_url + FIRST_PAGE_PATH, base_url + SECOND_PAGE_PATH]
+
+
+def test_async_search_beyond_result_window_is_rejected(make_async_client, base_url):
+    client = make_async_client(make_pages(base_url, MAX_RESULT_WINDOW + 1))
+
+    async def collect():
+        return [page async for page in client.get_records_pages(False)]
+
+    with pytest.raises(SearchWindowError):
+        asyncio.run(collect())
+
+    assert client.urls == [base_url + FIRST_PAGE_PATH]